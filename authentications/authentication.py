@@ -1,11 +1,36 @@
 # auth_app/authentication.py
+import time
+
+from rest_framework import authentication
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
+from rest_framework_simplejwt import authentication as jwt_authentication
 from .models import APIKey, MFADevice
+from dbopt.metrics import AUTH_LATENCY
 from django.utils.translation import gettext_lazy as _
 import pyotp
 
 
+class TimedAuthentication:
+    """Reports each authenticate() call to the auth_backend_duration_seconds histogram."""
+
+    backend_name = None
+
+    def authenticate(self, request):
+        start = time.perf_counter()
+        outcome = "skipped"
+        try:
+            result = super().authenticate(request)
+            if result is not None:
+                outcome = "authenticated"
+            return result
+        except exceptions.APIException:
+            outcome = "failed"
+            raise
+        finally:
+            AUTH_LATENCY.observe(time.perf_counter() - start, backend=self.backend_name, outcome=outcome)
+
+
 class MultiAuthBackend(BaseAuthentication):
     def authenticate(self, request):
         api_key = request.META.get("HTTP_X_API_KEY")
@@ -35,3 +60,20 @@ class MultiAuthBackend(BaseAuthentication):
             if totp.verify(code, valid_window=1):
                 return False
         return True
+
+
+# Timed variants of every backend in REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].
+class TimedMultiAuthBackend(TimedAuthentication, MultiAuthBackend):
+    backend_name = "api_key"
+
+
+class JWTAuthentication(TimedAuthentication, jwt_authentication.JWTAuthentication):
+    backend_name = "jwt"
+
+
+class SessionAuthentication(TimedAuthentication, authentication.SessionAuthentication):
+    backend_name = "session"
+
+
+class TokenAuthentication(TimedAuthentication, authentication.TokenAuthentication):
+    backend_name = "token"
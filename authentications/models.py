@@ -14,7 +14,7 @@ class APIKeyManager(models.Manager):
         return instance, raw
 
     def verify_key(self, raw_key):
-        for instance in self.filter(revoked=False):
+        for instance in self.select_related("user").filter(revoked=False):
             if check_password(raw_key, instance.key_hash):
                 return instance
         return None
@@ -1,3 +1,139 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dbopt.metrics import THROTTLE_REQUESTS
+from dbopt.testing import QueryBudgetMixin
+from main.throttle import TokenBuckets
+from projectmgmt.models import Client, ClientMembership, User
+from .models import APIKey
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class QueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """Authentication routes must cost the same whether there are a few users and keys or many."""
+
+    GROW = 5
+    BUDGETS = {
+        "token_obtain_pair": 1,
+        "token_refresh": 1,
+        "test-auth (jwt)": 1,
+        # Key lookup, last-used stamp, MFA device check.
+        "test-auth (api key)": 3,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="alice", password="secret")
+        self.key = APIKey.objects.create_key(self.user)[1]
+        self.api = APIClient()
+        self.serial = 0
+
+    def grow(self):
+        for _ in range(self.GROW):
+            self.serial += 1
+            user = User.objects.create_user(username=f"user-{self.serial}", password="secret")
+            APIKey.objects.create_key(user)
+
+    def post(self, path, data):
+        response = self.api.post(path, data, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def get(self, path, **headers):
+        response = self.api.get(path, **headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def tokens(self):
+        return self.post("/auth/api/token/", {"username": "alice", "password": "secret"}).json()
+
+    def test_every_route_has_a_budget(self):
+        from .urls import urlpatterns
+        budgeted = {name.split(" ")[0] for name in self.BUDGETS}
+        self.assertEqual({pattern.name for pattern in urlpatterns} - budgeted, set())
+
+    def test_token_obtain(self):
+        self.assertQueryBudget("token_obtain_pair", self.tokens, self.BUDGETS["token_obtain_pair"], grow=self.grow)
+
+    def test_token_refresh(self):
+        refresh = self.tokens()["refresh"]
+        self.assertQueryBudget(
+            "token_refresh",
+            lambda: self.post("/auth/api/token/refresh/", {"refresh": refresh}),
+            self.BUDGETS["token_refresh"], grow=self.grow,
+        )
+
+    def test_jwt_request(self):
+        access = self.tokens()["access"]
+        self.assertQueryBudget(
+            "test-auth (jwt)",
+            lambda: self.get("/auth/api/test-auth/", HTTP_AUTHORIZATION=f"Bearer {access}"),
+            self.BUDGETS["test-auth (jwt)"], grow=self.grow,
+        )
+
+    def test_api_key_request(self):
+        self.assertQueryBudget(
+            "test-auth (api key)",
+            lambda: self.get("/auth/api/test-auth/", HTTP_X_API_KEY=self.key),
+            self.BUDGETS["test-auth (api key)"], grow=self.grow,
+        )
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={"api_key": "3/min", "user": "10/min", "address": "2/min", "client": "6/min"},
+    THROTTLE_ROUTE_COSTS={"clients-detail": 3},
+)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        self.user = User.objects.create_user(username="alice", password="secret")
+        self.key = APIKey.objects.create_key(self.user)[1]
+
+    def test_unverified_keys_throttled_by_address_before_hashing(self):
+        for guess in ("guess-1", "guess-2"):
+            self.assertEqual(self.api.get("/auth/api/test-auth/", HTTP_X_API_KEY=guess).status_code, 403)
+        before = THROTTLE_REQUESTS.values.get(("test-auth", "address", "throttled"), 0)
+        # A fresh made-up key is still charged to the address.
+        with self.assertNumQueries(0), mock.patch("authentications.models.check_password") as check:
+            response = self.api.get("/auth/api/test-auth/", HTTP_X_API_KEY="guess-3")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+        check.assert_not_called()
+        self.assertEqual(THROTTLE_REQUESTS.values[("test-auth", "address", "throttled")], before + 1)
+        # From another address the first request of a real key goes through, and then has its own bucket.
+        other = {"REMOTE_ADDR": "10.0.0.2", "HTTP_X_API_KEY": self.key}
+        self.assertEqual([self.api.get("/auth/api/test-auth/", **other).status_code for _ in range(5)],
+                         [200, 200, 200, 200, 429])
+
+    def test_client_bucket_is_charged_by_its_served_callers_only(self):
+        tenant = Client.objects.create(name="acme", slug="acme")
+        bob, mallory = (User.objects.create_user(username=name, password="secret") for name in ("bob", "mallory"))
+        for user in (self.user, bob):
+            ClientMembership.objects.create(user=user, client=tenant, role="member")
+        url = f"/api/clients/{tenant.pk}/"
+        # Not a member: refused by the view, never charged to the client.
+        self.assertEqual([self.get(url, mallory).status_code for _ in range(3)], [404, 404, 404])
+        # alice's first request makes her known to the client, the next two use up its six tokens.
+        self.assertEqual([self.get(url, self.user).status_code for _ in range(3)], [200, 200, 200])
+        self.assertEqual(self.get(url, bob).status_code, 200)
+        response = self.get(url, bob)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def get(self, url, user):
+        return self.api.get(url, HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_spend_is_shared_through_the_cache(self):
+        first, second = (TokenBuckets({"user": "4/min"}, cache, sync_interval=0) for _ in range(2))
+        self.assertIsNone(first.take(["user:1"], 3))
+        scope, wait = second.take(["user:1"], 2)
+        self.assertEqual(scope, "user")
+        self.assertAlmostEqual(wait, 15, delta=1)
+        self.assertIsNone(second.take(["user:1"], 1))
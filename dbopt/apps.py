@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class DboptConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dbopt'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .slow_queries import install
+        from . import stats  # noqa: F401 - connects the rollup receivers
+
+        connection_created.connect(install, dispatch_uid='dbopt_slow_query_log')
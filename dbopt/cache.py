@@ -0,0 +1,324 @@
+"""
+Cache helpers.
+
+`get_or_compute` fills an entry with single-flight locking and serves stale
+values while one caller recomputes. `InstrumentedCache` is a backend wrapper
+that counts hits and misses into dbopt.metrics:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'dbopt.cache.InstrumentedCache',
+            'LOCATION': 'default',          # the `cache` label in /metrics
+            'OPTIONS': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        },
+    }
+
+Remaining OPTIONS, TIMEOUT and KEY_PREFIX go to the wrapped backend, which
+also builds the keys, so switching the wrapper on or off keeps existing entries.
+OPTIONS 'LABEL' overrides the /metrics label when LOCATION is a server URL.
+
+`TwoTierCache` is an InstrumentedCache that keeps a small LRU of recently read
+values in each process (L1) in front of the shared backend (L2):
+
+    'OPTIONS': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'L1_MAX_ENTRIES': 1000,   # LRU size per process
+        'L1_TIMEOUT': 5,          # no L1 copy is served once it is older than this
+        'STAMP_INTERVAL': 1,      # how often each process looks for other processes' writes
+        'STAMP_SLOTS': 16,
+    }
+
+Writes go to L2 and then bump one of STAMP_SLOTS version stamps kept in L2
+(chosen by key hash). Every STAMP_INTERVAL seconds a process reads all stamps
+with one get_many and drops its L1 entries in slots that moved, so another
+process's write is seen within STAMP_INTERVAL and no L1 copy outlives
+L1_TIMEOUT. A process's own writes update its L1 at once. add() and incr()
+results are not copied into L1, since locks and counters want L2's answer.
+"""
+import pickle
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .metrics import CACHE_REQUESTS, CACHE_TIER_REQUESTS
+
+_missing = object()
+
+
+def get_or_compute(key, compute, fresh, stale=0, lock_timeout=30, wait=2.0, cache=None):
+    """
+    Return the value cached under `key`, computing it with `compute()` when needed.
+
+    Values are fresh for `fresh` seconds and may then be served for another
+    `stale` seconds. Only the caller holding `<key>:lock` (a cache.add, so it
+    is atomic on shared backends) recomputes; everyone else gets the stale
+    value at once, or polls for up to `wait` seconds when there is none and
+    then computes anyway rather than fail.
+    """
+    cache = cache or default_cache
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry["fresh_until"] > now:
+        return entry["value"]
+
+    lock_key, token = f"{key}:lock", uuid.uuid4().hex
+    if not cache.add(lock_key, token, lock_timeout):
+        if entry is not None:
+            return entry["value"]
+        deadline = now + wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry["value"]
+
+    try:
+        value = compute()
+        cache.set(key, {"value": value, "fresh_until": time.time() + fresh}, fresh + stale)
+        return value
+    finally:
+        # Only release our own lock; it may have expired and been taken by someone else.
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+class InstrumentedCache(BaseCache):
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        backend = options.pop('BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+        self.label = options.pop('LABEL', None) or location or 'default'
+        self.configure(options)
+        super().__init__({key: value for key, value in params.items() if key != 'OPTIONS'})
+        self.cache = import_string(backend)(location, {**params, 'OPTIONS': options})
+
+    def configure(self, options):
+        """Take this wrapper's own settings out of OPTIONS before they reach the wrapped backend."""
+
+    def count(self, hits, misses):
+        if hits:
+            CACHE_REQUESTS.inc(hits, cache=self.label, result='hit')
+        if misses:
+            CACHE_REQUESTS.inc(misses, cache=self.label, result='miss')
+
+    def get(self, key, default=None, version=None):
+        value = self.cache.get(key, _missing, version=version)
+        self.count(value is not _missing, value is _missing)
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.cache.get_many(keys, version=version)
+        self.count(len(found), len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        return self.cache.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.cache.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.cache.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        return self.cache.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.cache.delete_many(keys, version=version)
+
+    def clear(self):
+        self.cache.clear()
+
+    def close(self, **kwargs):
+        self.cache.close(**kwargs)
+
+
+class TwoTierCache(InstrumentedCache):
+    def configure(self, options):
+        self.l1_max_entries = options.pop('L1_MAX_ENTRIES', 1000)
+        self.l1_timeout = options.pop('L1_TIMEOUT', 5)
+        self.stamp_interval = options.pop('STAMP_INTERVAL', 1)
+        self.stamp_slots = options.pop('STAMP_SLOTS', 16)
+        self.lock = threading.Lock()
+        self.l1 = OrderedDict()  # (key, version) -> (pickled value, expires at, slot)
+        self.stamps = None
+        self.next_stamp_check = 0.0
+
+    def slot(self, key):
+        return zlib.crc32(str(key).encode()) % self.stamp_slots
+
+    def stamp_key(self, slot):
+        return f"two_tier_stamp_{slot}"
+
+    def check_stamps(self, now):
+        """Drop L1 entries of every slot another process has written to since the last check."""
+        if now < self.next_stamp_check:
+            return
+        self.next_stamp_check = now + self.stamp_interval
+        keys = [self.stamp_key(slot) for slot in range(self.stamp_slots)]
+        found = self.cache.get_many(keys)
+        stamps = [found.get(key) for key in keys]
+        with self.lock:
+            if self.stamps is None:
+                self.l1.clear()
+            else:
+                moved = {slot for slot, (old, new) in enumerate(zip(self.stamps, stamps)) if old != new}
+                for l1_key in [k for k, entry in self.l1.items() if entry[2] in moved]:
+                    del self.l1[l1_key]
+            self.stamps = stamps
+
+    def bump(self, keys):
+        for slot in {self.slot(key) for key in keys}:
+            try:
+                stamp = self.cache.incr(self.stamp_key(slot))
+            except ValueError:
+                self.cache.add(self.stamp_key(slot), time.time_ns(), None)
+                continue
+            with self.lock:
+                # Nobody else wrote to the slot since we last looked: our own write needn't empty it.
+                if self.stamps is not None and self.stamps[slot] == stamp - 1:
+                    self.stamps[slot] = stamp
+
+    def remember(self, key, version, value, timeout=DEFAULT_TIMEOUT):
+        lifetime = self.l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            lifetime = min(lifetime, timeout)
+        if lifetime <= 0:
+            return self.forget([key], version)
+        entry = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.monotonic() + lifetime, self.slot(key))
+        with self.lock:
+            self.l1[key, version] = entry
+            self.l1.move_to_end((key, version))
+            while len(self.l1) > self.l1_max_entries:
+                self.l1.popitem(last=False)
+
+    def forget(self, keys, version):
+        with self.lock:
+            for key in keys:
+                self.l1.pop((key, version), None)
+
+    def local_get(self, key, version, now):
+        with self.lock:
+            entry = self.l1.get((key, version))
+            if entry is None:
+                return _missing
+            if entry[1] <= now:
+                del self.l1[key, version]
+                return _missing
+            self.l1.move_to_end((key, version))
+        return pickle.loads(entry[0])
+
+    def count_tier(self, tier, hits, misses):
+        if hits:
+            CACHE_TIER_REQUESTS.inc(hits, cache=self.label, tier=tier, result='hit')
+        if misses:
+            CACHE_TIER_REQUESTS.inc(misses, cache=self.label, tier=tier, result='miss')
+
+    def get(self, key, default=None, version=None):
+        now = time.monotonic()
+        self.check_stamps(now)
+        value = self.local_get(key, version, now)
+        if value is not _missing:
+            self.count_tier('l1', 1, 0)
+            self.count(1, 0)
+            return value
+        value = self.cache.get(key, _missing, version=version)
+        self.count_tier('l1', 0, 1)
+        self.count_tier('l2', value is not _missing, value is _missing)
+        self.count(value is not _missing, value is _missing)
+        if value is _missing:
+            return default
+        self.remember(key, version, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        now = time.monotonic()
+        self.check_stamps(now)
+        found, remote = {}, []
+        for key in keys:
+            value = self.local_get(key, version, now)
+            if value is _missing:
+                remote.append(key)
+            else:
+                found[key] = value
+        fetched = self.cache.get_many(remote, version=version) if remote else {}
+        for key, value in fetched.items():
+            self.remember(key, version, value)
+        found.update(fetched)
+        self.count_tier('l1', len(found) - len(fetched), len(remote))
+        self.count_tier('l2', len(fetched), len(remote) - len(fetched))
+        self.count(len(found), len(remote) - len(fetched))
+        return found
+
+    def has_key(self, key, version=None):
+        now = time.monotonic()
+        self.check_stamps(now)
+        return self.local_get(key, version, now) is not _missing or self.cache.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.cache.add(key, value, timeout, version=version)
+        if added:
+            self.forget([key], version)
+            self.bump([key])
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.cache.set(key, value, timeout, version=version)
+        self.bump([key])
+        self.remember(key, version, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.cache.set_many(data, timeout, version=version)
+        self.bump(data)
+        for key, value in data.items():
+            if key in failed:
+                self.forget([key], version)
+            else:
+                self.remember(key, version, value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.forget([key], version)
+        return self.cache.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.cache.incr(key, delta, version=version)
+        self.forget([key], version)
+        self.bump([key])
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self.cache.delete(key, version=version)
+        self.forget([key], version)
+        self.bump([key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.cache.delete_many(keys, version=version)
+        self.forget(keys, version)
+        self.bump(keys)
+
+    def clear(self):
+        self.cache.clear()
+        with self.lock:
+            self.l1.clear()
+            # The stamps went with the rest of L2; other processes see every slot move.
+            self.stamps = None
+        self.next_stamp_check = 0.0
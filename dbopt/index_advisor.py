@@ -0,0 +1,253 @@
+"""
+Index advisor.
+
+Works from the indexes that actually exist (database introspection, so the
+raw-SQL indexes created by migrations count too) and reports:
+
+- duplicates: two indexes on the same columns;
+- redundant prefixes: an index whose columns lead a longer index, which
+  serves the same lookups;
+- missing composites: statements in slow_queries.log whose plan scanned or
+  sorted a table because no index leads with the columns they filter on
+  (equality columns first, then one range or the ORDER BY columns).
+
+Every suggested drop says where the index is defined, how to remove it and
+what it costs: one more b-tree to maintain on every INSERT and DELETE of the
+table (and on UPDATEs of its columns), plus its size on disk.
+"""
+import json
+import re
+from collections import Counter, defaultdict
+
+from django.db import DatabaseError
+
+_WHERE = re.compile(
+    r"\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|\bHAVING\b|$)", re.IGNORECASE | re.DOTALL
+)
+_ORDER_BY = re.compile(r"\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|$)", re.IGNORECASE | re.DOTALL)
+_PREDICATE = re.compile(r'"(\w+)"\."(\w+)"\s*(=|IN\b|IS NULL\b|<=|>=|<|>|BETWEEN\b)', re.IGNORECASE)
+_COLUMN = re.compile(r'"(\w+)"\."(\w+)"')
+_SCANNED = re.compile(r"^(?:SCAN|Seq Scan on) (\w+)", re.IGNORECASE)
+_SORTED = re.compile(r"USE TEMP B-TREE FOR ORDER BY|\bSort\b", re.IGNORECASE)
+
+
+def index_source(connection, model, name, columns, unique):
+    """Where an index comes from, which decides how to drop it."""
+    if name == "__primary__":
+        return "primary key"
+    for index in model._meta.indexes:
+        if index.name == name:
+            return f"{model.__name__}.Meta.indexes"
+    for constraint in model._meta.constraints:
+        if constraint.name == name:
+            return f"{model.__name__}.Meta.constraints"
+    if len(columns) == 1:
+        for field in model._meta.local_concrete_fields:
+            if field.column != columns[0]:
+                continue
+            if unique and field.unique:
+                return f"{model.__name__}.{field.name} (unique=True)"
+            generated = connection.schema_editor()._create_index_name(model._meta.db_table, [field.column])
+            if field.db_index and name == generated:
+                return f"{model.__name__}.{field.name} (db_index)"
+    return "raw SQL"
+
+
+def introspect(connection, models):
+    """{table: [index, ...]} for the tables of `models` that exist, each index a dict."""
+    tables = {}
+    with connection.cursor() as cursor:
+        existing = set(connection.introspection.table_names(cursor))
+        for model in models:
+            table = model._meta.db_table
+            if table not in existing or table in tables:
+                continue
+            indexes = []
+            for name, info in connection.introspection.get_constraints(cursor, table).items():
+                columns = tuple(info["columns"] or ())
+                if not columns or not (info["index"] or info["unique"] or info["primary_key"]):
+                    continue
+                unique = bool(info["unique"] or info["primary_key"])
+                indexes.append({
+                    "table": table,
+                    "name": name,
+                    "columns": columns,
+                    "orders": tuple(info.get("orders") or ()),
+                    "unique": unique,
+                    "primary_key": bool(info["primary_key"]),
+                    "source": index_source(connection, model, name, columns, unique),
+                })
+            tables[table] = indexes
+    return tables
+
+
+def _keep_rank(index):
+    """Lower sorts first and is dropped first: raw SQL before model-declared, plain before unique."""
+    declared = index["source"] != "raw SQL"
+    return (index["primary_key"], index["unique"], declared, len(index["columns"]), index["name"])
+
+
+def _leads(short, long):
+    """True when `long` can serve every lookup `short` can."""
+    n = len(short["columns"])
+    if long["columns"][:n] != short["columns"]:
+        return False
+    if n == 1 or not short["orders"] or not long["orders"]:
+        return True  # a single column b-tree is read in either direction
+    return long["orders"][:n] == short["orders"]
+
+
+def redundant_indexes(indexes):
+    """[(index, kept index, 'duplicate' or 'prefix')] for indexes another one makes unnecessary."""
+    def better(other, index):
+        return other is not index and _leads(index, other) and (
+            len(other["columns"]) > len(index["columns"]) or _keep_rank(other) > _keep_rank(index)
+        )
+
+    dropped = set()
+    for index in sorted(indexes, key=_keep_rank):
+        # Unique indexes enforce a constraint and are never suggested.
+        if not index["unique"] and any(better(o, index) for o in indexes if o["name"] not in dropped):
+            dropped.add(index["name"])
+
+    found = []
+    for index in sorted(indexes, key=lambda index: index["name"]):
+        if index["name"] not in dropped:
+            continue
+        # Leadership is transitive, so some kept index always covers a dropped one.
+        kept = max(
+            (o for o in indexes if o["name"] not in dropped and _leads(index, o)),
+            key=lambda o: (len(o["columns"]) == len(index["columns"]), _keep_rank(o)),
+        )
+        found.append((index, kept, "duplicate" if len(kept["columns"]) == len(index["columns"]) else "prefix"))
+    return found
+
+
+def drop_instruction(index):
+    source = index["source"]
+    if source == "raw SQL":
+        columns = [
+            f"-{column}" if order == "DESC" else column
+            for column, order in zip(index["columns"], index["orders"] or ["ASC"] * len(index["columns"]))
+        ]
+        return f"DropIndexConcurrently({index['name']!r}, {index['table']!r}, {columns!r})"
+    if source.endswith("(db_index)"):
+        return f"set db_index=False on {source.split(' ')[0]}"
+    return f"remove it from {source}"
+
+
+def index_size(connection, name):
+    """Bytes on disk, where the backend can tell."""
+    queries = {
+        "sqlite": "SELECT SUM(pgsize) FROM dbstat WHERE name = %s",
+        "postgresql": "SELECT pg_relation_size(%s::regclass)",
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(queries[connection.vendor], [name])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def read_log(path):
+    """(sql, plan lines, occurrences) for every SELECT in a slow query log."""
+    entries = []
+    try:
+        handle = open(path)
+    except OSError:
+        return entries
+    with handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            sql = entry.get("sql") or ""
+            if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                entries.append((sql, entry.get("plan") or [], 1 + (entry.get("suppressed") or 0)))
+    return entries
+
+
+def access_patterns(sql):
+    """{table: (equality columns, range columns, order columns)} referenced by one statement."""
+    patterns = defaultdict(lambda: ([], [], []))
+    where = _WHERE.search(sql)
+    for table, column, op in _PREDICATE.findall(where.group(1) if where else ""):
+        bucket = patterns[table][0 if op.upper() in ("=", "IN", "IS NULL") else 1]
+        if column not in bucket:
+            bucket.append(column)
+    order = _ORDER_BY.search(sql)
+    for table, column in _COLUMN.findall(order.group(1) if order else ""):
+        if column not in patterns[table][2]:
+            patterns[table][2].append(column)
+    return patterns
+
+
+def _covered(columns, equality, indexes):
+    n = len(equality)
+    for index in indexes:
+        if set(index["columns"][:n]) == set(equality) and index["columns"][n:len(columns)] == columns[n:]:
+            return True
+    return False
+
+
+def missing_indexes(entries, tables):
+    """[(table, columns, occurrences, example sql)] for composite indexes the logged plans lacked."""
+    wanted, examples = Counter(), {}
+    for sql, plan, occurrences in entries:
+        scanned = {match.group(1) for match in map(_SCANNED.match, plan) if match}
+        sorted_ = any(_SORTED.search(line) for line in plan)
+        for table, (equality, ranges, order) in access_patterns(sql).items():
+            if table not in tables:
+                continue
+            tail = ranges[:1] or order
+            columns = tuple((equality + [c for c in tail if c not in equality])[:3])
+            if not columns:
+                continue
+            # Only act on evidence: the plan scanned this table, or sorted rows it could have read in order.
+            if plan and table not in scanned and not (sorted_ and order and not ranges):
+                continue
+            if _covered(columns, equality, tables[table]):
+                continue
+            wanted[table, columns] += occurrences
+            examples.setdefault((table, columns), sql)
+    return [(table, columns, n, examples[table, columns]) for (table, columns), n in wanted.most_common()]
+
+
+def advise(connection, models, log_path=None):
+    tables = introspect(connection, models)
+    drops = []
+    for table, indexes in sorted(tables.items()):
+        btrees = 1 + sum(1 for index in indexes if index["name"] != "__primary__")
+        for index, kept, kind in redundant_indexes(indexes):
+            drops.append({
+                "table": table,
+                "index": index["name"],
+                "columns": list(index["columns"]),
+                "kind": kind,
+                "kept": kept["name"],
+                "kept_columns": list(kept["columns"]),
+                "source": index["source"],
+                "how": drop_instruction(index),
+                "size_bytes": index_size(connection, index["name"]),
+                "btrees_per_write": btrees,
+            })
+    missing = [
+        {"table": table, "columns": list(columns), "statements": count, "example": sql}
+        for table, columns, count, sql in missing_indexes(read_log(log_path) if log_path else [], tables)
+    ]
+
+    savings = {}
+    for drop in drops:
+        table = savings.setdefault(
+            drop["table"], {"btrees_per_write": drop["btrees_per_write"], "dropped": 0, "bytes": 0}
+        )
+        table["dropped"] += 1
+        table["bytes"] += drop["size_bytes"] or 0
+    for table in savings.values():
+        table["write_reduction_pct"] = round(table["dropped"] / table["btrees_per_write"] * 100, 1)
+    return {"redundant": drops, "missing": missing, "write_savings": savings}
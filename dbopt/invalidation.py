@@ -0,0 +1,119 @@
+"""
+Dashboard cache invalidation by generation counter.
+
+Every client has a generation number in the cache and dashboard keys embed
+it, so a write only bumps the number: old entries stop being read and expire
+on their own. Writers name clients through the client_id/project_id columns
+they already hold (a project's client is looked up once and cached), and the
+bump happens when the transaction commits, once per client however many rows
+changed. Bumped dashboards of busy clients are then refilled by dbopt.warmer.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from . import warmer
+
+# Set while a queryset bulk operation handles invalidation itself, so per-row signals stay quiet.
+_suppressed = ContextVar("dashboard_invalidation_suppressed", default=False)
+
+
+def generation_key(client_id):
+    return f"dashboard_gen_{client_id}"
+
+
+def project_client_key(project_id):
+    return f"dbopt_project_client_{project_id}"
+
+
+def current_generation(client_id):
+    key = generation_key(client_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock so a counter lost to eviction never returns to a value old entries used.
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump(client_ids):
+    for client_id in client_ids:
+        try:
+            cache.incr(generation_key(client_id))
+        except ValueError:
+            cache.add(generation_key(client_id), time.time_ns(), None)
+    warmer.schedule(client_ids)
+
+
+def remember_project_clients(mapping):
+    cache.set_many({project_client_key(pk): client_id for pk, client_id in mapping.items()}, None)
+
+
+def forget_project_clients(project_ids, using="default"):
+    """Drop cached project -> client entries now and again on commit, when the old client stops being read."""
+    keys = [project_client_key(pk) for pk in project_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def project_client_ids(project_ids, using="default"):
+    """{project_id: client_id} from the cache, with one query for any projects not seen yet."""
+    project_ids = {pk for pk in project_ids if pk is not None}
+    keys = {project_client_key(pk): pk for pk in project_ids}
+    found = {keys[key]: client_id for key, client_id in cache.get_many(keys).items()}
+    missing = project_ids - set(found)
+    if missing:
+        Project = apps.get_model("dbopt", "Project")
+        rows = dict(Project._base_manager.using(using).filter(pk__in=missing).values_list("pk", "client_id"))
+        remember_project_clients(rows)
+        found.update(rows)
+    return found
+
+
+class PendingBumps:
+    def __init__(self, using):
+        self.using = using
+        self.client_ids = set()
+
+    def flush(self):
+        conn = connections[self.using]
+        if getattr(conn, "_dashboard_bumps", None) is self:
+            conn._dashboard_bumps = None
+        bump(self.client_ids)
+
+
+def invalidate(client_ids, using="default"):
+    """Bump each client's generation when the current transaction commits (now, in autocommit)."""
+    client_ids = {client_id for client_id in client_ids if client_id is not None}
+    if not client_ids:
+        return
+    conn = connections[using]
+    if not conn.in_atomic_block:
+        bump(client_ids)
+        return
+    pending = getattr(conn, "_dashboard_bumps", None)
+    # A rolled back transaction drops our on_commit hook; its pending set must go with it.
+    if pending is not None and not any(item[1] == pending.flush for item in conn.run_on_commit):
+        pending = None
+    if pending is None:
+        pending = conn._dashboard_bumps = PendingBumps(using)
+        transaction.on_commit(pending.flush, using=using)
+    pending.client_ids |= client_ids
+
+
+def suppressed():
+    return _suppressed.get()
+
+
+@contextmanager
+def suppress_signals():
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from dbopt.stats import find_drift, rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Check the dbopt dashboard rollups against the task table, or rebuild them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--client", type=int, help="Limit to one dbopt client id.")
+        parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from scratch.")
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        client_id, using = options["client"], options["database"]
+
+        if options["rebuild"]:
+            rebuild_stats(client_id, using)
+            self.stdout.write(self.style.SUCCESS("Dashboard rollups rebuilt."))
+            return
+
+        drift = find_drift(client_id, using)
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Dashboard rollups are consistent."))
+            return
+
+        for (model, column), rows in drift.items():
+            self.stdout.write(self.style.WARNING(f"{model.__name__}.{column}: {len(rows)} rows drifted"))
+            for key, (stored, expected) in list(rows.items())[:20]:
+                self.stdout.write(f"  {dict(key)} stored={stored} expected={expected}")
+        self.stderr.write("Run with --rebuild to repair.")
+        raise SystemExit(1)
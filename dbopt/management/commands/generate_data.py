@@ -0,0 +1,231 @@
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from dbopt import invalidation, models as dbopt_models
+from dbopt.stats import rebuild_stats as rebuild_dashboard_stats
+from projectmgmt.models import (
+    ActivityLog, Client, ClientMembership, Comment, Project, Task, TaskAssigneeStat, TaskDueStat, TaskStat, User,
+)
+from projectmgmt.stats import rebuild_stats
+
+Assignee = Task.assignees.through
+
+
+def zipf_weights(n, skew, rng):
+    """Weight 1/rank**skew for n items in random order, so a few items get most of the rows."""
+    weights = [1 / (rank ** skew) for rank in range(1, n + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset with bulk_create: users, clients, memberships, projects, tasks with "
+        "assignees and comments, skewed so a few clients, projects and people account for most rows. "
+        "Also fills the dbopt dashboard tables unless --skip-dbopt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20)
+        parser.add_argument("--users", type=int, default=300)
+        parser.add_argument("--projects", type=int, default=400)
+        parser.add_argument("--tasks", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=40000)
+        parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent; 0 spreads rows evenly.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--prefix", default="bench", help="Prefix for generated usernames and slugs.")
+        parser.add_argument("--password", default="bench-password", help="Password set on every generated user.")
+        parser.add_argument("--clear", action="store_true", help="Delete rows from an earlier run with this prefix.")
+        parser.add_argument("--skip-dbopt", action="store_true")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.prefix = options["prefix"]
+        self.skew = options["skew"]
+        started = time.perf_counter()
+
+        if options["clear"]:
+            self.clear()
+        with transaction.atomic():
+            users = self.make_users(options["users"], options["password"])
+            clients = self.make_clients(options["clients"])
+            members = self.make_memberships(clients, users)
+            projects = self.make_projects(clients, options["projects"])
+            tasks = self.make_tasks(projects, options["tasks"])
+            assigned = self.make_assignees(tasks, members)
+            comments = self.make_comments(tasks, members, options["comments"])
+            if not options["skip_dbopt"]:
+                self.make_dbopt(clients, members, projects, tasks, assigned)
+        # bulk_create skips the signals that maintain the task rollups.
+        for client in clients:
+            rebuild_stats(client.pk)
+        if not options["skip_dbopt"]:
+            rebuild_dashboard_stats()
+
+        counts = {
+            "users": len(users), "clients": len(clients), "memberships": sum(len(m) for m in members.values()),
+            "projects": len(projects), "tasks": len(tasks),
+            "assignees": sum(len(a) for a in assigned.values()), "comments": comments,
+        }
+        summary = ", ".join(f"{n} {name}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary} in {time.perf_counter() - started:.1f}s."))
+
+    def clear(self):
+        """Raw deletes, children first: the cascade collector takes minutes on a large dataset."""
+        clients = Client._base_manager.filter(slug__startswith=f"{self.prefix}-").values("pk")
+        dashboard_clients = dbopt_models.Client.objects.filter(name__startswith=f"{self.prefix} ").values("pk")
+        for model, lookup, parents in (
+            (TaskStat, "client__in", clients),
+            (TaskAssigneeStat, "client__in", clients),
+            (TaskDueStat, "client__in", clients),
+            (ActivityLog, "client__in", clients),
+            (Comment, "task__project__client__in", clients),
+            (Assignee, "task__project__client__in", clients),
+            (Task, "project__client__in", clients),
+            (Project, "client__in", clients),
+            (ClientMembership, "client__in", clients),
+            (dbopt_models.ProjectTaskStat, "project__client__in", dashboard_clients),
+            (dbopt_models.AssigneeTaskStat, "client__in", dashboard_clients),
+            (dbopt_models.Task, "project__client__in", dashboard_clients),
+            (dbopt_models.Project, "client__in", dashboard_clients),
+            (dbopt_models.Client.members.through, "client__in", dashboard_clients),
+        ):
+            model._base_manager.filter(**{lookup: parents})._raw_delete(model._base_manager.db)
+        Client._base_manager.filter(slug__startswith=f"{self.prefix}-")._raw_delete(Client._base_manager.db)
+        dbopt_models.Client.objects.filter(name__startswith=f"{self.prefix} ").delete()
+        User.objects.filter(username__startswith=f"{self.prefix}-").delete()
+
+    def bulk(self, model, rows):
+        return model._base_manager.bulk_create(rows, batch_size=self.batch_size)
+
+    def pick(self, items, weights, k):
+        return self.rng.choices(items, weights=weights, k=k)
+
+    def make_users(self, count, password):
+        hashed = make_password(password)  # one hash shared by every user keeps generation fast
+        return self.bulk(User, [
+            User(
+                username=f"{self.prefix}-user-{i}", email=f"{self.prefix}-user-{i}@example.com",
+                first_name=f"User{i}", last_name=self.prefix.title(), password=hashed,
+            )
+            for i in range(count)
+        ])
+
+    def make_clients(self, count):
+        self.client_weights = zipf_weights(count, self.skew, self.rng)
+        return self.bulk(Client, [
+            Client(name=f"{self.prefix} client {i}", slug=f"{self.prefix}-client-{i}") for i in range(count)
+        ])
+
+    def make_memberships(self, clients, users):
+        """Every user joins one client (big clients get more people), one in ten joins a second."""
+        members = defaultdict(list)
+        for i, client in enumerate(clients):
+            members[client.pk].append(users[i % len(users)])
+        for user in users:
+            homes = self.pick(clients, self.client_weights, 2 if self.rng.random() < 0.1 else 1)
+            for client in homes:
+                if user not in members[client.pk]:
+                    members[client.pk].append(user)
+
+        rows = []
+        for client in clients:
+            for position, user in enumerate(members[client.pk]):
+                role = "owner" if position == 0 else self.pick(["admin", "member", "viewer"], [1, 8, 1], 1)[0]
+                rows.append(ClientMembership(client=client, user=user, role=role, created_by=user))
+        self.bulk(ClientMembership, rows)
+        return members
+
+    def make_projects(self, clients, count):
+        owners = list(clients) + self.pick(clients, self.client_weights, max(count - len(clients), 0))
+        statuses, status_weights = ["draft", "active", "completed", "archived"], [1, 6, 2, 1]
+        today = timezone.now().date()
+        rows = []
+        for i, client in enumerate(owners):
+            start = today - timedelta(days=self.rng.randint(0, 365))
+            rows.append(Project(
+                client=client, name=f"Project {i}", slug=f"{self.prefix}-project-{i}",
+                status=self.pick(statuses, status_weights, 1)[0],
+                start_date=start, end_date=start + timedelta(days=self.rng.randint(30, 365)),
+            ))
+        return self.bulk(Project, rows)
+
+    def make_tasks(self, projects, count):
+        owners = self.pick(projects, zipf_weights(len(projects), self.skew, self.rng), count)
+        today = timezone.now().date()
+        rows = []
+        for i, project in enumerate(owners):
+            due = today + timedelta(days=self.rng.randint(-60, 90)) if self.rng.random() < 0.8 else None
+            rows.append(Task(
+                project=project, title=f"Task {i}",
+                status=self.pick(["todo", "in_progress", "done"], [4, 2, 4], 1)[0],
+                priority=self.pick(["low", "medium", "high", "urgent"], [3, 5, 2, 1], 1)[0],
+                due_date=due,
+            ))
+        return self.bulk(Task, rows)
+
+    def make_assignees(self, tasks, members):
+        """0-3 assignees per task, drawn from the client's members with a few people doing most work."""
+        weights = {client_id: zipf_weights(len(people), self.skew, self.rng) for client_id, people in members.items()}
+        assigned, rows = {}, []
+        for task in tasks:
+            client_id = task.project.client_id
+            people = members[client_id]
+            chosen = set(self.pick(people, weights[client_id], self.pick([0, 1, 2, 3], [2, 6, 2, 1], 1)[0]))
+            assigned[task.pk] = chosen
+            rows.extend(Assignee(task_id=task.pk, user_id=user.pk) for user in chosen)
+        self.bulk(Assignee, rows)
+        return assigned
+
+    def make_comments(self, tasks, members, count):
+        rows = []
+        for task in self.pick(tasks, zipf_weights(len(tasks), self.skew, self.rng), count):
+            author = self.rng.choice(members[task.project.client_id])
+            rows.append(Comment(task=task, author=author, content="Lorem ipsum " * self.rng.randint(1, 20)))
+            if len(rows) >= self.batch_size:
+                self.bulk(Comment, rows)
+                rows = []
+        self.bulk(Comment, rows)
+        return count
+
+    def make_dbopt(self, clients, members, projects, tasks, assigned):
+        """Same tenants, members and shape in the dbopt dashboard tables (integer keys, one assignee per task)."""
+        dashboard_clients = {
+            client.pk: row for client, row in zip(clients, self.bulk(
+                dbopt_models.Client, [dbopt_models.Client(name=client.name) for client in clients]
+            ))
+        }
+        self.bulk(dbopt_models.Client.members.through, [
+            dbopt_models.Client.members.through(client_id=dashboard_clients[client_id].pk, user_id=user.pk)
+            for client_id, people in members.items() for user in people
+        ])
+        # bulk_create sends no post_save: drop any 404 cached for the new ids.
+        invalidation.invalidate({row.pk for row in dashboard_clients.values()})
+        dashboard_projects = {
+            project.pk: row for project, row in zip(projects, self.bulk(dbopt_models.Project, [
+                dbopt_models.Project(
+                    client=dashboard_clients[project.client_id], name=project.name,
+                    status="completed" if project.status in ("completed", "archived") else "active",
+                )
+                for project in projects
+            ]))
+        }
+        now = timezone.now()
+        self.bulk(dbopt_models.Task, [
+            dbopt_models.Task(
+                project=dashboard_projects[task.project_id], title=task.title,
+                assignee=next(iter(assigned[task.pk]), None),
+                status="completed" if task.status == "done" else "pending",
+                completed_at=now if task.status == "done" else None,
+            )
+            for task in tasks
+        ])
@@ -0,0 +1,61 @@
+import json
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from dbopt.index_advisor import advise
+
+
+class Command(BaseCommand):
+    help = (
+        "Introspect the database's indexes and report duplicates, indexes made redundant by a longer one "
+        "with the same leading columns, and composite indexes the statements in the slow query log were "
+        "missing, with what each drop saves on writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--app", action="append", help="Only this app's tables (repeatable); default all.")
+        parser.add_argument(
+            "--log", default=str(settings.BASE_DIR / "slow_queries.log"),
+            help="Slow query log to mine for missing indexes; pass '' to skip.",
+        )
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            configs = [apps.get_app_config(label) for label in options["app"] or ()] or apps.get_app_configs()
+        except LookupError as error:
+            raise CommandError(error)
+        models = [model for config in configs for model in config.get_models(include_auto_created=True)]
+        report = advise(connections[options["database"]], models, options["log"] or None)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Redundant indexes ({len(report['redundant'])})"))
+        for drop in report["redundant"]:
+            size = f", {drop['size_bytes'] / 1024:.0f} KiB" if drop["size_bytes"] else ""
+            self.stdout.write(
+                f"  {drop['table']}.{drop['index']} ({', '.join(drop['columns'])}){size}: {drop['kind']} of "
+                f"{drop['kept']} ({', '.join(drop['kept_columns'])})\n"
+                f"      defined by {drop['source']}; {drop['how']}"
+            )
+
+        if report["write_savings"]:
+            self.stdout.write(self.style.MIGRATE_HEADING("Estimated write savings"))
+            for table, saving in sorted(report["write_savings"].items()):
+                self.stdout.write(
+                    f"  {table}: {saving['dropped']} of {saving['btrees_per_write']} b-trees fewer per "
+                    f"INSERT/DELETE (-{saving['write_reduction_pct']}%), {saving['bytes'] / 1024:.0f} KiB"
+                )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Missing composite indexes ({len(report['missing'])})"))
+        for index in report["missing"]:
+            self.stdout.write(
+                f"  {index['table']} ({', '.join(index['columns'])}): {index['statements']} logged statements, "
+                f"e.g. {index['example'][:160]}"
+            )
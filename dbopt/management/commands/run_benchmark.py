@@ -0,0 +1,253 @@
+import json
+import platform
+import threading
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client as HttpClient, override_settings
+
+from authentications.models import APIKey
+from dbopt import models as dbopt_models
+from dbopt.performance_monitoring import record_queries
+from projectmgmt.models import Client, ClientMembership, Comment, Project, Task, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the main API routes, the dbopt dashboard and API-key/JWT authentication in-process "
+        "(full middleware stack, no network) and print throughput, p50/p95/p99 latency and query counts "
+        "per scenario as JSON. Run generate_data first; pass --baseline to compare with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Measured requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per scenario.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Threads issuing requests.")
+        parser.add_argument("--scenario", action="append", help="Run only these scenarios (repeatable).")
+        parser.add_argument("--password", default="bench-password", help="Password of the generated users.")
+        parser.add_argument("--output", help="Also write the report to this file.")
+        parser.add_argument("--baseline", help="Report from an earlier run to compare against.")
+        parser.add_argument(
+            "--accept-encoding", default="br, gzip",
+            help="Accept-Encoding sent with every request; 'identity' measures uncompressed responses.",
+        )
+        parser.add_argument(
+            "--throttle", action="store_true",
+            help="Keep rate limiting on (it is off by default, so scenarios measure the routes, not 429s).",
+        )
+
+    def handle(self, *args, **options):
+        if options["throttle"]:
+            return self.benchmark(options)
+        with override_settings(THROTTLE_ENABLED=False):
+            return self.benchmark(options)
+
+    def benchmark(self, options):
+        self.password = options["password"]
+        self.accept_encoding = options["accept_encoding"]
+        self.setup_targets()
+        scenarios = self.scenarios()
+        selected = options["scenario"] or list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios {sorted(unknown)}; choose from {sorted(scenarios)}.")
+
+        self.api_key_obj, self.api_key = APIKey.objects.create_key(self.user, name="benchmark")
+        try:
+            results = {
+                name: self.run(scenarios[name], options["requests"], options["warmup"], options["concurrency"])
+                for name in selected
+            }
+        finally:
+            self.api_key_obj.delete()
+
+        report = {"meta": self.meta(options), "scenarios": results}
+        if options["baseline"]:
+            with open(options["baseline"]) as handle:
+                report["compared_to_baseline"] = self.compare(json.load(handle)["scenarios"], results)
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output)
+        self.stdout.write(output)
+
+    def setup_targets(self):
+        """Benchmark the busiest tenant: most tasks, its busiest project and its most commented task."""
+        self.tenant = Client.objects.annotate(n=Count("projects__tasks")).order_by("-n").first()
+        if self.tenant is None:
+            raise CommandError("No clients found; run `manage.py generate_data` first.")
+        membership = ClientMembership.objects.filter(client=self.tenant, role="owner", is_active=True).first()
+        if membership is None:
+            raise CommandError(f"Client {self.tenant.pk} has no active owner.")
+        self.user = membership.user
+        self.project = Project.objects.filter(client=self.tenant).annotate(n=Count("tasks")).order_by("-n").first()
+        self.task = Task.objects.filter(project=self.project).annotate(n=Count("comments")).order_by("-n").first()
+        self.dashboard_client = dbopt_models.Client.objects.filter(name=self.tenant.name).first()
+
+        response = self.http().post(
+            "/auth/api/token/", {"username": self.user.username, "password": self.password},
+            content_type="application/json",
+        )
+        if response.status_code != 200:
+            raise CommandError(f"Could not log in as {self.user.username}; is --password right?")
+        self.jwt = response.json()["access"]
+
+    def http(self):
+        host = next((h for h in settings.ALLOWED_HOSTS if h != "*" and not h.startswith(".")), "localhost")
+        return HttpClient(HTTP_HOST=host, HTTP_ACCEPT_ENCODING=self.accept_encoding)
+
+    def scenarios(self):
+        """name -> callable(http client) returning the response."""
+        jwt = {"HTTP_AUTHORIZATION": f"Bearer {self.jwt}"}
+        client_url = f"/api/clients/{self.tenant.pk}/"
+        project_url = f"{client_url}projects/{self.project.pk}/"
+        task_url = f"{project_url}tasks/{self.task.pk}/" if self.task else None
+
+        def get(path, **headers):
+            return lambda http: http.get(path, **{**jwt, **headers})
+
+        scenarios = {
+            "clients-list": get("/api/clients/"),
+            "clients-detail": get(client_url),
+            "clients-stats": get(f"{client_url}stats/"),
+            "clients-activity": get(f"{client_url}activity/"),
+            "client-projects-list": get(f"{client_url}projects/"),
+            "client-projects-detail": get(project_url),
+            "project-tasks-list": get(f"{project_url}tasks/"),
+            "auth-token-obtain": lambda http: http.post(
+                "/auth/api/token/", {"username": self.user.username, "password": self.password},
+                content_type="application/json",
+            ),
+            "auth-jwt": get("/auth/api/test-auth/"),
+            "auth-api-key": lambda http: http.get("/auth/api/test-auth/", HTTP_X_API_KEY=self.api_key),
+        }
+        if task_url:
+            scenarios["project-tasks-detail"] = get(task_url)
+            scenarios["task-comments-list"] = get(f"{task_url}comments/")
+            # The project page in one round trip instead of four.
+            page = [client_url, project_url, f"{project_url}tasks/", f"{task_url}comments/"]
+            scenarios["batch-project-page"] = lambda http: http.post(
+                "/api/batch/", {"requests": [{"path": path} for path in page]},
+                content_type="application/json", **jwt,
+            )
+        if self.dashboard_client:
+            scenarios["dbopt-dashboard"] = get(f"/api/dbopt/dashboard/{self.dashboard_client.pk}/")
+        return scenarios
+
+    def run(self, scenario, requests, warmup, concurrency):
+        samples, statuses, lock = [], {}, threading.Lock()
+
+        def worker(count):
+            http, local = self.http(), []
+            for _ in range(count):
+                start = time.perf_counter()
+                with record_queries() as recorder:
+                    status, size = self.receive(scenario(http))
+                local.append((time.perf_counter() - start, recorder.count, status, size))
+            connections.close_all()
+            with lock:
+                samples.extend(local)
+
+        http = self.http()
+        for _ in range(warmup):
+            self.receive(scenario(http))
+
+        shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        threads = [threading.Thread(target=worker, args=(share,)) for share in shares if share]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        for _, _, status, _ in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        latencies = sorted(sample[0] for sample in samples)
+        queries = sorted(sample[1] for sample in samples)
+        sizes = [sample[3] for sample in samples]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if sample[2] >= 400),
+            "statuses": statuses,
+            "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else None,
+            "latency_ms": {
+                "p50": self.percentile(latencies, 50, 1000),
+                "p95": self.percentile(latencies, 95, 1000),
+                "p99": self.percentile(latencies, 99, 1000),
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+            "queries": {
+                "p50": self.percentile(queries, 50),
+                "max": queries[-1] if queries else None,
+                "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            },
+            "response_bytes": {
+                "mean": round(sum(sizes) / len(sizes)) if sizes else None,
+                "max": max(sizes) if sizes else None,
+            },
+        }
+
+    @staticmethod
+    def receive(response):
+        """(status, body bytes as sent); reads streamed bodies to the end so their time is counted."""
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response.status_code, size
+
+    def meta(self, options):
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "accept_encoding": options["accept_encoding"],
+            "dataset": {
+                "clients": Client.objects.count(),
+                "users": User.objects.count(),
+                "projects": Project.objects.count(),
+                "tasks": Task.objects.count(),
+                "comments": Comment.objects.count(),
+                "tenant_tasks": self.tenant.n,
+            },
+        }
+
+    def compare(self, baseline, results):
+        """Relative change in p95 latency and throughput per scenario present in both runs."""
+        changes = {}
+        for name, current in results.items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            changes[name] = {
+                "p95_change_pct": self.change(before["latency_ms"]["p95"], current["latency_ms"]["p95"]),
+                "throughput_change_pct": self.change(before["throughput_rps"], current["throughput_rps"]),
+                "queries_max_before": before["queries"]["max"],
+                "queries_max_now": current["queries"]["max"],
+                "bytes_change_pct": self.change(
+                    before.get("response_bytes", {}).get("mean"), current["response_bytes"]["mean"]
+                ),
+            }
+        return changes
+
+    @staticmethod
+    def change(before, now):
+        if not before or now is None:
+            return None
+        return round((now - before) / before * 100, 1)
+
+    @staticmethod
+    def percentile(samples, pct, scale=1):
+        if not samples:
+            return None
+        value = samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * scale
+        return round(value, 2)
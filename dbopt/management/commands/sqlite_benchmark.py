@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+PROFILES = {
+    # What main/settings.py used before: rollback journal, deferred transactions.
+    "stock": {"ENGINE": "django.db.backends.sqlite3", "OPTIONS": {}},
+    "tuned": {"ENGINE": "main.backends.sqlite3", "OPTIONS": {}},
+}
+
+
+class Command(BaseCommand):
+    help = "Concurrent read/write benchmark of the stock and tuned SQLite connection profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--rows", type=int, default=20000, help="Rows to seed before the run.")
+
+    def handle(self, *args, **options):
+        results = {name: self.run_profile(name, profile, options) for name, profile in PROFILES.items()}
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_profile(self, name, profile, options):
+        tmpdir = tempfile.mkdtemp()
+        alias = f"bench_{name}"
+        connections.settings[alias] = {
+            **connections.settings["default"],
+            **profile,
+            "NAME": os.path.join(tmpdir, "bench.sqlite3"),
+        }
+        try:
+            self.seed(alias, options["rows"])
+            return self.run_load(alias, options)
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+            shutil.rmtree(tmpdir)
+
+    def seed(self, alias, rows):
+        with connections[alias].cursor() as cursor:
+            cursor.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, counter INTEGER, body TEXT, used_at REAL)")
+            cursor.executemany(
+                "INSERT INTO item (counter, body, used_at) VALUES (%s, %s, %s)",
+                [(0, "x" * 200, 0.0) for _ in range(rows)],
+            )
+        connections[alias].close()
+
+    def run_load(self, alias, options):
+        deadline = time.perf_counter() + options["seconds"]
+        stats = {"reads": 0, "writes": 0, "lock_errors": 0, "read_latency": [], "write_latency": []}
+        lock = threading.Lock()
+
+        def worker(kind):
+            local = {"ok": 0, "errors": 0, "latency": []}
+            connection = connections[alias]
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    if kind == "write":
+                        # Shaped like mark_used + a comment post: read, then write, in one transaction.
+                        with transaction.atomic(using=alias):
+                            with connection.cursor() as cursor:
+                                cursor.execute("SELECT counter FROM item WHERE id = %s", [local["ok"] % 100 + 1])
+                                cursor.fetchone()
+                                cursor.execute(
+                                    "UPDATE item SET counter = counter + 1, used_at = %s WHERE id = %s",
+                                    [time.time(), local["ok"] % 100 + 1],
+                                )
+                                cursor.execute(
+                                    "INSERT INTO item (counter, body, used_at) VALUES (0, %s, %s)",
+                                    ["comment", time.time()],
+                                )
+                    else:
+                        with connection.cursor() as cursor:
+                            cursor.execute("SELECT COUNT(*), MAX(used_at) FROM item WHERE counter > 0")
+                            cursor.fetchone()
+                except OperationalError:
+                    local["errors"] += 1
+                    continue
+                local["ok"] += 1
+                local["latency"].append(time.perf_counter() - start)
+            connection.close()
+            with lock:
+                stats[f"{kind}s"] += local["ok"]
+                stats["lock_errors"] += local["errors"]
+                stats[f"{kind}_latency"].extend(local["latency"])
+
+        threads = [threading.Thread(target=worker, args=("write",)) for _ in range(options["writers"])]
+        threads += [threading.Thread(target=worker, args=("read",)) for _ in range(options["readers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        seconds = options["seconds"]
+        return {
+            "reads_per_second": round(stats["reads"] / seconds, 1),
+            "writes_per_second": round(stats["writes"] / seconds, 1),
+            "lock_errors": stats["lock_errors"],
+            "read_p95_ms": self.percentile(stats["read_latency"], 95),
+            "write_p95_ms": self.percentile(stats["write_latency"], 95),
+        }
+
+    @staticmethod
+    def percentile(samples, pct):
+        if not samples:
+            return None
+        samples = sorted(samples)
+        return round(samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000, 2)
@@ -0,0 +1,27 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from dbopt.models import Client
+from dbopt.warmer import warm_dashboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the dbopt dashboard cache for every client (or those given) after a deploy, so the first "
+        "requests do not pay for the rebuild. Entries that are already cached are left alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--client", type=int, action="append", help="dbopt client id (repeatable); default all.")
+        parser.add_argument("--workers", type=int, default=4, help="Dashboards built at once.")
+
+    def handle(self, *args, **options):
+        client_ids = options["client"] or list(Client.objects.order_by("pk").values_list("pk", flat=True))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max(options["workers"], 1)) as pool:
+            warmed = sum(pool.map(warm_dashboard, client_ids))
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {warmed} of {len(client_ids)} dashboards in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,218 @@
+"""
+In-process metrics with a Prometheus text exposition endpoint.
+
+    REQUEST_LATENCY.observe(0.042, route="project-tasks-list", method="GET", status="200")
+
+Metrics live in module-level objects registered on `registry`. With several
+gunicorn workers each process only sees its own requests, so when
+METRICS_MULTIPROC_DIR is set every worker also writes a JSON snapshot of its
+values there (at most once per METRICS_FLUSH_SECONDS) and /metrics sums the
+snapshots of all workers. Snapshots of exited workers are kept so counters
+never go backwards; clear the directory when the whole server restarts.
+"""
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.last_flush = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def local_values(self):
+        """{name: {labels: value}} for this process, copied under the lock."""
+        with self.lock:
+            return {
+                name: {labels: metric.merge(None, value) for labels, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    def snapshot(self):
+        return {
+            name: [[list(labels), value] for labels, value in values.items()]
+            for name, values in self.local_values().items()
+        }
+
+    def collect(self):
+        """{name: {labels: value}} for this process, or summed over every worker in multiprocess mode."""
+        directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+        if not directory:
+            return self.local_values()
+
+        self.flush(force=True)
+        totals = {name: {} for name in self.metrics}
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as handle:
+                    snapshot = json.load(handle)
+            except (OSError, ValueError):
+                continue  # a worker is mid-write; its next snapshot will be read next scrape
+            for name, rows in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, value in rows:
+                    key = tuple(labels)
+                    totals[name][key] = metric.merge(totals[name].get(key), value)
+        return totals
+
+    def flush(self, force=False):
+        directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 1)):
+            return
+        self.last_flush = now
+        path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+        with open(f"{path}.tmp", 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(f"{path}.tmp", path)
+
+    def exposition(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(values.items()):
+                lines.extend(metric.render(dict(zip(metric.labelnames, labels)), value))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.values = {}
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def render(self, labels, value):
+        return [f"{self.name}{_labels(labels)} {_number(value)}"]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count in each bucket (non-cumulative) ..., count above the last bucket, sum].
+        self.values = {}
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def render(self, labels, value):
+        lines, running = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), value[:-1]):
+            running += count
+            lines.append(f"{self.name}_bucket{_labels({**labels, 'le': bound})} {running}")
+        lines.append(f"{self.name}_sum{_labels(labels)} {_number(value[-1])}")
+        lines.append(f"{self.name}_count{_labels(labels)} {running}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by resolved route.', ('route', 'method', 'status'),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Response body size by resolved route.', ('route',), buckets=SIZE_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'db_queries_per_request', 'Database queries issued per request.', ('route',), buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Histogram(
+    'db_time_per_request_seconds', 'Time spent in database queries per request.', ('route',),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit or miss).', ('cache', 'result'),
+)
+CACHE_TIER_REQUESTS = Counter(
+    'cache_tier_requests_total', 'Two-tier cache lookups by tier (l1 in-process, l2 shared) and result.',
+    ('cache', 'tier', 'result'),
+)
+AUTH_LATENCY = Histogram(
+    'auth_backend_duration_seconds', 'Time spent in each authentication backend.', ('backend', 'outcome'),
+)
+THROTTLE_REQUESTS = Counter(
+    'throttle_requests_total', 'Requests seen by the rate limiter by route, bucket scope and result.',
+    ('route', 'scope', 'result'),
+)
+
+
+def route_name(request):
+    # Route names, not paths, so object ids can't blow up the label cardinality.
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name if match else None) or 'unmatched'
+
+
+def observe_request(request, response, elapsed, recorder):
+    route = route_name(request)
+    REQUEST_LATENCY.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(len(response.content), route=route)
+    DB_QUERIES.observe(recorder.count, route=route)
+    DB_TIME.observe(recorder.total_time, route=route)
+    registry.flush()
+
+
+def metrics_view(request):
+    """GET /metrics in the Prometheus text format; requires `Bearer METRICS_TOKEN` when that is set."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbopt', '0002_add_performance_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssigneeTaskStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('assignee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dbopt_task_stats', to=settings.AUTH_USER_MODEL)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignee_stats', to='dbopt.client')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'assignee', 'status'), name='unique_dbopt_assignee_task_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectTaskStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to='dbopt.project')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('project', 'status'), name='unique_dbopt_project_task_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def approximate_completed_at(apps, schema_editor):
+    # When older tasks were completed was never recorded; their creation time is the closest we have.
+    Task = apps.get_model('dbopt', 'Task')
+    Task.objects.using(schema_editor.connection.alias).filter(status='completed').update(completed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbopt', '0003_dashboard_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(approximate_completed_at, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='TaskDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('created', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='dbopt.client')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='dbopt.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'day'], name='dbopt_taskd_client__e62ff3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('client', 'project', 'day'), name='unique_dbopt_task_daily_stat')],
+            },
+        ),
+    ]
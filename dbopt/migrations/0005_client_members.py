@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbopt', '0004_task_daily_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='dbopt_clients', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from dbopt.operations import DropIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    """Drop the raw-SQL indexes from 0002 that repeat Meta.indexes or are a prefix of one."""
+
+    # Concurrent index drops cannot run inside a transaction on Postgres.
+    atomic = False
+
+    dependencies = [
+        ('dbopt', '0005_client_members'),
+    ]
+
+    operations = [
+        DropIndexConcurrently('project_status_idx', 'dbopt_project', ['status']),
+        DropIndexConcurrently('project_date_idx', 'dbopt_project', ['created_at']),
+        DropIndexConcurrently('project_client_idx', 'dbopt_project', ['client_id']),
+        DropIndexConcurrently('client_active_projects_idx', 'dbopt_project', ['client_id', 'status']),
+        DropIndexConcurrently('task_status_idx', 'dbopt_task', ['status']),
+        DropIndexConcurrently('task_recent_idx', 'dbopt_task', ['-created_at']),
+        DropIndexConcurrently('task_project_idx', 'dbopt_task', ['project_id']),
+        DropIndexConcurrently('task_assignee_idx', 'dbopt_task', ['assignee_id']),
+        DropIndexConcurrently('project_task_counts_idx', 'dbopt_task', ['project_id', 'status']),
+    ]
@@ -1,13 +1,186 @@
-from django.db import models
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save, post_delete
+from django.db import models, router, transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
 from django.conf import settings
+from django.utils import timezone
+
+from . import invalidation
+
+
+class DashboardQuerySet(models.QuerySet):
+    """
+    Bulk writes invalidate the dashboards of every client they touch: one query
+    for the affected client ids, one generation bump per client on commit.
+    Subclasses set `client_lookup`, the lookup from a row to its client id, and
+    `parent_field`, the foreign key a write may move the row along.
+    """
+
+    client_lookup = None
+    parent_field = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.client_lookup is None:
+            raise TypeError(f"{cls.__name__} must set client_lookup.")
+
+    def _client_ids(self, pks=None):
+        qs = self if pks is None else self.model._base_manager.using(self.db).filter(pk__in=pks)
+        return set(qs.order_by().values_list(self.client_lookup, flat=True).distinct())
+
+    def _parent_client_ids(self, objs):
+        """Client ids of rows just written: read off the rows when they hold one, else one query."""
+        if "__" not in self.client_lookup:
+            return {getattr(obj, self.client_lookup) for obj in objs}
+        return self._client_ids([obj.pk for obj in objs if obj.pk is not None])
+
+    def update(self, **kwargs):
+        moves_parent = self.parent_field in kwargs or f"{self.parent_field}_id" in kwargs
+        pks = list(self.values_list("pk", flat=True)) if moves_parent else None
+        client_ids = self._client_ids()
+        rows = super().update(**kwargs)
+        if moves_parent:
+            client_ids |= self._client_ids(pks)
+        invalidation.invalidate(client_ids, self.db)
+        return rows
+
+    def delete(self):
+        client_ids = self._client_ids()
+        with invalidation.suppress_signals():
+            result = super().delete()
+        invalidation.invalidate(client_ids, self.db)
+        return result
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidation.invalidate(self._parent_client_ids(objs), self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        client_ids = self._client_ids([obj.pk for obj in objs]) if self.parent_field in fields else set()
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        invalidation.invalidate(client_ids | self._parent_client_ids(objs), self.db)
+        return rows
+
+
+class ProjectQuerySet(DashboardQuerySet):
+    client_lookup = "client_id"
+    parent_field = "client"
+
+    def _parent_client_ids(self, objs):
+        invalidation.remember_project_clients({obj.pk: obj.client_id for obj in objs if obj.pk})
+        return super()._parent_client_ids(objs)
+
+    def update(self, **kwargs):
+        if self.parent_field not in kwargs and f"{self.parent_field}_id" not in kwargs:
+            return super().update(**kwargs)
+        from . import stats
+
+        # The tasks' per-assignee counts follow the project to its new client.
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list("pk", flat=True))
+            tasks = Task._base_manager.using(self.db).filter(project__in=pks)
+            before = stats.grouped_contributions(tasks)
+            rows = super().update(**kwargs)
+            invalidation.forget_project_clients(pks, self.db)
+            stats.apply_difference(before, stats.grouped_contributions(tasks), self.db)
+        return rows
+
+    def delete(self):
+        from . import stats
+
+        # Per-project rollups cascade with the projects; the per-assignee ones are keyed by client.
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list("pk", flat=True))
+            tasks = Task._base_manager.using(self.db).filter(project__in=pks)
+            stats.apply_difference(stats.grouped_contributions(tasks), stats.Contributions(), self.db)
+            result = super().delete()
+            invalidation.forget_project_clients(pks, self.db)
+            return result
+
+
+class TaskQuerySet(DashboardQuerySet):
+    """
+    Bulk writes also adjust the dashboard rollups, by GROUP BY deltas over the
+    rows they touch. bulk_update() is covered through the update() calls it makes.
+    """
+
+    client_lookup = "project__client_id"
+    parent_field = "project"
+    rollup_fields = {"project", "project_id", "assignee", "assignee_id", "status", "created_at", "completed_at"}
+
+    def _parent_client_ids(self, objs):
+        # Through the cached project -> client mapping rather than a join over the new rows.
+        return set(invalidation.project_client_ids({obj.project_id for obj in objs}, self.db).values())
+
+    def _changing_rollups(self, pks, write):
+        from . import stats
+
+        with transaction.atomic(using=self.db):
+            rows = self.model._base_manager.using(self.db).filter(pk__in=pks)
+            before = stats.grouped_contributions(rows)
+            result = write()
+            stats.apply_difference(before, stats.grouped_contributions(rows), self.db)
+        return result
+
+    def update(self, **kwargs):
+        if isinstance(kwargs.get("status"), str) and "completed_at" not in kwargs:
+            # Same rule as Task.save(): keep an existing completion time, clear it when reopened.
+            kwargs["completed_at"] = models.Case(
+                models.When(completed_at__isnull=False, then=models.F("completed_at")),
+                default=models.Value(timezone.now()),
+            ) if kwargs["status"] == "completed" else None
+        if not self.rollup_fields & set(kwargs):
+            return super().update(**kwargs)
+        pks = list(self.values_list("pk", flat=True))
+        return self._changing_rollups(pks, lambda: super(TaskQuerySet, self).update(**kwargs))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from . import stats
+
+        objs = list(objs)
+        for obj in objs:
+            obj.set_completed_at()
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            stats.add_tasks(objs, self.db)
+        return objs
+
+    def delete(self):
+        from . import stats
+
+        with transaction.atomic(using=self.db):
+            stats.apply_difference(stats.grouped_contributions(self), stats.Contributions(), self.db)
+            return super().delete()
+
+
+class SnapshotModel(models.Model):
+    """Remembers the column values last read or written, so receivers can tell what a save changed."""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Receivers update rollups from this save; they commit or roll back together with it.
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+        self._loaded_values = {
+            f.attname: self.__dict__[f.attname] for f in self._meta.concrete_fields if f.attname in self.__dict__
+        }
+
 
 class Client(models.Model):
     name = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Users allowed to read the client's dashboard and throughput.
+    members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='dbopt_clients', blank=True)
     
     class Meta:
         indexes = [
@@ -15,11 +188,13 @@ class Client(models.Model):
             models.Index(fields=['name']),
         ]
 
-class Project(models.Model):
+class Project(SnapshotModel):
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     status = models.CharField(max_length=20, choices=[('active', 'Active'), ('completed', 'Completed')])
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ProjectQuerySet.as_manager()
     
     class Meta:
         indexes = [
@@ -28,12 +203,30 @@ class Project(models.Model):
             models.Index(fields=['client', 'status']),  
         ]
 
-class Task(models.Model):
+class Task(SnapshotModel):
+    STATUS_CHOICES = [('pending', 'Pending'), ('completed', 'Completed')]
+
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     assignee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    status = models.CharField(max_length=20, choices=[('pending', 'Pending'), ('completed', 'Completed')])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    def set_completed_at(self):
+        if self.status != 'completed':
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = timezone.now()
+
+    def save(self, *args, **kwargs):
+        self.set_completed_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'completed_at'}
+        super().save(*args, **kwargs)
     
     class Meta:
         indexes = [
@@ -44,17 +237,92 @@ class Task(models.Model):
             models.Index(fields=['-created_at']),  # For ordering
         ]
 
+
+class ProjectTaskStat(models.Model):
+    """Task count per (project, status), kept current by dbopt.stats."""
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='task_stats')
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'status'], name='unique_dbopt_project_task_stat')
+        ]
+
+
+class TaskDailyStat(models.Model):
+    """Tasks created and completed per (client, project, day), kept current by dbopt.stats."""
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='daily_stats')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    created = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'project', 'day'], name='unique_dbopt_task_daily_stat')
+        ]
+        indexes = [
+            models.Index(fields=['client', 'day']),
+        ]
+
+
+class AssigneeTaskStat(models.Model):
+    """Task count per (client, assignee, status), kept current by dbopt.stats."""
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='assignee_stats')
+    assignee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='dbopt_task_stats')
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'assignee', 'status'], name='unique_dbopt_assignee_task_stat')
+        ]
+
+
 @receiver([post_save, post_delete], sender=Project)
 @receiver([post_save, post_delete], sender=Task)
-def invalidate_dashboard_cache(sender, instance, **kwargs):
-    """Invalidate cache when project or task data changes"""
-    if sender == Project:
-        client_id = instance.client.id
-    else:  # Task
-        client_id = instance.project.client.id
-    
-    cache_keys = [
-        f"dashboard_client_{client_id}",
-        f"advanced_dashboard_client_{client_id}"
-    ]
-    cache.delete_many(cache_keys)
\ No newline at end of file
+def invalidate_dashboard_cache(sender, instance, using=None, **kwargs):
+    """Invalidate the dashboards of the client(s) a saved or deleted row belongs to - no FK lookups."""
+    if invalidation.suppressed():
+        return
+    # A save that moves the row must invalidate the old client too.
+    loaded = getattr(instance, '_loaded_values', {})
+    if sender is Project:
+        client_ids = {instance.client_id, loaded.get('client_id')}
+        if kwargs.get('signal') is post_save:
+            invalidation.remember_project_clients({instance.pk: instance.client_id})
+        else:
+            invalidation.forget_project_clients([instance.pk], using)
+    else:
+        project_ids = {instance.project_id, loaded.get('project_id')} - {None}
+        if project_ids == {instance.project_id} and Task.project.is_cached(instance):
+            client_ids = {instance.project.client_id}
+        else:
+            client_ids = set(invalidation.project_client_ids(project_ids, using).values())
+    invalidation.invalidate(client_ids, using)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client(sender, instance, using=None, **kwargs):
+    # A new client replaces the cached 404 for its id.
+    if kwargs.get('signal') is post_delete or kwargs.get('created'):
+        invalidation.invalidate({instance.pk}, using)
+
+
+@receiver(m2m_changed, sender=Client.members.through)
+def invalidate_client_members(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    """The dashboard entry holds the client's member ids, so membership changes replace it."""
+    if not reverse:
+        if action.startswith('post_'):
+            invalidation.invalidate({instance.pk}, using)
+    elif action == 'pre_clear':
+        # user.dbopt_clients.clear(): which clients it leaves is no longer known by post_clear.
+        client_ids = sender.objects.using(using).filter(user=instance).values_list('client_id', flat=True)
+        invalidation.invalidate(set(client_ids), using)
+    elif action in ('post_add', 'post_remove'):
+        invalidation.invalidate(pk_set, using)
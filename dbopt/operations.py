@@ -0,0 +1,310 @@
+"""
+Migration operations that keep the tables writable while they run.
+
+- CreateIndexConcurrently / DropIndexConcurrently: raw-SQL indexes (what
+  RunSQL("CREATE INDEX ...") was used for). On Postgres they build with
+  CONCURRENTLY, so writes continue during the build, and an index left
+  INVALID by an interrupted build is dropped and rebuilt. Elsewhere they fall
+  back to a plain CREATE INDEX. Both are idempotent (IF [NOT] EXISTS).
+- AddIndexConcurrently: AddIndex for Meta.indexes with the same behaviour.
+- BackfillInBatches: UPDATE a table in primary key ranges, one short
+  transaction per batch. The batch shrinks when it holds the write lock for
+  longer than max_batch_seconds, there is a pause between batches, and the
+  last primary key done is checkpointed with each batch, so a deploy that
+  dies halfway resumes where it stopped. Progress goes to the
+  "performance.migrations" logger.
+
+On Postgres all of them need `atomic = False` on the migration: CONCURRENTLY
+cannot run inside a transaction, and a backfill that is one transaction holds
+its locks until the end anyway.
+"""
+import logging
+import time
+
+from django.db import NotSupportedError, router, transaction
+from django.db.migrations.operations import AddIndex
+from django.db.migrations.operations.base import Operation
+
+logger = logging.getLogger('performance.migrations')
+
+CHECKPOINT_TABLE = 'dbopt_backfill_checkpoint'
+
+
+def _ensure_not_in_transaction(schema_editor, operation):
+    if schema_editor.connection.in_atomic_block:
+        raise NotSupportedError(
+            f"{operation.describe()} commits as it goes; set atomic = False on the migration."
+        )
+
+
+def _index_exists(connection, table, name):
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return False
+        return name in connection.introspection.get_constraints(cursor, table)
+
+
+def _drop_invalid_index(schema_editor, name):
+    """Drop an index an interrupted CONCURRENTLY build left behind; IF NOT EXISTS would keep it."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+            [name],
+        )
+        row = cursor.fetchone()
+    if row and row[0]:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(name)}")
+
+
+def _create_index_sql(schema_editor, name, table, columns, unique):
+    quote = schema_editor.quote_name
+    concurrently = ' CONCURRENTLY' if schema_editor.connection.vendor == 'postgresql' else ''
+    # A leading "-" means descending, as in Meta.indexes.
+    parts = [
+        f"{quote(column[1:])} DESC" if column.startswith('-') else quote(column)
+        for column in columns
+    ]
+    return (
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX{concurrently} IF NOT EXISTS {quote(name)} "
+        f"ON {quote(table)} ({', '.join(parts)})"
+    )
+
+
+def _drop_index_sql(schema_editor, name):
+    concurrently = ' CONCURRENTLY' if schema_editor.connection.vendor == 'postgresql' else ''
+    return f"DROP INDEX{concurrently} IF EXISTS {schema_editor.quote_name(name)}"
+
+
+class CreateIndexConcurrently(Operation):
+    """CREATE INDEX on a table by name; no model state changes, like the RunSQL it replaces."""
+
+    reversible = True
+    reduces_to_sql = True
+
+    def __init__(self, name, table, columns, unique=False):
+        self.name = name
+        self.table = table
+        self.columns = list(columns)
+        self.unique = unique
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _create(self, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            _ensure_not_in_transaction(schema_editor, self)
+            _drop_invalid_index(schema_editor, self.name)
+        schema_editor.execute(_create_index_sql(schema_editor, self.name, self.table, self.columns, self.unique))
+
+    def _drop(self, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            _ensure_not_in_transaction(schema_editor, self)
+        schema_editor.execute(_drop_index_sql(schema_editor, self.name))
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if router.allow_migrate(schema_editor.connection.alias, app_label):
+            self._create(schema_editor)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if router.allow_migrate(schema_editor.connection.alias, app_label):
+            self._drop(schema_editor)
+
+    def describe(self):
+        return f"Create index {self.name} on {self.table} ({', '.join(self.columns)}) concurrently"
+
+    @property
+    def migration_name_fragment(self):
+        return self.name.lower()
+
+
+class DropIndexConcurrently(CreateIndexConcurrently):
+    """The reverse of CreateIndexConcurrently; `columns` are needed to rebuild it on rollback."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f"Drop index {self.name} on {self.table} concurrently"
+
+    @property
+    def migration_name_fragment(self):
+        return f"drop_{self.name.lower()}"
+
+
+class AddIndexConcurrently(AddIndex):
+    """AddIndex that builds concurrently on Postgres and skips an index that already exists."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        connection = schema_editor.connection
+        if connection.vendor == 'postgresql':
+            _ensure_not_in_transaction(schema_editor, self)
+            _drop_invalid_index(schema_editor, self.index.name)
+        if _index_exists(connection, model._meta.db_table, self.index.name):
+            return
+        if connection.vendor == 'postgresql':
+            schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        connection = schema_editor.connection
+        if not _index_exists(connection, model._meta.db_table, self.index.name):
+            return
+        if connection.vendor == 'postgresql':
+            _ensure_not_in_transaction(schema_editor, self)
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+    def describe(self):
+        return f"{super().describe()} concurrently"
+
+
+class Checkpoint:
+    """Progress of one backfill, in a table of its own so it survives a failed deploy."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.table = connection.ops.quote_name(CHECKPOINT_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "name VARCHAR(200) PRIMARY KEY, last_pk VARCHAR(255), rows_done BIGINT NOT NULL, "
+                "finished BOOLEAN NOT NULL)"
+            )
+
+    def load(self):
+        """(last primary key done as a string or None, rows updated so far, finished)."""
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT last_pk, rows_done, finished FROM {self.table} WHERE name = %s", [self.name])
+            row = cursor.fetchone()
+        return (row[0], row[1], bool(row[2])) if row else (None, 0, False)
+
+    def save(self, last_pk, rows_done, finished=False):
+        params = [None if last_pk is None else str(last_pk), rows_done, finished, self.name]
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET last_pk = %s, rows_done = %s, finished = %s WHERE name = %s", params
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    f"INSERT INTO {self.table} (last_pk, rows_done, finished, name) VALUES (%s, %s, %s, %s)", params
+                )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE name = %s", [self.name])
+
+
+class BackfillInBatches(Operation):
+    """
+    `Model.objects.filter(**where).update(**values)` in primary key order, one
+    batch per transaction. `values` may use F() and other expressions; make
+    them idempotent, a batch can run twice if the process dies between its
+    commit and the next one. `reverse_values`, if given, is backfilled the
+    same way on rollback; otherwise rolling back only forgets the checkpoint.
+    """
+
+    reversible = True
+    reduces_to_sql = False
+    atomic = False
+
+    def __init__(self, model_name, values, where=None, reverse_values=None, batch_size=1000, pause=0.05,
+                 max_batch_seconds=0.5, report_seconds=5.0, name=None):
+        self.model_name = model_name
+        self.values = values
+        self.where = where or {}
+        self.reverse_values = reverse_values
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_batch_seconds = max_batch_seconds
+        self.report_seconds = report_seconds
+        self.name = name
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def checkpoint_name(self, app_label, reverse=False):
+        name = self.name or f"{app_label}.{self.model_name.lower()}:{','.join(sorted(self.values))}"
+        return f"{name}:reverse" if reverse else name
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            self._clear(schema_editor, app_label, reverse=True)
+            self._backfill(schema_editor, model, self.values, self.checkpoint_name(app_label))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        self._clear(schema_editor, app_label)
+        if self.reverse_values is not None:
+            self._backfill(schema_editor, model, self.reverse_values, self.checkpoint_name(app_label, reverse=True))
+
+    def _clear(self, schema_editor, app_label, reverse=False):
+        Checkpoint(schema_editor.connection, self.checkpoint_name(app_label, reverse)).clear()
+
+    def _backfill(self, schema_editor, model, values, name):
+        _ensure_not_in_transaction(schema_editor, self)
+        using = schema_editor.connection.alias
+        checkpoint = Checkpoint(schema_editor.connection, name)
+        last_pk, rows_done, finished = checkpoint.load()
+        if finished:
+            logger.info("%s: already finished (%d rows)", name, rows_done)
+            return
+        pk = model._meta.pk
+        last_pk = pk.to_python(last_pk) if last_pk is not None else None
+        rows = model._base_manager.using(using).order_by('pk')
+        pending = rows.filter(**self.where)
+        if last_pk is not None:
+            pending = pending.filter(pk__gt=last_pk)
+            logger.info("%s: resuming after pk %s (%d rows done)", name, last_pk, rows_done)
+        total = rows_done + pending.count()
+
+        batch_size = self.batch_size
+        reported = time.monotonic()
+        while True:
+            window = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            pks = list(window.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            started = time.monotonic()
+            with transaction.atomic(using=using):
+                rows_done += rows.filter(pk__gte=pks[0], pk__lte=pks[-1], **self.where).update(**values)
+                checkpoint.save(pks[-1], rows_done)
+            elapsed = time.monotonic() - started
+            last_pk = pks[-1]
+
+            # Keep each batch's write lock short; grow back once batches are quick again.
+            if elapsed > self.max_batch_seconds and batch_size > 1:
+                batch_size //= 2
+            elif elapsed < self.max_batch_seconds / 4 and batch_size < self.batch_size:
+                batch_size = min(batch_size * 2, self.batch_size)
+            if time.monotonic() - reported >= self.report_seconds:
+                reported = time.monotonic()
+                logger.info(
+                    "%s: %d/%d rows, up to pk %s, batch %d (%.0f ms)",
+                    name, rows_done, total, last_pk, batch_size, elapsed * 1000,
+                )
+            if self.pause:
+                time.sleep(self.pause)
+        checkpoint.save(last_pk, rows_done, finished=True)
+        logger.info("%s: finished, %d rows", name, rows_done)
+
+    def describe(self):
+        return f"Backfill {', '.join(self.values)} on {self.model_name} in batches of {self.batch_size}"
+
+    @property
+    def migration_name_fragment(self):
+        return f"backfill_{self.model_name.lower()}"
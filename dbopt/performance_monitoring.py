@@ -1,24 +1,98 @@
 # performance_monitoring.py - Clean, professional version
+import re
 import time
 import logging
-from django.db import connection
-from functools import wraps
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('performance')
+
+# Route name (or path) of the request issuing queries, for the slow query log.
+current_view = ContextVar('current_view', default=None)
+
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*%s\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalise a statement so the same query with different parameters compares equal."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper callback that tallies queries.
+
+    Works with DEBUG off and keeps only counters, the slowest statement and a
+    fingerprint histogram, so memory stays flat however many queries run.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total_time += elapsed
+            if elapsed >= self.slowest_time:
+                self.slowest_time, self.slowest_sql = elapsed, sql
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """Fingerprints seen at least `threshold` times - the usual N+1 signature."""
+        if threshold is None:
+            threshold = getattr(settings, 'PERFORMANCE_NPLUSONE_THRESHOLD', 5)
+        return {sql: n for sql, n in self.fingerprints.items() if n >= threshold}
+
+
+@contextmanager
+def record_queries(recorder=None):
+    """Install a QueryRecorder on every configured database for the current thread."""
+    recorder = recorder or QueryRecorder()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+def _log(label, recorder, elapsed):
+    logger.info(
+        f"{label}: {recorder.count} queries, {recorder.total_time:.3f}s db, {elapsed:.3f}s total, "
+        f"slowest {recorder.slowest_time:.3f}s"
+    )
+    for sql, n in recorder.repeated().items():
+        logger.warning(f"{label}: possible N+1, {n}x {sql[:300]}")
+
 
 # Monitor query performance
 def monitor_queries(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_queries = len(connection.queries)
-        start_time = time.time()
-        
-        result = func(*args, **kwargs)
-        
-        query_count = len(connection.queries) - start_queries
-        execution_time = time.time() - start_time
-        
-        logger = logging.getLogger('performance')
-        logger.info(f"{func.__name__}: {query_count} queries, {execution_time:.3f}s")
-        
+        start_time = time.perf_counter()
+        with record_queries() as recorder:
+            result = func(*args, **kwargs)
+        _log(func.__name__, recorder, time.perf_counter() - start_time)
         return result
     return wrapper
 
@@ -28,15 +102,28 @@ class PerformanceMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
-        start_time = time.time()
-        start_queries = len(connection.queries)
-        
-        response = self.get_response(request)
-        
-        query_count = len(connection.queries) - start_queries
-        execution_time = time.time() - start_time
-        
-        response['X-Query-Count'] = str(query_count)
+        start_time = time.perf_counter()
+        token = current_view.set(request.path)
+        try:
+            with record_queries() as recorder:
+                request.query_stats = recorder
+                response = self.get_response(request)
+        finally:
+            current_view.reset(token)
+        execution_time = time.perf_counter() - start_time
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-DB-Time'] = f"{recorder.total_time:.3f}"
         response['X-Execution-Time'] = f"{execution_time:.3f}"
-        
-        return response
\ No newline at end of file
+
+        metrics.observe_request(request, response, execution_time, recorder)
+
+        slow = execution_time >= getattr(settings, 'PERFORMANCE_SLOW_REQUEST_SECONDS', 0.5)
+        if slow or recorder.repeated():
+            _log(f"{request.method} {request.path}", recorder, execution_time)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Name slow queries after the route (e.g. project-tasks-list) once it is resolved.
+        current_view.set(request.resolver_match.view_name or request.path)
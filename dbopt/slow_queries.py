@@ -0,0 +1,143 @@
+"""
+Slow query log.
+
+DboptConfig.ready() installs `slow_query_log` as an execute wrapper on every
+database connection. Statements slower than SLOW_QUERY_SECONDS are written to
+the `performance.slow_queries` logger as one JSON object per line: the SQL,
+the types of its parameters (never their values), the view that issued it and
+the plan the database chose, plus the indexes that plan names.
+
+Entries are rate limited per statement fingerprint and overall, and EXPLAIN
+only runs for entries that will actually be written, so a burst of slow
+queries cannot turn into a burst of extra database work.
+"""
+import json
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .performance_monitoring import current_view, fingerprint
+
+logger = logging.getLogger('performance.slow_queries')
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b", re.IGNORECASE)
+_PLAN_INDEX = re.compile(
+    r"USING (?:COVERING )?INDEX (\w+)|Index (?:Only )?Scan (?:Backward )?using (\w+)", re.IGNORECASE
+)
+_EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def params_shape(params, many=False):
+    """Parameter types only, so entries never carry user data."""
+    if params is None:
+        return None
+    if many:
+        if not isinstance(params, (list, tuple)):
+            return {'rows': None}
+        return {'rows': len(params), 'row': params_shape(params[0]) if params else None}
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    types = [type(value).__name__ for value in params]
+    if len(types) > 20:
+        return types[:20] + [f"... {len(types) - 20} more"]
+    return types
+
+
+def explain(connection, sql, params):
+    """Return (plan lines, index names) for `sql`, or (None, []) when it can't be explained."""
+    prefix = _EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None or not _EXPLAINABLE.match(sql):
+        return None, []
+    # The raw cursor skips execute wrappers, so the EXPLAIN isn't counted or logged itself.
+    with connection.cursor() as cursor:
+        cursor.cursor.execute(prefix + sql, params)
+        rows = cursor.cursor.fetchall()
+    plan = [str(row[-1]) for row in rows]
+    indexes = sorted({a or b for line in plan for a, b in _PLAN_INDEX.findall(line)})
+    return plan, indexes
+
+
+class RateLimiter:
+    """At most one entry per fingerprint per `interval` seconds and `per_minute` entries overall."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_logged = {}
+        self.suppressed = {}
+        self.window_start = 0.0
+        self.window_count = 0
+
+    def allow(self, key, now, interval, per_minute):
+        """Return None to drop the entry, else how many entries for `key` were dropped since the last one."""
+        with self.lock:
+            if now - self.window_start >= 60:
+                self.window_start, self.window_count = now, 0
+            recent = now - self.last_logged.get(key, float('-inf')) < interval
+            if recent or self.window_count >= per_minute:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return None
+            if len(self.last_logged) > 10000:
+                self.last_logged.clear()
+            self.last_logged[key] = now
+            self.window_count += 1
+            return self.suppressed.pop(key, 0)
+
+
+class SlowQueryLog:
+    def __init__(self):
+        self.limiter = RateLimiter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - start
+        if elapsed >= getattr(settings, 'SLOW_QUERY_SECONDS', 0.1):
+            self.capture(context['connection'], sql, params, many, elapsed)
+        return result
+
+    def capture(self, connection, sql, params, many, elapsed):
+        key = fingerprint(sql)
+        suppressed = self.limiter.allow(
+            key, time.monotonic(),
+            getattr(settings, 'SLOW_QUERY_LOG_INTERVAL', 60),
+            getattr(settings, 'SLOW_QUERY_LOG_PER_MINUTE', 60),
+        )
+        if suppressed is None:
+            return
+
+        entry = {
+            'time': timezone.now().isoformat(),
+            'duration_ms': round(elapsed * 1000, 2),
+            'database': connection.alias,
+            'view': current_view.get(),
+            'fingerprint': key,
+            'sql': sql,
+            'params': params_shape(params, many),
+            'suppressed': suppressed,
+        }
+        if getattr(settings, 'SLOW_QUERY_EXPLAIN', True) and not many:
+            try:
+                entry['plan'], entry['indexes'] = explain(connection, sql, params)
+            except Exception as exc:
+                # e.g. an aborted Postgres transaction; the entry is still worth writing.
+                entry['plan'], entry['indexes'], entry['explain_error'] = None, [], str(exc)
+        logger.warning(json.dumps(entry, default=str))
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install(sender=None, connection=None, **kwargs):
+    """connection_created receiver."""
+    if slow_query_log not in connection.execute_wrappers:
+        # Index 0: execute_wrapper() pops the *last* wrapper on exit, so a connection opened
+        # inside record_queries() must not end up with ours after the recorder.
+        connection.execute_wrappers.insert(0, slow_query_log)
@@ -0,0 +1,243 @@
+"""
+Dashboard rollups maintained by deltas.
+
+ProjectTaskStat counts tasks per (project, status), AssigneeTaskStat per
+(client, assignee, status) and TaskDailyStat the tasks created and completed
+per (client, project, day). Every dbopt.Task insert, status change,
+reassignment, move and delete adjusts the rows it affects in the same
+transaction - single rows through the receivers below, bulk writes through
+TaskQuerySet/ProjectQuerySet - so a dashboard rebuild reads
+O(projects + members) rollup rows instead of the client's tasks.
+`manage.py dashboard_stats` reports drift and `--rebuild` recomputes.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import invalidation
+from .models import AssigneeTaskStat, Project, ProjectTaskStat, Task, TaskDailyStat
+
+# (model, counted column) for every rollup; the other concrete columns except id form its key.
+ROLLUPS = (
+    (ProjectTaskStat, "count"),
+    (AssigneeTaskStat, "count"),
+    (TaskDailyStat, "created"),
+    (TaskDailyStat, "completed"),
+)
+
+
+class Contributions:
+    """Task counts for every rollup, keyed by (model, column) and then by the lookup kwargs of their rows."""
+
+    def __init__(self):
+        self.counts = {rollup: Counter() for rollup in ROLLUPS}
+
+    def add(self, client_id, project_id, assignee_id, status, created_day=None, completed_day=None, count=1):
+        self.counts[ProjectTaskStat, "count"][(("project_id", project_id), ("status", status))] += count
+        if assignee_id is not None:
+            key = (("client_id", client_id), ("assignee_id", assignee_id), ("status", status))
+            self.counts[AssigneeTaskStat, "count"][key] += count
+        for column, day in (("created", created_day), ("completed", completed_day)):
+            if day is not None:
+                key = (("client_id", client_id), ("project_id", project_id), ("day", day))
+                self.counts[TaskDailyStat, column][key] += count
+
+
+def _bump(model, column, delta, using, **key):
+    if not delta:
+        return
+    rows = model.objects.using(using).filter(**key)
+    if rows.update(**{column: F(column) + delta}) or delta < 0:
+        # A missing row for a negative delta is drift already; inserting it could outlive a cascade.
+        return
+    try:
+        with transaction.atomic(using=using):
+            model.objects.using(using).create(**{column: delta}, **key)
+    except IntegrityError:
+        # Someone else created the row between our update and insert.
+        rows.update(**{column: F(column) + delta})
+
+
+def apply_difference(before, after, using):
+    """Move the rollups from counting `before` to counting `after`."""
+    for (model, column), new in after.counts.items():
+        delta = Counter(new)
+        delta.subtract(before.counts[model, column])
+        for key, count in delta.items():
+            _bump(model, column, count, using, **dict(key))
+
+
+def grouped_contributions(tasks, client_id=None):
+    """Contributions of a task queryset from one GROUP BY query, optionally as if under another client."""
+    contributions = Contributions()
+    columns = ("project__client_id", "project_id", "assignee_id", "status", "created_day", "completed_day")
+    for row in (
+        tasks.order_by().annotate(created_day=TruncDate("created_at"), completed_day=TruncDate("completed_at"))
+        .values(*columns).annotate(n=Count("id")).values_list(*columns, "n")
+    ):
+        client, project_id, assignee_id, status, created_day, completed_day, count = row
+        contributions.add(
+            client if client_id is None else client_id, project_id, assignee_id, status,
+            created_day, completed_day if status == "completed" else None, count,
+        )
+    return contributions
+
+
+def add_tasks(tasks, using):
+    clients = invalidation.project_client_ids({task.project_id for task in tasks}, using)
+    contributions = Contributions()
+    for task in tasks:
+        state = _task_state(task.__dict__)
+        contributions.add(clients.get(task.project_id), *state)
+    apply_difference(Contributions(), contributions, using)
+
+
+def _day(value):
+    return timezone.localdate(value) if value is not None else None
+
+
+def _task_state(values):
+    if not values or values.get("project_id") is None:
+        return None
+    status = values.get("status")
+    return (
+        values["project_id"], values.get("assignee_id"), status, _day(values.get("created_at")),
+        _day(values.get("completed_at")) if status == "completed" else None,
+    )
+
+
+def _contributions(state, clients):
+    contributions = Contributions()
+    if state is not None:
+        contributions.add(clients.get(state[0]), *state)
+    return contributions
+
+
+@receiver(post_save, sender=Task, dispatch_uid="dbopt_task_rollups_save")
+def update_task_rollups(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old = None if created else _task_state(getattr(instance, "_loaded_values", None))
+    new = _task_state(instance.__dict__)
+    if old == new:
+        return
+    clients = invalidation.project_client_ids({state[0] for state in (old, new) if state}, using)
+    apply_difference(_contributions(old, clients), _contributions(new, clients), using)
+
+
+@receiver(pre_delete, sender=Task, dispatch_uid="dbopt_task_rollups_delete")
+def remove_task_rollups(sender, instance, using=None, **kwargs):
+    # Queryset deletes have already subtracted their tasks with one grouped query.
+    if invalidation.suppressed():
+        return
+    state = _task_state(getattr(instance, "_loaded_values", None) or instance.__dict__)
+    if state is not None:
+        clients = invalidation.project_client_ids({state[0]}, using)
+        apply_difference(_contributions(state, clients), Contributions(), using)
+
+
+@receiver(post_save, sender=Project, dispatch_uid="dbopt_project_rollups_move")
+def move_project_rollups(sender, instance, created, raw=False, using=None, **kwargs):
+    """A project moved to another client takes its tasks' per-assignee and daily counts along."""
+    old_client_id = getattr(instance, "_loaded_values", {}).get("client_id")
+    if created or raw or old_client_id in (None, instance.client_id):
+        return
+    tasks = Task._base_manager.using(using).filter(project_id=instance.pk)
+    apply_difference(grouped_contributions(tasks, old_client_id), grouped_contributions(tasks), using)
+
+
+def _daily_counts(tasks, column, since=None):
+    day_column = f"{column}_at"
+    if column == "completed":
+        tasks = tasks.filter(status="completed", completed_at__isnull=False)
+    if since is not None:
+        tasks = tasks.filter(**{f"{day_column}__date__gte": since})
+    return Counter({
+        (("client_id", client_id), ("project_id", project_id), ("day", day)): n
+        for client_id, project_id, day, n in tasks.order_by().annotate(day=TruncDate(day_column))
+        .values("project__client_id", "project_id", "day").annotate(n=Count("id"))
+        .values_list("project__client_id", "project_id", "day", "n")
+    })
+
+
+def expected_stats(client_id=None, using="default", since=None):
+    """Recompute the rollups from the task table, {(model, column): {key: count}}."""
+    tasks = Task._base_manager.using(using).all()
+    if client_id is not None:
+        tasks = tasks.filter(project__client_id=client_id)
+    expected = {
+        (TaskDailyStat, "created"): _daily_counts(tasks, "created", since),
+        (TaskDailyStat, "completed"): _daily_counts(tasks, "completed", since),
+    }
+    if since is None:
+        by_status = Contributions()
+        for project_id, assignee_id, status, client, n in (
+            tasks.order_by().values("project_id", "assignee_id", "status", "project__client_id")
+            .annotate(n=Count("id")).values_list("project_id", "assignee_id", "status", "project__client_id", "n")
+        ):
+            by_status.add(client, project_id, assignee_id, status, count=n)
+        expected[ProjectTaskStat, "count"] = by_status.counts[ProjectTaskStat, "count"]
+        expected[AssigneeTaskStat, "count"] = by_status.counts[AssigneeTaskStat, "count"]
+    return expected
+
+
+def _key_fields(model):
+    return [f.attname for f in model._meta.concrete_fields if f.name not in ("id", "count", "created", "completed")]
+
+
+def _stored_rows(model, client_id, using, since=None):
+    rows = model.objects.using(using).all()
+    if client_id is not None:
+        rows = rows.filter(**{"project__client_id" if model is ProjectTaskStat else "client_id": client_id})
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    return rows
+
+
+def stored_stats(model, column, client_id=None, using="default", since=None):
+    key_fields = _key_fields(model)
+    return {
+        tuple(zip(key_fields, values[:-1])): values[-1]
+        for values in _stored_rows(model, client_id, using, since)
+        .exclude(**{column: 0}).values_list(*key_fields, column)
+    }
+
+
+def find_drift(client_id=None, using="default"):
+    """Return {(model, column): {key: (stored, expected)}} for every rollup value that disagrees."""
+    drift = {}
+    for (model, column), expected in expected_stats(client_id, using).items():
+        stored = stored_stats(model, column, client_id, using)
+        diff = {
+            key: (stored.get(key, 0), expected.get(key, 0))
+            for key in stored.keys() | expected.keys()
+            if stored.get(key, 0) != expected.get(key, 0)
+        }
+        if diff:
+            drift[model, column] = diff
+    return drift
+
+
+def rebuild_stats(client_id=None, using="default", since=None):
+    """Recompute the rollups; with `since`, only the daily rows from that day on (a backfill)."""
+    with transaction.atomic(using=using):
+        rows = {}
+        for (model, column), expected in expected_stats(client_id, using, since).items():
+            for key, count in expected.items():
+                if count:
+                    rows.setdefault(model, {}).setdefault(key, {})[column] = count
+        for model in {model for model, _ in ROLLUPS if since is None or model is TaskDailyStat}:
+            _stored_rows(model, client_id, using, since).delete()
+            model.objects.using(using).bulk_create(
+                [model(**dict(key), **counts) for key, counts in rows.get(model, {}).items()],
+                batch_size=1000,
+            )
+    client_ids = [client_id] if client_id is not None else Project._base_manager.using(using).values_list(
+        "client_id", flat=True
+    ).distinct()
+    invalidation.invalidate(client_ids, using)
@@ -0,0 +1,96 @@
+"""
+Query budget assertions for tests.
+
+    class MyTests(QueryBudgetMixin, TestCase):
+        def test_list(self):
+            self.assertQueryBudget(
+                "project-list",
+                lambda: self.client.get(url),
+                budget=4,
+                grow=lambda: make_more_projects(10),
+            )
+
+The call is made once unmeasured to warm per-process caches, measured, `grow`
+adds rows, and it is measured again. The
+test fails if either run exceeds the budget or the second run issues more
+queries than the first; the message lists the SQL fingerprints that caused it.
+Calls that consume their target (deletes) take a `prepare` callable whose
+result is passed to `func` and whose own queries are not counted.
+
+TestRunner (settings.TEST_RUNNER) keeps `manage.py test` from writing the
+log files: their handlers become NullHandler, assertLogs still sees records.
+It also applies TEST_OVERRIDES, which switch off features that get in the
+way of tests; a test that needs one back uses override_settings.
+"""
+import copy
+import logging.config
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.utils.module_loading import import_string
+
+from .performance_monitoring import record_queries
+
+
+def format_fingerprints(recorder, baseline=None, limit=15):
+    lines = []
+    for sql, n in recorder.fingerprints.most_common():
+        before = baseline.fingerprints.get(sql, 0) if baseline else None
+        marker = f" (was {before})" if before is not None and before != n else ""
+        lines.append(f"  {n:>4}x{marker} {sql[:400]}")
+    return "\n".join(lines[:limit])
+
+
+class QueryBudgetMixin:
+    def measure_queries(self, func, prepare=None):
+        args = (prepare(),) if prepare else ()
+        with record_queries() as recorder:
+            result = func(*args)
+        return recorder, result
+
+    def assertQueryBudget(self, name, func, budget, grow=None, prepare=None):
+        func(*((prepare(),) if prepare else ()))
+        small, _ = self.measure_queries(func, prepare)
+        problems = []
+        if small.count > budget:
+            problems.append(f"{small.count} queries exceeds the budget of {budget}")
+
+        large = None
+        if grow is not None:
+            grow()
+            large, _ = self.measure_queries(func, prepare)
+            if large.count > small.count:
+                problems.append(f"query count grew from {small.count} to {large.count} with more rows")
+            elif large.count > budget >= small.count:
+                problems.append(f"{large.count} queries exceeds the budget of {budget}")
+
+        if problems:
+            worst = large or small
+            self.fail(
+                f"{name}: " + "; ".join(problems) + "\n"
+                + format_fingerprints(worst, baseline=small if large else None)
+            )
+        return small.count
+
+
+TEST_OVERRIDES = {
+    'DASHBOARD_WARMER_ENABLED': False,  # its threads cannot see a test's data
+    'THROTTLE_ENABLED': False,  # one client address and a few users make every request
+}
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.overrides = override_settings(**TEST_OVERRIDES)
+        self.overrides.enable()
+        config = copy.deepcopy(settings.LOGGING)
+        for name, handler in config.get('handlers', {}).items():
+            if issubclass(import_string(handler['class']), logging.FileHandler):
+                config['handlers'][name] = {'class': 'logging.NullHandler'}
+        logging.config.dictConfig(config)
+
+    def teardown_test_environment(self, **kwargs):
+        self.overrides.disable()
+        super().teardown_test_environment(**kwargs)
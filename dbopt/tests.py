@@ -1,3 +1,785 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.apps import apps
+from django.db import NotSupportedError, OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3 import base as sqlite3_base
+from django.db.migrations.state import ProjectState
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from dbopt import models as dbopt_models, views as dashboard_views
+from projectmgmt.models import Client, ClientMembership, Comment, Task, User
+from projectmgmt.stats import find_drift
+from .cache import TwoTierCache, get_or_compute
+from .invalidation import current_generation, project_client_ids
+from .operations import BackfillInBatches, Checkpoint, CreateIndexConcurrently
+from .metrics import registry
+from .performance_monitoring import fingerprint, monitor_queries, record_queries
+from .stats import find_drift as find_dashboard_drift
+from .slow_queries import RateLimiter, slow_query_log
+from .warmer import CacheWarmer
+from .testing import QueryBudgetMixin
+
+
+class SQLiteBackendTests(TransactionTestCase):
+    """main.backends.sqlite3 against a database file of its own."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmpdir, "db.sqlite3")
+        connections.settings["sqlite_file"] = {
+            **connections.settings["default"],
+            "NAME": cls.path,
+            "OPTIONS": {"pragmas": {"busy_timeout": 0}, "lock_retries": 6, "lock_backoff": 0.01},
+        }
+        cls.databases = {"default", "sqlite_file"}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["sqlite_file"].close()
+        del connections["sqlite_file"]
+        del connections.settings["sqlite_file"]
+        shutil.rmtree(cls.tmpdir)
+
+    def setUp(self):
+        self.db = connections["sqlite_file"]
+        with self.db.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS item")
+            cursor.execute("CREATE TABLE item (x integer)")
+
+    def other_writer(self):
+        """A plain sqlite3 connection holding the write lock."""
+        other = sqlite3.connect(self.path, timeout=0, check_same_thread=False)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")
+        return other
+
+    def rows(self):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT x FROM item ORDER BY x")
+            return [x for x, in cursor.fetchall()]
+
+    def test_pragmas(self):
+        with self.db.cursor() as cursor:
+            values = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout", "temp_store"):
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 0, "temp_store": 2})
+
+    def test_atomic_blocks_take_the_write_lock_up_front(self):
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using="sqlite_file"):
+            with self.assertRaisesMessage(sqlite3.OperationalError, "database is locked"):
+                other.execute("BEGIN IMMEDIATE")
+
+    def test_locked_statements_are_retried_outside_transactions(self):
+        other = self.other_writer()
+        threading.Timer(0.03, other.commit).start()
+        with self.db.cursor() as cursor:
+            cursor.execute("INSERT INTO item VALUES (%s)", [1])
+        self.assertEqual(self.rows(), [1])
+
+        self.other_writer()  # never released
+        with self.assertRaises(OperationalError), self.db.cursor() as cursor:
+            cursor.execute("INSERT INTO item VALUES (%s)", [2])
+
+    def test_executemany_retry_does_not_repeat_rows(self):
+        executemany = sqlite3_base.SQLiteCursorWrapper.executemany
+        calls = []
+
+        def locked_after_one_row(cursor, query, param_list):
+            calls.append(query)
+            if len(calls) == 1:
+                executemany(cursor, query, param_list[:1])
+                raise sqlite3.OperationalError("database is locked")
+            return executemany(cursor, query, param_list)
+
+        with mock.patch.object(sqlite3_base.SQLiteCursorWrapper, "executemany", locked_after_one_row):
+            with self.db.cursor() as cursor:
+                cursor.executemany("INSERT INTO item VALUES (%s)", [(1,), (2,), (3,)])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.rows(), [1, 2, 3])
+
+
+class QueryMonitoringTests(TestCase):
+    def test_fingerprint_normalises_parameters(self):
+        self.assertEqual(
+            fingerprint("SELECT  \"task2\".\"id\" FROM \"task2\"\n WHERE id IN (%s, %s, %s) AND title = 'it''s' AND n > 42.5"),
+            'SELECT "task2"."id" FROM "task2" WHERE id IN (...) AND title = ? AND n > ?',
+        )
+        self.assertEqual(fingerprint("SELECT 1 WHERE a IN (%s)"), fingerprint("SELECT 7 WHERE a IN (%s, %s)"))
+
+    @override_settings(PERFORMANCE_NPLUSONE_THRESHOLD=5)
+    def test_repeated_statements_are_flagged(self):
+        @monitor_queries
+        def lookups(count):
+            for n in range(count):
+                User.objects.filter(username=f"user{n}").exists()
+
+        with record_queries() as recorder:
+            lookups(4)
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.repeated(), {})
+
+        with self.assertLogs("performance", "WARNING") as logs, record_queries() as recorder:
+            lookups(5)
+        (sql, n), = recorder.repeated().items()
+        self.assertEqual(n, 5)
+        self.assertIn('FROM "user"', sql)
+        self.assertIn("lookups: possible N+1, 5x", logs.output[0])
+
+    def test_headers_report_the_request_queries(self):
+        user = User.objects.create(username="alice")
+        ClientMembership.objects.create(user=user, client=Client.objects.create(name="acme", slug="acme"))
+        api = APIClient()
+        api.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get("/api/clients/")
+        self.assertEqual(int(response["X-Query-Count"]), len(queries))
+        self.assertGreater(len(queries), 0)
+        self.assertRegex(response["X-DB-Time"], r"^\d+\.\d{3}$")
+        self.assertGreaterEqual(float(response["X-Execution-Time"]), float(response["X-DB-Time"]))
+
+
+@override_settings(SLOW_QUERY_SECONDS=0, SLOW_QUERY_LOG_INTERVAL=60, SLOW_QUERY_LOG_PER_MINUTE=1000)
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        slow_query_log.limiter = RateLimiter()
+
+    def entries(self, logs):
+        return [json.loads(line.split(":", 2)[2]) for line in logs.output]
+
+    def test_entry_has_plan_view_and_param_types(self):
+        user = User.objects.create(username="alice")
+        tenant = Client.objects.create(name="acme", slug="acme")
+        ClientMembership.objects.create(user=user, client=tenant, role="owner")
+        api = APIClient()
+        api.force_authenticate(user)
+
+        with self.assertLogs("performance.slow_queries") as logs:
+            api.get("/api/clients/")
+        entries = self.entries(logs)
+        listing = next(e for e in entries if 'FROM "client"' in e["sql"])
+        self.assertEqual(listing["view"], "clients-list")
+        self.assertTrue(listing["plan"])
+        self.assertTrue(listing["indexes"])
+        self.assertNotIn(str(user.pk), json.dumps(listing))
+
+    def test_repeats_are_rate_limited(self):
+        with self.assertLogs("performance.slow_queries") as logs:
+            for _ in range(5):
+                list(User.objects.filter(username="alice"))
+        self.assertEqual(len(self.entries(logs)), 1)
+
+        slow_query_log.limiter.last_logged.clear()
+        with self.assertLogs("performance.slow_queries") as logs:
+            list(User.objects.filter(username="bob"))
+        self.assertEqual(self.entries(logs)[0]["suppressed"], 4)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="alice")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_reported_by_route(self):
+        self.api.get("/api/clients/")
+        body = self.scrape()
+        self.assertIn('http_request_duration_seconds_count{route="clients-list",method="GET",status="200"}', body)
+        self.assertIn('db_queries_per_request_bucket{route="clients-list",le="+Inf"}', body)
+        self.assertIn('http_response_size_bytes_sum{route="clients-list"}', body)
+
+    def test_cache_and_auth_backends_are_reported(self):
+        cache.set("present", 1)
+        cache.get("present")
+        cache.get("absent")
+        APIClient().get("/auth/api/test-auth/", HTTP_AUTHORIZATION="Bearer not-a-token")
+        body = self.scrape()
+        self.assertIn('cache_requests_total{cache="default",result="hit"}', body)
+        self.assertIn('cache_requests_total{cache="default",result="miss"}', body)
+        self.assertIn('auth_backend_duration_seconds_count{backend="jwt",outcome="failed"}', body)
+
+    def test_multiprocess_mode_sums_worker_snapshots(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            other_worker = {"cache_requests_total": [[["other", "hit"], 3]]}
+            with open(os.path.join(directory, "metrics_1.json"), "w") as handle:
+                json.dump(other_worker, handle)
+            with open(os.path.join(directory, "metrics_2.json"), "w") as handle:
+                json.dump(other_worker, handle)
+            self.assertIn('cache_requests_total{cache="other",result="hit"} 6', self.scrape())
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+
+class GenerateDataTests(TestCase):
+    def test_generates_consistent_dataset_and_clears_it(self):
+        options = dict(clients=3, users=10, projects=6, tasks=60, comments=80, stdout=StringIO())
+        call_command("generate_data", **options)
+
+        self.assertEqual(Task.objects.count(), 60)
+        self.assertEqual(dbopt_models.Task.objects.count(), 60)
+        # Assignees are always members of the task's client.
+        self.assertFalse(Task.assignees.through.objects.exclude(
+            user__memberships__client=F("task__project__client")
+        ).exists())
+        self.assertEqual(find_drift(), {})
+        self.assertEqual(find_dashboard_drift(), {})
+
+        call_command("generate_data", clear=True, **options)
+        self.assertEqual(Client.objects.count(), 3)
+        self.assertEqual(Comment.objects.count(), 80)
+
+
+class SingleFlightCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute("k", compute, fresh=60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    def test_stale_value_is_served_while_another_caller_refreshes(self):
+        cache.set("k", {"value": "old", "fresh_until": time.time() - 1}, 60)
+        cache.add("k:lock", "someone else", 30)
+        self.assertEqual(get_or_compute("k", lambda: self.fail("recomputed"), fresh=60, stale=60), "old")
+
+        cache.delete("k:lock")
+        self.assertEqual(get_or_compute("k", lambda: "new", fresh=60, stale=60), "new")
+        self.assertFalse(cache.get("k:lock"))
+
+
+class TwoTierCacheTests(TestCase):
+    def worker(self, **options):
+        # Two backends on one LocMem location share L2 the way two processes share Redis.
+        return TwoTierCache("two-tier-test", {"OPTIONS": {"LABEL": "two-tier", "STAMP_INTERVAL": 60, **options}})
+
+    def setUp(self):
+        self.a, self.b = self.worker(), self.worker()
+        self.a.clear()
+
+    def test_reads_are_served_from_l1(self):
+        self.a.set("k", {"v": 1})
+        self.assertEqual(self.b.get("k"), {"v": 1})
+        self.b.cache.delete("k")  # behind L1's back
+        self.assertEqual(self.b.get("k"), {"v": 1})
+        self.assertEqual(self.b.get_many(["k", "absent"]), {"k": {"v": 1}})
+        values = registry.local_values()["cache_tier_requests_total"]
+        self.assertGreaterEqual(values[("two-tier", "l1", "hit")], 2)
+        self.assertGreaterEqual(values[("two-tier", "l2", "miss")], 1)
+
+    def test_other_processes_writes_are_seen_after_the_stamp_interval(self):
+        self.a.set("k", 1)
+        self.b.get("k")
+        self.a.set("k", 2)
+        self.assertEqual(self.b.get("k"), 1)
+        self.b.next_stamp_check = 0  # the interval has passed
+        self.assertEqual(self.b.get("k"), 2)
+        self.a.incr("k")
+        self.b.next_stamp_check = 0
+        self.assertEqual(self.b.get("k"), 3)
+        self.a.delete("k")
+        self.b.next_stamp_check = 0
+        self.assertIsNone(self.b.get("k"))
+
+    def test_l1_copies_expire_and_are_bounded(self):
+        b = self.worker(L1_TIMEOUT=5, L1_MAX_ENTRIES=2)
+        self.a.set_many({"x": 1, "y": 2, "z": 3})
+        self.assertEqual(b.get_many(["x", "y", "z"]), {"x": 1, "y": 2, "z": 3})
+        self.assertEqual(len(b.l1), 2)
+        self.a.cache.set("z", 4)  # behind the stamps' back
+        with mock.patch("dbopt.cache.time.monotonic", return_value=time.monotonic() + 6):
+            self.assertEqual(b.get("z"), 4)
+
+    def test_own_writes_keep_l1_warm(self):
+        self.a.get("warm-up")
+        self.a.set("k", 1)
+        self.a.next_stamp_check = 0
+        self.a.get("k")
+        self.assertIn(("k", None), self.a.l1)
+
+
+class DashboardTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="alice", first_name="Alice", last_name="Smith")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenant = dbopt_models.Client.objects.create(name="acme")
+            self.tenant.members.add(self.user)
+            active = dbopt_models.Project.objects.create(client=self.tenant, name="web", status="active")
+            dbopt_models.Project.objects.create(client=self.tenant, name="old", status="completed")
+            for status in ("completed", "pending", "pending"):
+                dbopt_models.Task.objects.create(project=active, title=status, status=status, assignee=self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = f"/api/dbopt/dashboard/{self.tenant.pk}/"
+
+    def test_aggregates(self):
+        data = self.api.get(self.url).json()
+        self.assertEqual(data["total_projects"], 2)
+        self.assertEqual(data["active_projects"], [
+            {"id": data["active_projects"][0]["id"], "name": "web", "total_tasks": 3,
+             "completed_tasks": 1, "progress": 33.33,
+             "recent_tasks": data["active_projects"][0]["recent_tasks"]},
+        ])
+        self.assertEqual(len(data["recent_tasks"]), 3)
+        self.assertEqual(data["team_stats"][str(self.user.pk)], {
+            "name": "Alice Smith", "total_tasks": 3, "completed_tasks": 1, "pending_tasks": 2,
+        })
+
+    @override_settings(DASHBOARD_RECENT_PER_PROJECT=2)
+    def test_recent_tasks_per_project(self):
+        other = dbopt_models.Project.objects.create(client=self.tenant, name="api", status="active")
+        dbopt_models.Task.objects.create(project=other, title="only", status="pending")
+        projects = {project["name"]: project for project in self.api.get(self.url).json()["active_projects"]}
+        self.assertEqual([task["title"] for task in projects["api"]["recent_tasks"]], ["only"])
+        web = dbopt_models.Task.objects.filter(project__name="web").order_by("-created_at", "-id")
+        self.assertEqual(len(projects["web"]["recent_tasks"]), 2)
+        self.assertLessEqual(
+            {task["id"] for task in projects["web"]["recent_tasks"]}, set(web.values_list("id", flat=True))
+        )
+
+    def test_query_budget(self):
+        def add_project():
+            project = dbopt_models.Project.objects.create(client=self.tenant, name="more", status="active")
+            dbopt_models.Task.objects.create(project=project, title="t", status="pending", assignee=self.user)
+
+        self.assertQueryBudget(
+            "dashboard (recompute)", lambda: (cache.clear(), self.api.get(self.url)), 6, grow=add_project
+        )
+        self.api.get(self.url)
+        self.assertQueryBudget("dashboard (cached)", lambda: self.api.get(self.url), 0)
+
+    def test_unknown_client_is_404_and_cached(self):
+        unknown = dbopt_models.Client.objects.order_by("-pk").first().pk + 1
+        url = f"/api/dbopt/dashboard/{unknown}/"
+        self.assertEqual(self.api.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get(url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            dbopt_models.Client.objects.create(pk=unknown, name="new").members.add(self.user)
+        self.assertEqual(self.api.get(url).status_code, 200)
+
+    def test_only_members_can_read_it(self):
+        mallory = User.objects.create(username="mallory")
+        other = APIClient()
+        other.force_authenticate(mallory)
+        self.assertEqual(self.api.get(self.url).status_code, 200)
+        self.assertEqual(other.get(self.url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenant.members.add(mallory)
+        self.assertEqual(other.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            mallory.dbopt_clients.clear()
+        self.assertEqual(other.get(self.url).status_code, 404)
+
+
+class GenerationInvalidationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme = dbopt_models.Client.objects.create(name="acme")
+            self.globex = dbopt_models.Client.objects.create(name="globex")
+            self.project = dbopt_models.Project.objects.create(client=self.acme, name="web", status="active")
+            self.other = dbopt_models.Project.objects.create(client=self.globex, name="api", status="active")
+            self.task = dbopt_models.Task.objects.create(project=self.project, title="a", status="pending")
+
+    def generations(self):
+        return current_generation(self.acme.pk), current_generation(self.globex.pk)
+
+    def assertBumped(self, acme, globex, action):
+        before = self.generations()
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+        after = self.generations()
+        self.assertEqual((after[0] != before[0], after[1] != before[1]), (acme, globex))
+
+    def test_saving_a_task_costs_no_lookup_queries(self):
+        task = dbopt_models.Task.objects.get(pk=self.task.pk)
+        task.status = "completed"
+        self.assertBumped(True, False, task.save)
+
+        def toggle():
+            task.status = "completed" if task.status == "pending" else "pending"
+            return task
+
+        # The update, the two per-status rollup rows it moves between and the day's completed count.
+        self.assertQueryBudget("task save", lambda task: task.save(), 4, prepare=toggle)
+
+    def test_moving_a_task_invalidates_both_clients(self):
+        task = dbopt_models.Task.objects.get(pk=self.task.pk)
+        task.project = self.other
+        self.assertBumped(True, True, task.save)
+
+    def test_bulk_operations_invalidate(self):
+        tasks = dbopt_models.Task.objects
+        self.assertBumped(True, False, lambda: tasks.filter(project=self.project).update(status="completed"))
+        self.assertBumped(True, True, lambda: tasks.filter(pk=self.task.pk).update(project=self.other))
+        self.assertBumped(False, True, lambda: tasks.bulk_create(
+            [dbopt_models.Task(project=self.other, title="b", status="pending")]
+        ))
+        self.assertBumped(False, True, lambda: tasks.filter(project=self.other).delete())
+        self.assertBumped(True, False, lambda: dbopt_models.Project.objects.filter(client=self.acme).delete())
+        self.assertBumped(False, True, lambda: dbopt_models.Project.objects.bulk_create(
+            [dbopt_models.Project(client=self.globex, name="docs", status="active")]
+        ))
+
+    def test_querysets_must_name_their_client_lookup(self):
+        with self.assertRaisesMessage(TypeError, "NoLookupQuerySet must set client_lookup."):
+            type("NoLookupQuerySet", (dbopt_models.DashboardQuerySet,), {"__module__": __name__})
+
+    def test_rolled_back_writes_do_not_invalidate(self):
+        def rolled_back():
+            with transaction.atomic():
+                dbopt_models.Task.objects.filter(pk=self.task.pk).update(status="completed")
+                transaction.set_rollback(True)
+        self.assertBumped(False, False, rolled_back)
+
+    def member_api(self):
+        user = User.objects.create(username="alice")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme.members.add(user)
+        api = APIClient()
+        api.force_authenticate(user)
+        return api
+
+    def test_dashboard_reflects_bulk_update(self):
+        api = self.member_api()
+        url = f"/api/dbopt/dashboard/{self.acme.pk}/"
+        self.assertEqual(api.get(url).json()["active_projects"][0]["completed_tasks"], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            dbopt_models.Task.objects.filter(project=self.project).update(status="completed")
+        self.assertEqual(api.get(url).json()["active_projects"][0]["completed_tasks"], 1)
+
+    @override_settings(DASHBOARD_CACHE_SECONDS=0)
+    def test_stale_copies_are_not_served_after_a_write(self):
+        api = self.member_api()
+        url = f"/api/dbopt/dashboard/{self.acme.pk}/"
+        view = dashboard_views.OptimizedProjectDashboardView()
+        self.assertEqual(api.get(url).json()["active_projects"][0]["completed_tasks"], 0)
+        # Another request is refreshing the aged-out entry: the stale copy is served meanwhile...
+        cache.add(f"{view.get_cache_key(self.acme.pk)}:lock", "elsewhere")
+        with self.assertNumQueries(0):
+            self.assertEqual(api.get(url).status_code, 200)
+        # ...but a write moves the dashboard to a new key, where nothing from before it is found.
+        with self.captureOnCommitCallbacks(execute=True):
+            dbopt_models.Task.objects.filter(pk=self.task.pk).update(status="completed")
+        self.assertEqual(api.get(url).json()["active_projects"][0]["completed_tasks"], 1)
+
+
+class DashboardRollupTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme = dbopt_models.Client.objects.create(name="acme")
+            self.globex = dbopt_models.Client.objects.create(name="globex")
+            self.web = dbopt_models.Project.objects.create(client=self.acme, name="web", status="active")
+            self.api = dbopt_models.Project.objects.create(client=self.globex, name="api", status="active")
+            self.task = dbopt_models.Task.objects.create(
+                project=self.web, title="a", assignee=self.alice, status="pending"
+            )
+
+    maxDiff = None
+
+    def assertConsistent(self):
+        self.assertEqual(find_dashboard_drift(), {})
+
+    def test_single_row_writes(self):
+        self.task.status = "completed"
+        self.task.save()
+        self.task.assignee = self.bob
+        self.task.save()
+        self.task.project = self.api
+        self.task.save()
+        self.assertConsistent()
+        self.assertEqual(
+            dbopt_models.AssigneeTaskStat.objects.get(client=self.globex, assignee=self.bob).count, 1
+        )
+        self.task.delete()
+        self.assertConsistent()
+
+    def test_bulk_writes(self):
+        tasks = dbopt_models.Task.objects
+        tasks.bulk_create([
+            dbopt_models.Task(project=self.web, title=str(i), assignee=self.bob, status="pending") for i in range(3)
+        ])
+        tasks.filter(assignee=self.bob).update(status="completed")
+        tasks.filter(assignee=self.alice).update(assignee=self.bob, project=self.api)
+        self.assertConsistent()
+        moved = list(tasks.filter(project=self.web))
+        for task in moved:
+            task.project = self.api
+        tasks.bulk_update(moved, ["project"])
+        self.assertConsistent()
+        tasks.filter(status="completed").delete()
+        self.assertConsistent()
+        tasks.all().delete()
+        self.assertFalse(dbopt_models.ProjectTaskStat.objects.exclude(count=0).exists())
+
+    def test_project_moves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dbopt_models.Project.objects.filter(pk=self.web.pk).update(client=self.globex)
+        self.assertConsistent()
+        # The cached project -> client mapping follows the move, so new tasks go to the new client.
+        before = current_generation(self.globex.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            dbopt_models.Task.objects.create(project_id=self.web.pk, title="b", assignee=self.bob, status="pending")
+        self.assertNotEqual(current_generation(self.globex.pk), before)
+        self.assertConsistent()
+        project = dbopt_models.Project.objects.get(pk=self.web.pk)
+        project.client = self.acme
+        project.save()
+        self.assertConsistent()
+        dbopt_models.Project.objects.filter(pk=self.web.pk).delete()
+        self.assertConsistent()
+        self.assertEqual(project_client_ids({self.web.pk}), {})
+        self.assertFalse(dbopt_models.AssigneeTaskStat.objects.exclude(count=0).exists())
+
+    def test_command_reports_and_repairs_drift(self):
+        dbopt_models.Task._base_manager.filter(pk=self.task.pk).update(status="completed")
+        with self.assertRaises(SystemExit):
+            call_command("dashboard_stats", stdout=StringIO(), stderr=StringIO())
+        call_command("dashboard_stats", rebuild=True, stdout=StringIO())
+        self.assertConsistent()
+
+
+class ThroughputTests(TestCase):
+    def setUp(self):
+        self.tenant = dbopt_models.Client.objects.create(name="acme")
+        self.project = dbopt_models.Project.objects.create(client=self.tenant, name="web", status="active")
+        user = User.objects.create(username="alice")
+        self.tenant.members.add(user)
+        self.api = APIClient()
+        self.api.force_authenticate(user)
+        self.url = f"/api/dbopt/throughput/{self.tenant.pk}/"
+
+    def add_task(self, created, completed=None):
+        task = dbopt_models.Task.objects.create(
+            project=self.project, title="t", status="completed" if completed else "pending"
+        )
+        # Backdate through the base manager, which leaves the rollups alone; the backfill repairs them.
+        dbopt_models.Task._base_manager.filter(pk=task.pk).update(
+            created_at=datetime(*created, tzinfo=dt_timezone.utc),
+            completed_at=datetime(*completed, tzinfo=dt_timezone.utc) if completed else None,
+        )
+
+    def test_backfilled_weeks_are_gap_filled(self):
+        self.add_task((2026, 9, 1))
+        self.add_task((2026, 9, 2), (2026, 9, 15))
+        self.add_task((2026, 9, 16))
+        call_command("backfill_throughput", stdout=StringIO())
+        self.assertEqual(find_dashboard_drift(), {})
+
+        response = self.api.get(self.url, {"start": "2026-09-07", "end": "2026-09-27", "bucket": "week"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row["period"], row["created"], row["completed"], row["cumulative_created"], row["cumulative_completed"])
+             for row in response.json()["series"]],
+            [("2026-09-07", 0, 0, 2, 0), ("2026-09-14", 1, 1, 3, 1), ("2026-09-21", 0, 0, 3, 1)],
+        )
+
+    def test_completions_count_on_the_day_they_happen(self):
+        task = dbopt_models.Task.objects.create(project=self.project, title="t", status="pending")
+        task.status = "completed"
+        task.save()
+        series = self.api.get(self.url).json()["series"]
+        self.assertEqual(len(series), 30)
+        self.assertEqual((series[-1]["created"], series[-1]["completed"]), (1, 1))
+        dbopt_models.Task.objects.filter(pk=task.pk).update(status="pending")
+        self.assertEqual(self.api.get(self.url).json()["series"][-1]["completed"], 0)
+
+    def test_only_members_can_read_it(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username="mallory"))
+        self.assertEqual(self.api.get(self.url).status_code, 200)
+        self.assertEqual(other.get(self.url).status_code, 404)
+        self.assertEqual(self.api.get("/api/dbopt/throughput/999999/").status_code, 404)
+
+    def test_rejects_bad_ranges(self):
+        self.assertEqual(self.api.get(self.url, {"bucket": "year"}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {"start": "2026-02-01", "end": "2026-01-01"}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {"start": "1990-01-01", "end": "2026-01-01"}).status_code, 400)
+
+
+class CacheWarmerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.tenant = dbopt_models.Client.objects.create(name="acme")
+        self.project = dbopt_models.Project.objects.create(client=self.tenant, name="web", status="active")
+        user = User.objects.create(username="alice")
+        self.tenant.members.add(user)
+        self.api = APIClient()
+        self.api.force_authenticate(user)
+        self.url = f"/api/dbopt/dashboard/{self.tenant.pk}/"
+
+    def test_bursts_are_debounced_and_cold_clients_skipped(self):
+        warmed = []
+        warmer = CacheWarmer(warm=warmed.append, delay=0.05, max_delay=1, workers=1, top_k=1)
+        warmer.record_request(1)
+        for _ in range(5):
+            warmer.schedule([1, 2])
+        self.assertTrue(warmer.wait_idle())
+        self.assertEqual(warmed, [1])
+
+    def test_steady_writes_are_refilled_within_max_delay(self):
+        warmer = CacheWarmer(warm=lambda client_id: None, delay=5, max_delay=0.5)
+        warmer.record_request(1)
+        first = time.monotonic()
+        warmer.schedule([1])
+        with warmer.lock:
+            self.assertLessEqual(warmer.due[1][0], first + 0.5 + 0.1)
+
+    @override_settings(DASHBOARD_WARMER_ENABLED=True)
+    def test_writes_refill_the_dashboards_of_hot_clients(self):
+        with mock.patch("dbopt.warmer.dashboard_warmer", CacheWarmer(delay=0.01)) as warmer:
+            self.api.get(self.url)
+            dbopt_models.Task.objects.create(project=self.project, title="new", status="pending")
+            self.assertTrue(warmer.wait_idle())
+        with self.assertNumQueries(0):
+            data = self.api.get(self.url).json()
+        self.assertEqual(data["active_projects"][0]["total_tasks"], 1)
+
+    def test_command_prewarms_every_dashboard(self):
+        call_command("warm_cache", stdout=StringIO())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get(self.url).status_code, 200)
+
+
+class IndexAdvisorTests(TestCase):
+    def advise(self, log=""):
+        out = StringIO()
+        call_command("index_advisor", app=["dbopt", "projectmgmt"], log=log, json=True, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_reports_duplicates_and_prefixes_with_how_to_drop_them(self):
+        # Raw SQL repeating Task.Meta.indexes, as 0002 did until 0006 dropped it.
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE INDEX task_status_idx ON dbopt_task (status)")
+            cursor.execute("CREATE INDEX task_project_idx ON dbopt_task (project_id)")
+        drops = {drop["index"]: drop for drop in self.advise()["redundant"]}
+        self.assertEqual(drops["task_status_idx"]["kind"], "duplicate")
+        self.assertEqual(
+            drops["task_status_idx"]["how"], "DropIndexConcurrently('task_status_idx', 'dbopt_task', ['status'])"
+        )
+        self.assertEqual(drops["task_project_idx"]["kind"], "prefix")
+        # Index(slug) next to the unique constraint on Client.slug.
+        slug = next(drop for drop in drops.values() if drop["table"] == "client" and drop["columns"] == ["slug"])
+        self.assertEqual(slug["how"], "remove it from Client.Meta.indexes")
+        self.assertNotIn("recent_project_tasks_idx", drops)
+        self.assertFalse(any(drop["source"].endswith("(unique=True)") for drop in drops.values()))
+
+    def test_duplicate_raw_sql_indexes_are_dropped(self):
+        with connection.cursor() as cursor:
+            indexes = set(connection.introspection.get_constraints(cursor, "dbopt_task"))
+            indexes |= set(connection.introspection.get_constraints(cursor, "dbopt_project"))
+        self.assertFalse(indexes & {"task_status_idx", "task_recent_idx", "project_status_idx", "project_client_idx"})
+        self.assertIn("recent_project_tasks_idx", indexes)
+        redundant = self.advise()["redundant"]
+        self.assertFalse([d for d in redundant if d["table"].startswith("dbopt_") and d["source"] == "raw SQL"])
+
+    def test_suggests_missing_composites_from_scanned_plans(self):
+        sql = (
+            'SELECT "dbopt_task"."id" FROM "dbopt_task" WHERE ("dbopt_task"."title" = %s '
+            'AND "dbopt_task"."created_at" >= %s) ORDER BY "dbopt_task"."created_at" DESC'
+        )
+        covered = 'SELECT "dbopt_task"."id" FROM "dbopt_task" WHERE "dbopt_task"."project_id" = %s'
+        with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as log:
+            for statement, plan, suppressed in (
+                (sql, ["SCAN dbopt_task"], 4),
+                (covered, ["SCAN dbopt_task"], 0),
+                ("SELECT 1", [], 0),
+            ):
+                log.write(json.dumps({"sql": statement, "plan": plan, "suppressed": suppressed}) + "\n")
+        self.addCleanup(os.unlink, log.name)
+        self.assertEqual(
+            [(m["table"], m["columns"], m["statements"]) for m in self.advise(log.name)["missing"]],
+            [("dbopt_task", ["title", "created_at"], 5)],
+        )
+
+
+class OnlineMigrationTests(TransactionTestCase):
+    def setUp(self):
+        self.state = ProjectState.from_apps(apps)
+
+    def run_operation(self, operation, backwards=False):
+        with connection.schema_editor(atomic=False) as editor:
+            method = operation.database_backwards if backwards else operation.database_forwards
+            method("dbopt", editor, self.state, self.state)
+
+    def test_index_operations_are_idempotent(self):
+        operation = CreateIndexConcurrently("task_title_recent_idx", "dbopt_task", ["title", "-created_at"])
+        with connection.cursor() as cursor:
+            indexes = lambda: connection.introspection.get_constraints(cursor, "dbopt_task")
+            self.run_operation(operation)
+            self.run_operation(operation)
+            self.assertEqual(indexes()["task_title_recent_idx"]["columns"], ["title", "created_at"])
+            self.run_operation(operation, backwards=True)
+            self.run_operation(operation, backwards=True)
+            self.assertNotIn("task_title_recent_idx", indexes())
+
+    def test_backfill_resumes_from_its_checkpoint(self):
+        tenant = dbopt_models.Client.objects.create(name="acme")
+        project = dbopt_models.Project.objects.create(client=tenant, name="web", status="active")
+        tasks = [dbopt_models.Task.objects.create(project=project, title="old", status="pending") for _ in range(5)]
+        operation = BackfillInBatches("task", {"title": "new"}, where={"title": "old"}, batch_size=2, pause=0)
+        self.addCleanup(self.run_operation, operation, backwards=True)
+        # A deploy that died after the first two rows.
+        Checkpoint(connection, operation.checkpoint_name("dbopt")).save(tasks[1].pk, 2)
+
+        with self.assertLogs("performance.migrations") as logs:
+            self.run_operation(operation)
+        titles = list(dbopt_models.Task.objects.order_by("pk").values_list("title", flat=True))
+        self.assertEqual(titles, ["old", "old", "new", "new", "new"])
+        self.assertIn("finished, 5 rows", logs.output[-1])
+
+        # Finished backfills are not repeated; they refuse to run as one transaction.
+        dbopt_models.Task.objects.filter(pk=tasks[4].pk).update(title="old")
+        with self.assertLogs("performance.migrations"):
+            self.run_operation(operation)
+        self.assertEqual(dbopt_models.Task.objects.get(pk=tasks[4].pk).title, "old")
+        with self.assertRaisesMessage(NotSupportedError, "atomic = False"), transaction.atomic():
+            operation._backfill(mock.Mock(connection=connection), dbopt_models.Task, {"title": "new"}, "atomic")
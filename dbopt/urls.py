@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import OptimizedProjectDashboardView, TaskThroughputView
+
+urlpatterns = [
+    path('dashboard/<int:client_id>/', OptimizedProjectDashboardView.as_view(), name='dbopt-dashboard'),
+    path('throughput/<int:client_id>/', TaskThroughputView.as_view(), name='dbopt-throughput'),
+]
@@ -1,136 +1,232 @@
+from datetime import date, timedelta
 
-from django.db.models import Count, Case, When, FloatField, Q,Value, Cast
-from .performance_monitoring import monitor_queries
-from rest_framework.views import APIView
-from django.db.models.functions import Concat
+from django.conf import settings
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Client, User, Project, Task
-from django.core.cache import cache
+from rest_framework.views import APIView
+
+from . import warmer
+from .cache import get_or_compute
+from .invalidation import current_generation
+from .models import AssigneeTaskStat, Client, Project, Task, TaskDailyStat
+from .performance_monitoring import monitor_queries
+
 
-# views.py - This view has multiple performance issues
 class OptimizedProjectDashboardView(APIView):
-    @monitor_queries
+    """
+    GET /api/dbopt/dashboard/{client_id}/
+
+    Only the client's members may read it; anyone else, like an unknown id, gets a 404.
+
+    Six queries when recomputed: client, members, per-project task counts, recent tasks, the
+    latest DASHBOARD_RECENT_PER_PROJECT tasks of every active project and per-assignee counts,
+    the counts read from the dbopt.stats rollups rather than the task table; none on a cache
+    hit. The entry keeps the member ids to check requests against, and an unknown id is cached
+    as such until a client with that id is created.
+    The result is cached for DASHBOARD_CACHE_SECONDS and then served stale for up to
+    DASHBOARD_STALE_SECONDS while one request recomputes it. The cache key embeds the client's
+    generation, so stale serving only covers entries that aged out: after a write the new key
+    is empty, nothing from before the write is served, and requests wait on the one that fills
+    it. dbopt.warmer refills the entries of frequently requested clients shortly after writes
+    bump the generation, so those requests rarely find the key empty.
+    """
+
     def get_cache_key(self, client_id):
-        """Generate cache key for dashboard data"""
-        return f"dashboard_client_{client_id}"
-    
+        """Generate cache key for dashboard data; writes bump the generation instead of deleting it."""
+        return f"dashboard_client_{client_id}_g{current_generation(client_id)}"
+
+    @monitor_queries
     def get(self, request, client_id):
-        cache_key = self.get_cache_key(client_id)
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data)
-        
-        client = get_object_or_404(Client, id=client_id)
-        
-        projects = Project.objects.select_related('client').filter(client=client)
-        
-        dashboard_data = {
+        entry = self.dashboard(client_id)
+        if entry is None or request.user.pk not in entry['members']:
+            raise Http404
+        warmer.record_request(client_id)
+        return Response(entry['dashboard'])
+
+    def dashboard(self, client_id):
+        """{'members': [user ids], 'dashboard': {...}} from the cache, or None for an unknown client."""
+        return get_or_compute(
+            self.get_cache_key(client_id),
+            lambda: self.compute(client_id),
+            fresh=getattr(settings, 'DASHBOARD_CACHE_SECONDS', 600),
+            stale=getattr(settings, 'DASHBOARD_STALE_SECONDS', 300),
+            lock_timeout=getattr(settings, 'DASHBOARD_LOCK_SECONDS', 30),
+        )
+
+    def compute(self, client_id):
+        client = Client.objects.filter(id=client_id).first()
+        if client is None:
+            return None
+        return {'members': list(client.members.values_list('id', flat=True)), 'dashboard': self.build(client)}
+
+    def build(self, client):
+        projects = Project.objects.filter(client=client).annotate(
+            total_tasks=Coalesce(Sum('task_stats__count'), 0),
+            completed_tasks=Coalesce(Sum('task_stats__count', filter=Q(task_stats__status='completed')), 0),
+        ).order_by('name').values('id', 'name', 'status', 'total_tasks', 'completed_tasks')
+        projects = list(projects)
+
+        recent_tasks = Task.objects.filter(project__client=client).select_related(
+            'project', 'assignee'
+        ).order_by('-created_at')[:10]
+
+        active = {project['id']: project for project in projects if project['status'] == 'active'}
+        recent_by_project = {project_id: [] for project_id in active}
+        for task in self.recent_per_project(active):
+            recent_by_project[task.project_id].append(self.serialize_task(task, active[task.project_id]['name']))
+
+        team = AssigneeTaskStat.objects.filter(client=client).values(
+            'assignee_id', 'assignee__first_name', 'assignee__last_name'
+        ).annotate(
+            total_tasks=Sum('count'),
+            completed_tasks=Coalesce(Sum('count', filter=Q(status='completed')), 0),
+            pending_tasks=Coalesce(Sum('count', filter=Q(status='pending')), 0),
+        ).filter(total_tasks__gt=0).order_by()
+
+        return {
             'client_name': client.name,
-            'total_projects': projects.count(),
-            'active_projects': [],
-            'recent_tasks': [],
-            'team_stats': {}
+            'total_projects': len(projects),
+            'active_projects': [
+                {
+                    'id': project['id'],
+                    'name': project['name'],
+                    'total_tasks': project['total_tasks'],
+                    'completed_tasks': project['completed_tasks'],
+                    'progress': round(project['completed_tasks'] / project['total_tasks'] * 100, 2)
+                                if project['total_tasks'] > 0 else 0,
+                    'recent_tasks': recent_by_project[project['id']],
+                }
+                for project in active.values()
+            ],
+            'recent_tasks': [self.serialize_task(task, task.project.name) for task in recent_tasks],
+            'team_stats': {
+                str(member['assignee_id']): {
+                    'name': f"{member['assignee__first_name']} {member['assignee__last_name']}",
+                    'total_tasks': member['total_tasks'],
+                    'completed_tasks': member['completed_tasks'],
+                    'pending_tasks': member['pending_tasks'],
+                }
+                for member in team
+            },
         }
-        
-        active_projects = projects.filter(status='active').annotate(
-            total_tasks=Count('task'),
-            completed_tasks=Count('task_set', filter=Q(task__status='completed'))
-        ).values('id', 'name', 'total_tasks', 'completed_tasks')
-        
-        dashboard_data['active_projects'] = [
-            {
-                'id': project['id'],
-                'name': project['name'],
-                'total_tasks': project['total_tasks'],
-                'completed_tasks': project['completed_tasks'],
-                'progress': round((project['completed_tasks'] / project['total_tasks'] * 100), 2) 
-                           if project['total_tasks'] > 0 else 0
-            } for project in active_projects
-        ]
-        
-        # Get recent tasks across all projects
-        # all_tasks = []
-        # for project in projects:
-        #     project_tasks = Task.objects.filter(project=project).order_by('-created_at')
-        #     for task in project_tasks:
-        #         task.project_name = project.name
-        #         task.assignee_name = task.assignee.first_name + ' ' + task.assignee.last_name if task.assignee else 'Unassigned'
-        #         all_tasks.append(task)
-        
-        
-        #--------------------------------------------------------------------------------new implementation------------------------------------------------------
-        recent_tasks = Task.objects.select_related('project', 'assignee').filter(
-            project__client=client
-        ).annotate(
-            project_name=Value('project__name'),
-            assignee_name=Case(
-                When(assignee__isnull=True, then=Value('Unassigned')),
-                default=Concat('assignee__first_name', Value(' '), 'assignee__last_name')
-            )
-        ).order_by('-created_at')[:10]
-        
-        dashboard_data['recent_tasks'] = [
-            {
-                'id': task.id,
-                'title': task.title,
-                'project_name': task.project.name,
-                'assignee_name': task.assignee_name if hasattr(task, 'assignee_name') else 
-                                (f"{task.assignee.first_name} {task.assignee.last_name}" if task.assignee else 'Unassigned'),
-                'created_at': task.created_at
-            } for task in recent_tasks
-        ]     
-           
-        #------------------------------------------------------------------------old implementation with issues -------------------------------------------------------   
-        # Sort and get recent 10
-        # all_tasks.sort(key=lambda x: x.created_at, reverse=True)
-        # dashboard_data['recent_tasks'] = [
-        #     {
-        #         'id': task.id,
-        #         'title': task.title,
-        #         'project_name': task.project_name,
-        #         'assignee_name': task.assignee_name,
-        #         'created_at': task.created_at
-        #     } for task in all_tasks[:10]
-        # ]
-        
-        # Team statistics
-        # team_members = User.objects.filter(clients=client)
-        # for member in team_members:
-        #     member_tasks = Task.objects.filter(assignee=member, project_client=client)
-        #     dashboard_data['team_stats'][member.id] = {
-        #         'name': member.first_name + ' ' + member.last_name,
-        #         'total_tasks': member_tasks.count(),
-        #         'completed_tasks': member_tasks.filter(status='completed').count(),
-        #         'pending_tasks': member_tasks.filter(status='pending').count()
-        #     }
-        
-        # return Response(dashboard_data)
-        
-        #Team stats new implementation
-        
-        # team_members = User.objects.filter(clients=client).annotate(
-        #     full_name=Concat('first_name', Value(' '), 'last_name')
-        # )
-        
-        
-        #-------------------------------------------------------------------------------new implementation------------------------------------------------------
-        team_members_with_stats = User.objects.filter(clients=client).annotate(
-            total_tasks=Count('task_set', filter=Q(task__project__client=client)),
-            completed_tasks=Count('task_set', filter=Q(task__project__client=client, task__status='completed')),
-            pending_tasks=Count('task_set', filter=Q(task__project__client=client, task__status='pending')),
-            full_name=Concat('first_name', Value(' '), 'last_name')
-        ).values('id', 'full_name', 'total_tasks', 'completed_tasks', 'pending_tasks')
-        
-
-        for member in team_members_with_stats:
-            dashboard_data['team_stats'][member['id']] = {
-                'name': member['full_name'],
-                'total_tasks': member['total_tasks'],
-                'completed_tasks': member['completed_tasks'],
-                'pending_tasks': member['pending_tasks']
-            }
-        
-        cache.set(cache_key, dashboard_data, 600)  # Cache for 5 minutes
-        
-        return Response(dashboard_data)
\ No newline at end of file
+
+    def recent_per_project(self, projects):
+        """
+        The latest N tasks of each project in one query:
+        ROW_NUMBER() OVER (PARTITION BY project_id ORDER BY created_at DESC) <= N,
+        which walks recent_project_tasks_idx (project_id, created_at DESC).
+        """
+        if not projects:
+            return []
+        limit = getattr(settings, 'DASHBOARD_RECENT_PER_PROJECT', 5)
+        return Task.objects.filter(project_id__in=projects).annotate(
+            row_number=Window(RowNumber(), partition_by=F('project_id'), order_by=F('created_at').desc()),
+        ).filter(row_number__lte=limit).select_related('assignee').order_by('project_id', 'row_number')
+
+    @staticmethod
+    def serialize_task(task, project_name):
+        return {
+            'id': task.id,
+            'title': task.title,
+            'project_name': project_name,
+            'assignee_name': f"{task.assignee.first_name} {task.assignee.last_name}"
+                             if task.assignee else 'Unassigned',
+            'created_at': task.created_at,
+        }
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+class TaskThroughputView(APIView):
+    """
+    GET /api/dbopt/throughput/{client_id}/?start=YYYY-MM-DD&end=YYYY-MM-DD&bucket=day|week|month&project={id}
+
+    Tasks created and completed per bucket, with running totals for burn-up charts, read from the
+    TaskDailyStat rollup only: one query for the range and one for the totals before it, after the
+    client lookup, which also checks that the requester is a member (a 404 otherwise). Buckets
+    with no activity are filled in with zeros. Defaults to the last 30 days by day.
+    """
+
+    buckets = ('day', 'week', 'month')
+    max_buckets = 1000
+
+    def get(self, request, client_id):
+        client = get_object_or_404(Client, id=client_id, members=request.user)
+        start, end, bucket = self.parse_range(request.query_params)
+        project_id = request.query_params.get('project')
+
+        rows = TaskDailyStat.objects.filter(client=client)
+        if project_id:
+            if not project_id.isdigit():
+                raise ValidationError("project must be an integer.")
+            rows = rows.filter(project_id=int(project_id))
+
+        before = rows.filter(day__lt=start).aggregate(
+            created=Coalesce(Sum('created'), 0), completed=Coalesce(Sum('completed'), 0),
+        )
+        totals = {}
+        for day, created, completed in rows.filter(day__range=(start, end)).values('day').annotate(
+            created_sum=Sum('created'), completed_sum=Sum('completed'),
+        ).order_by().values_list('day', 'created_sum', 'completed_sum'):
+            counts = totals.setdefault(bucket_start(day, bucket), [0, 0])
+            counts[0] += created
+            counts[1] += completed
+
+        series, cumulative_created, cumulative_completed = [], before['created'], before['completed']
+        period = bucket_start(start, bucket)
+        while period <= end:
+            created, completed = totals.get(period, (0, 0))
+            cumulative_created += created
+            cumulative_completed += completed
+            series.append({
+                'period': period,
+                'created': created,
+                'completed': completed,
+                'cumulative_created': cumulative_created,
+                'cumulative_completed': cumulative_completed,
+            })
+            period = next_bucket(period, bucket)
+
+        return Response({
+            'client_id': client.id,
+            'project_id': int(project_id) if project_id else None,
+            'bucket': bucket,
+            'start': start,
+            'end': end,
+            'series': series,
+        })
+
+    def parse_range(self, params):
+        bucket = params.get('bucket', 'day')
+        if bucket not in self.buckets:
+            raise ValidationError(f"bucket must be one of {', '.join(self.buckets)}.")
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=29)
+        except ValueError:
+            raise ValidationError("start and end must be dates in YYYY-MM-DD form.")
+        if start > end:
+            raise ValidationError("start must not be after end.")
+        span = {'day': 1, 'week': 7, 'month': 28}[bucket]
+        if (end - start).days // span > self.max_buckets:
+            raise ValidationError(f"The range spans more than {self.max_buckets} buckets; use a wider bucket.")
+        return start, end, bucket
@@ -0,0 +1,141 @@
+"""
+Background refill of invalidated dashboards.
+
+When a write bumps a client's dashboard generation (dbopt.invalidation), the
+next request would pay for the rebuild. Instead the bump schedules the client
+here, and a scheduler thread hands it to a small thread pool once the writes
+have settled:
+
+- debounce: every write pushes the client's refill DASHBOARD_WARMER_DELAY
+  seconds out, but never past DASHBOARD_WARMER_MAX_DELAY after the first one,
+  so a steady stream of writes still gets refilled;
+- bounded: DASHBOARD_WARMER_WORKERS threads at most, one refill per client at
+  a time;
+- hot tenants only: just the DASHBOARD_WARMER_TOP_K clients this process has
+  served most dashboards for; the rest recompute on their next request.
+
+Everything is in-process (no broker) and starts on first use. Refills go
+through get_or_compute, so a user request that gets there first is not
+duplicated. `manage.py warm_cache` fills every dashboard after a deploy.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger('performance')
+
+
+def warm_dashboard(client_id):
+    """Fill the client's current dashboard entry unless it is already cached; False if the client is gone."""
+    from .views import OptimizedProjectDashboardView
+
+    close_old_connections()
+    try:
+        return OptimizedProjectDashboardView().dashboard(client_id) is not None
+    finally:
+        close_old_connections()
+
+
+class CacheWarmer:
+    # Request counts are halved once they add up to this, so the hot set follows recent traffic.
+    decay_total = 10_000
+
+    def __init__(self, warm=warm_dashboard, delay=None, max_delay=None, workers=None, top_k=None):
+        self.warm = warm
+        self.delay = delay if delay is not None else getattr(settings, 'DASHBOARD_WARMER_DELAY', 2.0)
+        self.max_delay = max_delay if max_delay is not None else getattr(settings, 'DASHBOARD_WARMER_MAX_DELAY', 10.0)
+        self.workers = workers or getattr(settings, 'DASHBOARD_WARMER_WORKERS', 2)
+        self.top_k = top_k or getattr(settings, 'DASHBOARD_WARMER_TOP_K', 50)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.requests = Counter()
+        self.total_requests = 0
+        self.due = {}          # client id -> (run at, latest run at)
+        self.running = set()
+        self.executor = None
+        self.thread = None
+
+    def record_request(self, client_id):
+        with self.lock:
+            self.requests[client_id] += 1
+            self.total_requests += 1
+            if self.total_requests > self.decay_total:
+                self.requests = Counter({key: n // 2 for key, n in self.requests.items() if n > 1})
+                self.total_requests = sum(self.requests.values())
+
+    def hot(self):
+        with self.lock:
+            return {client_id for client_id, _ in self.requests.most_common(self.top_k)}
+
+    def schedule(self, client_ids):
+        client_ids = set(client_ids) & self.hot()
+        if not client_ids:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.start()
+            for client_id in client_ids:
+                _, latest = self.due.get(client_id, (None, now + self.max_delay))
+                self.due[client_id] = (min(now + self.delay, latest), latest)
+            self.changed.notify()
+
+    def start(self):
+        # Called under the lock. Lazily, so forked workers each get their own thread.
+        if self.thread is None or not self.thread.is_alive():
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='dashboard-warmer')
+            self.thread = threading.Thread(target=self.loop, name='dashboard-warmer', daemon=True)
+            self.thread.start()
+
+    def loop(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                ready = [c for c, (at, _) in self.due.items() if at <= now and c not in self.running]
+                if not ready:
+                    pending = [at for c, (at, _) in self.due.items() if c not in self.running]
+                    self.changed.wait(max(min(pending) - now, 0.01) if pending else None)
+                    continue
+                for client_id in ready:
+                    del self.due[client_id]
+                    self.running.add(client_id)
+            for client_id in ready:
+                self.executor.submit(self.run, client_id)
+
+    def run(self, client_id):
+        try:
+            self.warm(client_id)
+        except Exception:
+            logger.exception("Warming the dashboard of client %s failed", client_id)
+        finally:
+            with self.lock:
+                self.running.discard(client_id)
+                self.changed.notify()
+
+    def idle(self):
+        with self.lock:
+            return not self.due and not self.running
+
+    def wait_idle(self, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not self.idle():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+dashboard_warmer = CacheWarmer()
+
+
+def record_request(client_id):
+    dashboard_warmer.record_request(client_id)
+
+
+def schedule(client_ids):
+    if getattr(settings, 'DASHBOARD_WARMER_ENABLED', False):
+        dashboard_warmer.schedule(client_ids)
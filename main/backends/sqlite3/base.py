@@ -0,0 +1,99 @@
+"""
+SQLite backend tuned for concurrent web traffic.
+
+On top of Django's sqlite3 backend every connection gets WAL journaling and
+the pragmas below (override per database with OPTIONS["pragmas"]), atomic
+blocks start with BEGIN IMMEDIATE so writers queue on busy_timeout instead of
+failing on a read-to-write lock upgrade, and statements issued outside a
+transaction (including the BEGIN itself) are retried with jittered
+exponential backoff when the database is locked. An executemany() outside a
+transaction runs in one of its own, so a retry never repeats rows that
+already committed.
+"""
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+from django.db.backends.sqlite3.base import Database
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # durable across app crashes in WAL; fsync only at checkpoints
+    "busy_timeout": 5000,  # ms
+    "cache_size": -64000,  # negative = KiB, so 64 MB of page cache
+    "mmap_size": 268435456,  # 256 MB
+    "temp_store": "MEMORY",
+}
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return "database is locked" in message or "database table is locked" in message
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    lock_retries = 5
+    lock_backoff = 0.05
+
+    def _retry(self, method, *args):
+        attempt = 0
+        while True:
+            # Only a statement outside a transaction can be replayed on its own.
+            in_transaction = self.connection.in_transaction
+            try:
+                return method(*args)
+            except Database.OperationalError as exc:
+                if in_transaction or attempt >= self.lock_retries or not is_lock_error(exc):
+                    raise
+                time.sleep(self.lock_backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                attempt += 1
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        param_list = list(param_list)
+        if self.connection.in_transaction:
+            return super().executemany(query, param_list)
+        # In autocommit each row commits on its own, so replaying the statement after a lock
+        # error partway through would insert the earlier rows twice. Run it as one transaction.
+        return self._retry(self._executemany_atomically, query, param_list)
+
+    def _executemany_atomically(self, query, param_list):
+        Database.Cursor.execute(self, "BEGIN IMMEDIATE")
+        try:
+            result = super().executemany(query, param_list)
+            Database.Cursor.execute(self, "COMMIT")
+        except BaseException:
+            if self.connection.in_transaction:
+                Database.Cursor.execute(self, "ROLLBACK")
+            raise
+        return result
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        options = self.settings_dict["OPTIONS"]
+        kwargs = super().get_connection_params()
+        for key in ("pragmas", "lock_retries", "lock_backoff"):
+            kwargs.pop(key, None)
+
+        self.pragmas = {**DEFAULT_PRAGMAS, **options.get("pragmas", {})}
+        self.lock_retries = options.get("lock_retries", RetryingCursorWrapper.lock_retries)
+        self.lock_backoff = options.get("lock_backoff", RetryingCursorWrapper.lock_backoff)
+        if "transaction_mode" not in options:
+            self.transaction_mode = "IMMEDIATE"
+        kwargs.setdefault("timeout", self.pragmas["busy_timeout"] / 1000)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.lock_retries = self.lock_retries
+        cursor.lock_backoff = self.lock_backoff
+        return cursor
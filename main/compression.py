@@ -0,0 +1,129 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Brotli when the client accepts it and the `brotli` package is installed,
+gzip otherwise. A body under COMPRESSION_MIN_SIZE bytes is sent as it is,
+because the header and CPU cost more than they save. So is a response that
+is already encoded or whose content type does not compress (images,
+archives). A streaming response is compressed chunk by chunk, with a flush
+after each, so the client still gets every chunk as soon as it is produced.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml')
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """The coding to use for this Accept-Encoding header: 'br', 'gzip' or None."""
+    accepted = accepted_encodings(header)
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in offered:  # in order of preference, so ties go to the first
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressor(coding):
+    """(compress, flush, finish) for one response body."""
+    if coding == 'br':
+        engine = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+        return engine.process, engine.flush, engine.finish
+    # wbits 31 = a gzip header and trailer around a 32 KB window deflate stream.
+    engine = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, 31)
+    return engine.compress, lambda: engine.flush(zlib.Z_SYNC_FLUSH), engine.flush
+
+
+def compress(coding, data):
+    write, _, finish = compressor(coding)
+    return write(data) + finish()
+
+
+def _compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith(COMPRESSIBLE_SUFFIXES)
+
+
+def compress_stream(coding, chunks):
+    write, flush, finish = compressor(coding)
+    for chunk in chunks:
+        data = write(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+async def compress_stream_async(coding, chunks):
+    write, flush, finish = compressor(coding)
+    async for chunk in chunks:
+        data = write(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not _compressible(response):
+            return response
+        # Compressible responses differ by Accept-Encoding whether or not this one was compressed.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_stream_async(coding, response.streaming_content)
+            else:
+                response.streaming_content = compress_stream(coding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+                return response
+            compressed = compress(coding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The bytes changed, so a strong validator no longer holds (RFC 9110 8.8.1).
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,143 @@
+"""
+Read-replica routing.
+
+ReplicaMiddleware decides per request whether reads may go to a replica:
+only safe-method requests under REPLICA_ROUTED_PATHS, from callers that have
+not written within the last REPLICA_STICKY_SECONDS. ReplicaRouter then sends
+reads of REPLICA_ROUTED_APPS models to a healthy replica from
+DATABASE_REPLICAS; everything else, and every write, uses the primary.
+
+With DATABASE_REPLICAS empty the router is a no-op.
+"""
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+# True while the current request may read from a replica.
+_use_replica = ContextVar("use_replica", default=False)
+
+# alias -> (healthy, valid_until); per process, refreshed every REPLICA_HEALTH_CHECK_INTERVAL.
+_health = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def primary_alias():
+    return _setting("DATABASE_PRIMARY", "default")
+
+
+def pin_to_primary():
+    """Send the rest of the current request's reads to the primary."""
+    _use_replica.set(False)
+
+
+def mark_replica_down(alias, seconds=None):
+    """Take a replica out of rotation, e.g. after a connection error."""
+    seconds = seconds if seconds is not None else _setting("REPLICA_HEALTH_CHECK_INTERVAL", 10)
+    _health[alias] = (False, time.monotonic() + seconds)
+
+
+def replica_is_healthy(alias):
+    """Run the configured health and lag hooks, at most once per interval per replica."""
+    healthy, valid_until = _health.get(alias, (None, 0))
+    if time.monotonic() < valid_until:
+        return healthy
+
+    healthy = True
+    health_check = _setting("REPLICA_HEALTH_CHECK", None)
+    if health_check:
+        healthy = bool(import_string(health_check)(alias))
+    lag_check = _setting("REPLICA_LAG_CHECK", None)
+    if healthy and lag_check:
+        lag = import_string(lag_check)(alias)
+        healthy = lag is None or lag <= _setting("REPLICA_MAX_LAG_SECONDS", 5)
+
+    _health[alias] = (healthy, time.monotonic() + _setting("REPLICA_HEALTH_CHECK_INTERVAL", 10))
+    return healthy
+
+
+def choose_replica():
+    replicas = [alias for alias in _setting("DATABASE_REPLICAS", []) if replica_is_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+class ReplicaRouter:
+    def _routed(self, model):
+        return model._meta.app_label in _setting("REPLICA_ROUTED_APPS", ("projectmgmt", "dbopt"))
+
+    def db_for_read(self, model, **hints):
+        if not self._routed(model):
+            return None
+        if _use_replica.get():
+            replica = choose_replica()
+            if replica:
+                return replica
+        return primary_alias()
+
+    def db_for_write(self, model, **hints):
+        if not self._routed(model):
+            return None
+        # Anything read after a write in this request must see it.
+        pin_to_primary()
+        return primary_alias()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {primary_alias(), *_setting("DATABASE_REPLICAS", [])}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication.
+        if db in _setting("DATABASE_REPLICAS", []):
+            return False
+        return None
+
+
+def caller_key(request):
+    """Identify the caller from its credentials without authenticating it."""
+    credential = (
+        request.META.get("HTTP_AUTHORIZATION")
+        or request.META.get("HTTP_X_API_KEY")
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credential:
+        return None
+    return "replica_sticky:" + hashlib.sha256(credential.encode()).hexdigest()
+
+
+class ReplicaMiddleware:
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = caller_key(request)
+        safe = request.method in self.SAFE_METHODS
+        routed_path = request.path_info.startswith(tuple(_setting("REPLICA_ROUTED_PATHS", ("/api/",))))
+
+        use_replica = (
+            safe
+            and routed_path
+            and bool(_setting("DATABASE_REPLICAS", []))
+            and not (key and cache.get(key))
+        )
+        token = _use_replica.set(use_replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+
+        if not safe and key and response.status_code < 500:
+            sticky = _setting("REPLICA_STICKY_SECONDS", 5)
+            if sticky > 0:
+                cache.set(key, True, sticky)
+        return response
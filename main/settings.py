@@ -49,6 +49,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dbopt.performance_monitoring.PerformanceMiddleware',
+    # Inside PerformanceMiddleware, so /metrics response sizes are the bytes actually sent.
+    'main.compression.CompressionMiddleware',
+    # Before sessions and authentication, so a throttled request costs no session read or key hash.
+    'main.throttle.ThrottleMiddleware',
+    'main.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,6 +65,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'main.urls'
 
+TEST_RUNNER = 'dbopt.testing.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -78,10 +86,11 @@ WSGI_APPLICATION = 'main.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'authentications.authentication.MultiAuthBackend',  # Your custom backend
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # Optional: Simple JWT
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        # Timed wrappers around MultiAuthBackend and the DRF/Simple JWT backends (see /metrics).
+        'authentications.authentication.TimedMultiAuthBackend',  # Your custom backend
+        'authentications.authentication.JWTAuthentication',  # Optional: Simple JWT
+        'authentications.authentication.SessionAuthentication',
+        'authentications.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -94,12 +103,140 @@ REST_FRAMEWORK = {
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 plus WAL, tuned pragmas, BEGIN IMMEDIATE and
+        # lock retries; see main/backends/sqlite3/base.py for the defaults.
+        'ENGINE': 'main.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'pragmas': {'busy_timeout': 5000, 'mmap_size': 268435456},
+        },
     }
 }
 
+# Read replicas: add their aliases to DATABASES and list them here, e.g.
+# DATABASES['replica1'] = {'ENGINE': ..., 'NAME': ...}; DATABASE_REPLICAS = ['replica1']
+DATABASE_ROUTERS = ['projectmgmt.sharding.ShardRouter', 'main.replicas.ReplicaRouter']
+DATABASE_PRIMARY = 'default'
+DATABASE_REPLICAS = []
+REPLICA_ROUTED_APPS = ('projectmgmt', 'dbopt')
+REPLICA_ROUTED_PATHS = ('/api/',)
+REPLICA_STICKY_SECONDS = 5  # reads stay on the primary this long after a caller writes
+REPLICA_HEALTH_CHECK = None  # dotted path to callable(alias) -> bool
+REPLICA_LAG_CHECK = None  # dotted path to callable(alias) -> lag in seconds, or None
+REPLICA_MAX_LAG_SECONDS = 5
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+
+# Tenant shards: extra DATABASES aliases that can hold a client's projects, tasks and comments.
+# Place a client with `python manage.py move_client <client_id> <alias>`.
+SHARD_DATABASES = []
+SHARD_DIRECTORY_TTL = 5  # seconds a worker may use a cached client -> shard mapping
+
+# dbopt.performance_monitoring: requests slower than this, or repeating one statement
+# fingerprint at least this often (N+1), are written to the `performance` logger.
+PERFORMANCE_SLOW_REQUEST_SECONDS = 0.5
+PERFORMANCE_NPLUSONE_THRESHOLD = 5
+
+# dbopt.slow_queries: statements slower than this are logged with their plan as JSON lines
+# to slow_queries.log, at most once per fingerprint per interval and N entries a minute.
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG_INTERVAL = 60
+SLOW_QUERY_LOG_PER_MINUTE = 60
+SLOW_QUERY_EXPLAIN = True
+
+# dbopt.metrics: GET /metrics in the Prometheus text format. Under gunicorn point
+# METRICS_MULTIPROC_DIR at a directory shared by the workers (emptied on restart) so a
+# scrape of any worker reports all of them. Set METRICS_TOKEN to require a bearer token.
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or None
+METRICS_FLUSH_SECONDS = 1
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# main.compression: brotli (with the `brotli` package) or gzip, by Accept-Encoding, for text and JSON
+# responses of at least COMPRESSION_MIN_SIZE bytes. Quality 5 / level 6 keep compression cheap enough
+# for per-request use.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_GZIP_LEVEL = 6
+
+# projectmgmt.streaming: unpaginated lists longer than this are streamed as a JSON array,
+# rendered STREAMED_LIST_CHUNK_SIZE rows at a time.
+STREAMED_LIST_THRESHOLD = 200
+STREAMED_LIST_CHUNK_SIZE = 100
+
+# projectmgmt.includes: rows per parent for ?include= paths without an explicit `path:N`, and the cap on N.
+INCLUDE_DEFAULT_LIMIT = 50
+INCLUDE_MAX_LIMIT = 200
+
+# projectmgmt.batch: POST /api/batch/ runs up to BATCH_MAX_REQUESTS sub-requests; with "concurrent",
+# consecutive GETs share BATCH_MAX_WORKERS threads.
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# main.throttle: token buckets per verified caller (API key or token, JWT user or session), per client
+# in the URL once the caller has been served by it, and per address for everyone else. Each refills at
+# its scope's rate and holds at most one period's worth. A route costs THROTTLE_ROUTE_COSTS[url name]
+# tokens (default 1). Spend is shared through THROTTLE_CACHE every THROTTLE_SYNC_SECONDS.
+# dbopt.testing.TestRunner turns it off; tests that need it turn it back on.
+THROTTLE_ENABLED = os.environ.get('THROTTLE', 'on') == 'on'
+THROTTLE_RATES = {
+    'api_key': '1200/min',
+    'user': '600/min',
+    'address': '120/min',
+    'client': '3000/min',
+}
+THROTTLE_ROUTE_COSTS = {
+    'batch': 10,  # up to BATCH_MAX_REQUESTS calls
+    'client-projects-list': 2,  # unpaginated, streamed when long
+    'project-tasks-list': 3,
+    'task-comments-list': 2,
+    'dbopt-dashboard': 5,
+    'dbopt-throughput': 5,
+}
+THROTTLE_EXEMPT_ROUTES = ['metrics']
+THROTTLE_CACHE = 'default'
+THROTTLE_SYNC_SECONDS = 1
+
+# dbopt dashboard: fresh for DASHBOARD_CACHE_SECONDS, then served stale for up to
+# DASHBOARD_STALE_SECONDS while the one request holding the fill lock recomputes it.
+# Writes change the cache key (dbopt.invalidation), so a stale copy is never served
+# after a write, only after an entry ages out.
+DASHBOARD_CACHE_SECONDS = 600
+DASHBOARD_STALE_SECONDS = 300
+DASHBOARD_LOCK_SECONDS = 30
+# Latest tasks listed under each active project on the dashboard.
+DASHBOARD_RECENT_PER_PROJECT = 5
+# dbopt.warmer: refill the invalidated dashboards of the DASHBOARD_WARMER_TOP_K most requested
+# clients in background threads, DASHBOARD_WARMER_DELAY seconds after their last write (at most
+# DASHBOARD_WARMER_MAX_DELAY after the first). dbopt.testing.TestRunner turns it off, since
+# other threads cannot see a test's data.
+DASHBOARD_WARMER_ENABLED = os.environ.get('DASHBOARD_WARMER', 'on') == 'on'
+DASHBOARD_WARMER_DELAY = 2.0
+DASHBOARD_WARMER_MAX_DELAY = 10.0
+DASHBOARD_WARMER_WORKERS = 2
+DASHBOARD_WARMER_TOP_K = 50
+
+# Per-process LRU (L1) in front of the shared cache (L2); see dbopt.cache.TwoTierCache. Point L2 at
+# Redis or memcached when running several workers, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://cache:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': 'dbopt.cache.TwoTierCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'default'),
+        'OPTIONS': {
+            'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+            'LABEL': 'default',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            'STAMP_INTERVAL': 1,
+        },
+    },
+}
+
 # settings.py - Database query logging setup
+# Log file locations; the project directory unless set in the environment. `manage.py test`
+# (dbopt.testing.TestRunner) swaps the file handlers for NullHandler.
+PERFORMANCE_LOG_FILE = os.environ.get('PERFORMANCE_LOG_FILE') or os.path.join(BASE_DIR, 'performance.log')
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE') or os.path.join(BASE_DIR, 'slow_queries.log')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -107,7 +244,18 @@ LOGGING = {
         'performance_file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
-            'filename': 'performance.log',
+            'filename': PERFORMANCE_LOG_FILE,
+            'delay': True,
+        },
+        'slow_query_file': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'delay': True,
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
         },
     },
     'loggers': {
@@ -115,6 +263,16 @@ LOGGING = {
             'handlers': ['performance_file'],
             'level': 'INFO',
         },
+        'performance.slow_queries': {
+            'handlers': ['slow_query_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Backfill progress from dbopt.operations, shown during `migrate`.
+        'performance.migrations': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
     },
 }
 
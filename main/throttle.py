@@ -0,0 +1,251 @@
+"""
+Rate limiting with in-process token buckets, before authentication.
+
+ThrottleMiddleware charges each request to token buckets chosen from the
+request headers and URL alone:
+
+  * a caller bucket: the X-API-Key or DRF token (by a SHA-256 digest of the
+    raw value), the JWT's user id, or the session cookie. Only for a caller
+    that is verified: a JWT whose signature checks out (nothing is read from
+    the database), or a key, token or session that has been seen to
+    authenticate. Any other request - no credentials, or credentials never
+    seen to work - is charged to its client address instead, so rotating
+    made-up keys gets no fresh buckets.
+  * a tenant bucket: the projectmgmt client or dbopt client id in the URL,
+    once the caller has had a successful response from that client's
+    routes. Nobody else can use up a tenant's bucket.
+
+Rates come from THROTTLE_RATES per scope ('120/min': 120 tokens a minute,
+at most 120 saved up). A route costs THROTTLE_ROUTE_COSTS[url name] tokens,
+1 by default, so batch and export-sized routes use up a bucket sooner. A
+request that a bucket cannot pay for gets a 429 with Retry-After before the
+session, the user or the API key hash is looked at.
+
+The buckets live in each process and are read and replaced without a lock:
+two threads racing on one bucket can both spend the same token, which makes
+the limit slightly lenient, never stricter. Every THROTTLE_SYNC_SECONDS a
+process adds what it spent to per-period counters in the shared cache and
+lowers each bucket to what is left across all processes, so a limit holds
+for the whole deployment within one sync interval. A bucket seen for the
+first time starts from the shared counters as well. What a process has seen
+authenticate is its own, and is forgotten after a period without use.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dbopt.metrics import THROTTLE_REQUESTS
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (tokens per second, bucket size)."""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return count / PERIODS[period.strip()[0]], count
+
+
+def _digest(value):
+    # Cheap and stable; only buckets are keyed by it, nothing is authenticated with it.
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def caller_key(request):
+    """
+    ('scope:identity', signed) for the credentials the request carries, or
+    (None, False). `signed`: a JWT, verified by its signature.
+    """
+    api_key = request.META.get('HTTP_X_API_KEY')
+    if api_key:
+        return f"api_key:{_digest(api_key)}", False
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2:
+        kind, credentials = auth
+        if kind == 'Token':
+            return f"api_key:token-{_digest(credentials)}", False
+        if kind in jwt_settings.AUTH_HEADER_TYPES:
+            try:
+                return f"user:{AccessToken(credentials)[jwt_settings.USER_ID_CLAIM]}", True
+            except (TokenError, KeyError):
+                return None, False  # rejected by authentication later
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return f"user:session-{_digest(session)}", False
+    return None, False
+
+
+def address_key(request):
+    return f"address:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def authenticated(request):
+    """Whether the view authenticated the caller; never loads a session to find out."""
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return False
+    return user is not None and user.is_authenticated
+
+
+def client_key(match):
+    kwargs = match.kwargs
+    if 'client_pk' in kwargs:
+        return f"client:{kwargs['client_pk']}"
+    if 'client_id' in kwargs:
+        return f"client:dbopt-{kwargs['client_id']}"
+    if match.url_name and match.url_name.startswith('clients-') and 'pk' in kwargs:
+        return f"client:{kwargs['pk']}"
+    return None
+
+
+class TokenBuckets:
+    """Token buckets keyed 'scope:identity', shared across processes through `cache`."""
+
+    def __init__(self, rates, cache, sync_interval):
+        self.rates = {scope: parse_rate(rate) for scope, rate in rates.items()}
+        self.cache = cache
+        self.sync_interval = sync_interval
+        self.buckets = {}  # key -> (tokens, updated at); replaced whole, never changed in place
+        self.spent = {}  # key -> tokens spent here since the last sync
+        # Callers seen to authenticate, and 'caller|tenant' pairs seen to succeed -> when last seen.
+        self.verified = {}
+        self.next_sync = 0.0
+
+    def limits(self, key):
+        return self.rates[key.partition(':')[0]]
+
+    def take(self, keys, cost, now=None):
+        """Spend `cost` from every bucket in `keys`; None on success, else (scope, seconds to wait)."""
+        now = time.monotonic() if now is None else now
+        new = [key for key in keys if key not in self.buckets]
+        if new:
+            for key, remaining in self.shared_remaining(new).items():
+                self.buckets[key] = (remaining, now)
+        levels, waits = {}, []
+        for key in keys:
+            rate, burst = self.limits(key)
+            tokens, updated = self.buckets.get(key, (burst, now))
+            levels[key] = tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < min(cost, burst):
+                waits.append(((min(cost, burst) - tokens) / rate, key.partition(':')[0]))
+        if waits:
+            wait, scope = max(waits)
+            return scope, wait
+        for key, tokens in levels.items():
+            charge = min(cost, self.limits(key)[1])
+            self.buckets[key] = (tokens - charge, now)
+            self.spent[key] = self.spent.get(key, 0) + charge
+        if now >= self.next_sync:
+            self.next_sync = now + self.sync_interval
+            self.sync(now)
+        return None
+
+    def counters(self, key):
+        """Cache keys of the current and the previous period's spend on `key`, and the period."""
+        rate, burst = self.limits(key)
+        period = burst / rate
+        slot = int(time.time() // period)
+        return f"throttle:{key}:{slot}", f"throttle:{key}:{slot - 1}", period
+
+    def shared_remaining(self, keys):
+        """Tokens left across all processes, by a sliding window over the two newest periods."""
+        counters = {key: self.counters(key) for key in keys}
+        counts = self.cache.get_many([name for *names, _ in counters.values() for name in names])
+        remaining = {}
+        for key, (current, previous, period) in counters.items():
+            overlap = 1 - (time.time() % period) / period
+            used = counts.get(current, 0) + counts.get(previous, 0) * overlap
+            remaining[key] = max(0.0, self.limits(key)[1] - used)
+        return remaining
+
+    def sync(self, now):
+        spent, self.spent = self.spent, {}
+        for key, amount in spent.items():
+            current, _, period = self.counters(key)
+            timeout = math.ceil(2 * period) + 1
+            if not self.cache.add(current, amount, timeout=timeout):
+                try:
+                    self.cache.incr(current, amount)
+                except ValueError:  # expired between add() and incr()
+                    self.cache.add(current, amount, timeout=timeout)
+        for key, remaining in self.shared_remaining(spent).items():
+            state = self.buckets.get(key)
+            if state is not None:
+                rate, burst = self.limits(key)
+                tokens = min(burst, state[0] + (now - state[1]) * rate)
+                if tokens > remaining:
+                    self.buckets[key] = (remaining, now)
+        # A bucket idle long enough to have refilled is no different from a new one.
+        for key, (_, updated) in list(self.buckets.items()):
+            rate, burst = self.limits(key)
+            if now - updated > burst / rate:
+                self.buckets.pop(key, None)
+        for key, seen in list(self.verified.items()):
+            rate, burst = self.limits(key)
+            if now - seen > burst / rate:
+                self.verified.pop(key, None)
+
+
+class ThrottleMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.costs = getattr(settings, 'THROTTLE_ROUTE_COSTS', {})
+        self.exempt = set(getattr(settings, 'THROTTLE_EXEMPT_ROUTES', ()))
+        self.buckets = TokenBuckets(
+            settings.THROTTLE_RATES,
+            caches[getattr(settings, 'THROTTLE_CACHE', 'default')],
+            getattr(settings, 'THROTTLE_SYNC_SECONDS', 1),
+        )
+
+    def __call__(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            match = None
+        route = (match.view_name if match else None) or 'unmatched'
+        if route in self.exempt:
+            return self.get_response(request)
+
+        verified = self.buckets.verified
+        caller, signed = caller_key(request)
+        tenant = client_key(match) if match else None
+        if caller is not None and (signed or caller in verified):
+            keys = [caller]
+            if tenant and f"{caller}|{tenant}" in verified:
+                keys.append(tenant)
+        else:
+            keys = [address_key(request)]
+        rejected = self.buckets.take(keys, self.costs.get(route, 1))
+        if rejected is not None:
+            scope, wait = rejected
+            THROTTLE_REQUESTS.inc(route=route, scope=scope, result='throttled')
+            wait = max(1, math.ceil(wait))
+            response = JsonResponse(
+                {'detail': f"Request was throttled. Expected available in {wait} seconds."}, status=429,
+            )
+            response['Retry-After'] = str(wait)
+            return response
+        THROTTLE_REQUESTS.inc(route=route, scope=keys[0].partition(':')[0], result='allowed')
+        response = self.get_response(request)
+
+        if caller is not None:
+            if authenticated(request):
+                now = time.monotonic()
+                verified[caller] = now
+                if tenant and response.status_code < 400:
+                    verified[f"{caller}|{tenant}"] = now
+            elif response.status_code in (401, 403):
+                verified.pop(caller, None)
+        return response
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from dbopt.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/dbopt/', include('dbopt.urls')),
     path('api/', include('projectmgmt.urls')),
     path('auth/', include('authentications.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
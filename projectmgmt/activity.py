@@ -0,0 +1,189 @@
+"""
+Activity log capture.
+
+Changes are collected in a per-connection buffer and written with a single
+bulk_create when the surrounding transaction commits, so a request that
+touches many rows still costs one extra insert. Entries recorded inside a
+savepoint that is rolled back are dropped with it.
+"""
+import weakref
+from itertools import count
+
+from django.db import connections, transaction
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+
+from .models import ActivityLog, ClientMembership, Comment, Project, Task
+
+TRACKED_MODELS = (Project, Task, ClientMembership, Comment)
+
+
+def resolve_client_id(instance):
+    """Follow `client_path` through already-loaded relations; None if a query would be needed."""
+    obj = instance
+    *hops, last = instance.client_path
+    for name in hops:
+        field = obj._meta.get_field(name)
+        if not field.is_cached(obj):
+            return None
+        obj = getattr(obj, name)
+    return getattr(obj, f"{last}_id")
+
+
+def get_actor_id(instance):
+    return (
+        getattr(instance, "updated_by_id", None)
+        or getattr(instance, "created_by_id", None)
+        or getattr(instance, "author_id", None)
+    )
+
+
+def write(using, pending):
+    """bulk_create the (model, entry) pairs, looking up missing client ids once per model type."""
+    if not pending:
+        return
+    unresolved = {}
+    for model, entry in pending:
+        if entry.client_id is None:
+            unresolved.setdefault(model, {}).setdefault(entry.object_id, []).append(entry)
+    for model, entries in unresolved.items():
+        lookup = "__".join(model.client_path)
+        rows = model._base_manager.using(using).filter(pk__in=entries).values_list("pk", lookup)
+        for pk, client_id in rows:
+            for entry in entries[pk]:
+                entry.client_id = client_id
+    ActivityLog.objects.using(using).bulk_create([entry for _, entry in pending])
+
+
+class _Frame:
+    """
+    The entries recorded at one savepoint depth. Registered with on_commit and
+    only weakly referenced by its buffer: rolling back the savepoint drops
+    Django's reference, and the frame and its entries go with it.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.entries = []
+
+    def __call__(self):
+        self.buffer.flush()
+
+
+class ActivityBuffer:
+    """Entries of one transaction, written by whichever of its frames' on_commit hooks runs first."""
+
+    def __init__(self, using):
+        self.using = using
+        self.frames = {}  # savepoint ids -> weakref to the _Frame
+        self.sequence = count()
+
+    def alive(self):
+        return any(ref() is not None for ref in self.frames.values())
+
+    def add(self, model, entry):
+        key = tuple(connections[self.using].savepoint_ids)
+        ref = self.frames.get(key)
+        frame = ref() if ref else None
+        if frame is None:
+            frame = _Frame(self)
+            self.frames[key] = weakref.ref(frame)
+            transaction.on_commit(frame, using=self.using)
+        frame.entries.append((next(self.sequence), model, entry))
+
+    def flush(self):
+        conn = connections[self.using]
+        if getattr(conn, "_activity_buffer", None) is self:
+            conn._activity_buffer = None
+        frames = [frame for frame in (ref() for ref in self.frames.values()) if frame is not None]
+        self.frames = {}
+        pending = sorted((item for frame in frames for item in frame.entries), key=lambda item: item[0])
+        for frame in frames:
+            frame.entries = []
+        write(self.using, [(model, entry) for _, model, entry in pending])
+
+
+def _current_buffer(using):
+    """Return the buffer bound to the open transaction, starting a new one if needed."""
+    conn = connections[using]
+    buffer = getattr(conn, "_activity_buffer", None)
+    # A rolled back transaction drops our on_commit hooks, and with them the buffer's frames.
+    if buffer is None or not buffer.alive():
+        buffer = conn._activity_buffer = ActivityBuffer(using)
+    return buffer
+
+
+def record(model, object_id, action, changes, using, client_id=None, actor_id=None):
+    entry = ActivityLog(
+        client_id=client_id,
+        object_type=model._meta.model_name,
+        object_id=object_id,
+        action=action,
+        changes=changes,
+        actor_id=actor_id,
+    )
+    if not connections[using].in_atomic_block:
+        # Autocommit: this write is its own transaction, so write straight away.
+        write(using, [(model, entry)])
+        return
+    _current_buffer(using).add(model, entry)
+
+
+def log_model_change(sender, instance, created, raw=False, using=None, update_fields=None, **kwargs):
+    if raw:
+        return
+
+    changes = instance.tracked_changes(None if created else update_fields)
+    if not changes:
+        return
+
+    action = "create" if created else "update"
+    if not created and "is_deleted" in changes:
+        action = "delete" if instance.is_deleted else "restore"
+
+    record(
+        sender,
+        instance.pk,
+        action,
+        {name: list(values) for name, values in changes.items()},
+        using,
+        client_id=resolve_client_id(instance),
+        actor_id=get_actor_id(instance),
+    )
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(log_model_change, sender=model, dispatch_uid=f"activity_{model._meta.model_name}")
+
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def log_assignee_change(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == "pre_clear":
+        if reverse:
+            instance._cleared_tasks = list(instance.assigned_tasks.values_list("pk", flat=True))
+        else:
+            instance._cleared_assignees = list(instance.assignees.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    key = "added" if action == "post_add" else "removed"
+    if not reverse:
+        ids = pk_set if action != "post_clear" else instance.__dict__.pop("_cleared_assignees", [])
+        if not ids:
+            return
+        record(
+            Task,
+            instance.pk,
+            "update",
+            {"assignees": {key: sorted(str(pk) for pk in ids)}},
+            using,
+            client_id=resolve_client_id(instance),
+            actor_id=get_actor_id(instance),
+        )
+        return
+
+    # user.assigned_tasks.add(...) - one entry per affected task
+    task_ids = pk_set if action != "post_clear" else instance.__dict__.pop("_cleared_tasks", [])
+    for task_id in task_ids or ():
+        record(Task, task_id, "update", {"assignees": {key: [str(instance.pk)]}}, using)
@@ -1,5 +1,11 @@
 # projectmgmt/admin.py
+import hashlib
+
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.contrib.auth.admin import UserAdmin
 from .models import User, Client, ClientMembership, Project, Task, Comment
 
@@ -22,10 +28,99 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ('email', 'username')
     ordering = ('email',)
 
+class CachedCountPaginator(Paginator):
+    """
+    Changelist paginator that avoids a COUNT(*) per page view.
+
+    Tables filtered by nothing but their default manager (the soft-delete
+    filter) use the planner's row estimate on PostgreSQL, which also counts
+    soft deleted rows; everything else is counted once and cached for
+    `cache_timeout` seconds per query.
+    """
+    cache_timeout = 60
+
+    @staticmethod
+    def unfiltered(queryset):
+        """True when `queryset` filters no more than the model's default manager does."""
+        return queryset.query.where == queryset.model._default_manager.all().query.where
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and self.unfiltered(queryset):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(queryset.model._meta.db_table)],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+
+        sql, params = queryset.query.sql_with_params()
+        key = "admin_count:" + hashlib.md5(f"{queryset.db}:{sql}:{params}".encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, self.cache_timeout)
+        return count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Defaults for tables that grow with tenant data."""
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('created_by', 'updated_by')
+    list_per_page = 50
+
+
+class ClientAdmin(LargeTableAdmin):
+    list_display = ('name', 'slug', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'slug')
+    ordering = ('name',)
+
+
+class ClientMembershipAdmin(LargeTableAdmin):
+    list_display = ('user', 'client', 'role', 'is_active')
+    list_select_related = ('user', 'client')
+    list_filter = ('role', 'is_active')
+    autocomplete_fields = ('user', 'client')
+    search_fields = ('user__username', 'client__name')
+
+
+class ProjectAdmin(LargeTableAdmin):
+    list_display = ('name', 'client', 'status', 'start_date', 'end_date', 'created_at')
+    list_select_related = ('client',)
+    list_filter = ('status',)
+    autocomplete_fields = ('client',)
+    search_fields = ('name', 'slug')
+    ordering = ('-created_at',)
+
+
+class TaskAdmin(LargeTableAdmin):
+    list_display = ('title', 'project', 'status', 'priority', 'due_date', 'created_at')
+    # Task.__str__ and the project column both walk task.project.client.
+    list_select_related = ('project__client',)
+    list_filter = ('status', 'priority', 'due_date')
+    autocomplete_fields = ('project', 'assignees')
+    search_fields = ('title',)
+    # Walks the created_at index, so a filtered page stops after list_per_page rows.
+    ordering = ('-created_at',)
+
+
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('__str__', 'created_at')
+    list_select_related = ('author', 'task__project__client')
+    raw_id_fields = LargeTableAdmin.raw_id_fields + ('task', 'author')
+    ordering = ('-created_at',)
+
+
 # Registering all models
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(Client)
-admin.site.register(ClientMembership)
-admin.site.register(Project)
-admin.site.register(Task)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Client, ClientAdmin)
+admin.site.register(ClientMembership, ClientMembershipAdmin)
+admin.site.register(Project, ProjectAdmin)
+admin.site.register(Task, TaskAdmin)
+admin.site.register(Comment, CommentAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProjectmgmtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'projectmgmt'
+
+    def ready(self):
+        from . import activity, sharding, stats  # noqa: F401 - connects the model signal receivers
@@ -0,0 +1,221 @@
+"""
+Batch requests: POST /api/batch/ runs several projectmgmt API calls in one round trip.
+
+    {"requests": [{"id": "tasks", "method": "GET", "path": "/api/clients/<id>/projects/<id>/tasks/"},
+                  {"method": "POST", "path": "...", "body": {...}}],
+     "concurrent": true}
+
+The batch request is authenticated once and every sub-request runs as that
+user, straight through the viewset (no middleware, no authentication). While
+a batch runs, membership checks and the client/project/task lookups of the
+nested views are shared through a BatchScope: one query for all of the
+user's memberships, and each parent object read once. A write sub-request
+empties the scope, so later sub-requests see its effect.
+
+With "concurrent", consecutive GETs run on up to BATCH_MAX_WORKERS threads;
+writes run alone, in order. Sub-requests are independent - a failed one does
+not roll back the others.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from io import BytesIO
+from itertools import repeat
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.http import Http404
+from django.urls import Resolver404, URLResolver, reverse
+from django.urls.resolvers import RegexPattern
+from rest_framework.exceptions import ValidationError
+
+from dbopt.performance_monitoring import current_view
+from main.replicas import primary_alias
+from .models import ClientMembership
+
+logger = logging.getLogger('performance')
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+METHODS = (*SAFE_METHODS, "POST", "PUT", "PATCH", "DELETE")
+
+# Request headers a sub-request does not inherit from the batch request.
+_OWN_HEADERS = ("CONTENT_LENGTH", "CONTENT_TYPE", "QUERY_STRING", "PATH_INFO", "REQUEST_METHOD", "wsgi.input")
+
+# The BatchScope of the batch the current thread is running a sub-request for, if any.
+_scope = ContextVar("batch_scope", default=None)
+
+
+class BatchScope:
+    """Memberships and parent objects shared by the sub-requests of one batch."""
+
+    def __init__(self, user):
+        self.user = user
+        self.lock = threading.Lock()
+        self.memberships = None
+        self.objects = {}
+
+    def membership(self, client_id):
+        """(is_active, alive) of the user's membership of a client, or None."""
+        with self.lock:
+            if self.memberships is None:
+                rows = ClientMembership.objects.db_manager(primary_alias()).all_with_deleted().filter(
+                    user_id=self.user.pk
+                ).values_list("client_id", "is_active", "deleted_at")
+                self.memberships = {
+                    str(client): (is_active, deleted_at is None) for client, is_active, deleted_at in rows
+                }
+            return self.memberships.get(str(client_id))
+
+    def clear(self):
+        with self.lock:
+            self.memberships = None
+            self.objects.clear()
+
+
+def is_member(user, client, active=True):
+    """
+    `active`: an active, not deleted membership (client.memberships); otherwise any
+    membership row at all (client.users), the two checks the nested views make.
+    """
+    scope = _scope.get()
+    if scope is None or scope.user.pk != user.pk:
+        if active:
+            return client.memberships.filter(user=user, is_active=True).exists()
+        return client.users.filter(id=user.id).exists()
+    membership = scope.membership(client.pk)
+    return membership is not None and (not active or all(membership))
+
+
+def cached(key, load):
+    """`load()`, once per batch for each key; outside a batch just `load()`."""
+    scope = _scope.get()
+    if scope is None:
+        return load()
+    with scope.lock:
+        if key in scope.objects:
+            return scope.objects[key]
+    obj = load()
+    with scope.lock:
+        return scope.objects.setdefault(key, obj)
+
+
+def _resolver():
+    from .urls import router_urlpatterns
+
+    prefix = reverse("batch")[:-len("batch/")]
+    return URLResolver(RegexPattern(f"^{prefix}"), router_urlpatterns)
+
+
+def parse(data):
+    """Validate the batch body; returns [(id, method, path, query, body bytes)]."""
+    items = data.get("requests") if isinstance(data, dict) else None
+    limit = getattr(settings, "BATCH_MAX_REQUESTS", 20)
+    if not isinstance(items, list) or not items:
+        raise ValidationError({"requests": "A non-empty list of sub-requests is required."})
+    if len(items) > limit:
+        raise ValidationError({"requests": f"At most {limit} sub-requests per batch."})
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValidationError({"requests": f"Sub-request {index} must be an object."})
+        method = str(item.get("method", "GET")).upper()
+        path = item.get("path")
+        if method not in METHODS:
+            raise ValidationError({"requests": f"Sub-request {index}: unsupported method {method}."})
+        if not isinstance(path, str) or not path.startswith("/"):
+            raise ValidationError({"requests": f"Sub-request {index}: path must start with '/'."})
+        url = urlsplit(path)
+        body = json.dumps(item["body"]).encode() if item.get("body") is not None else b""
+        parsed.append((item.get("id", index), method, url.path, url.query, body))
+    return parsed
+
+
+def _sub_request(request, method, path, query, body):
+    environ = {key: value for key, value in request.META.items() if key not in _OWN_HEADERS}
+    environ.update({
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": BytesIO(body),
+    })
+    sub = WSGIRequest(environ)
+    # Authenticated once for the whole batch (see rest_framework.request.Request).
+    sub.user = sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    return sub
+
+
+def _response_body(response):
+    if hasattr(response, "data"):
+        return response.data
+    content = b"".join(response.streaming_content) if response.streaming else response.content
+    if not content:
+        return None
+    if response.get("Content-Type", "").startswith("application/json"):
+        return json.loads(content)
+    return content.decode(response.charset or "utf-8", errors="replace")
+
+
+def run_one(request, resolver, item):
+    key, method, path, query, body = item
+    try:
+        match = resolver.resolve(path)
+    except Resolver404:
+        return {"id": key, "status": 404, "body": {"detail": f"No projectmgmt route for {path}."}}
+    current_view.set(match.view_name)
+    sub = _sub_request(request, method, path, query, body)
+    sub.resolver_match = match
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Http404:
+        return {"id": key, "status": 404, "body": {"detail": "Not found."}}
+    except Exception:
+        logger.exception("batch: %s %s failed", method, path)
+        return {"id": key, "status": 500, "body": {"detail": "Internal server error."}}
+    result = {"id": key, "status": response.status_code, "body": _response_body(response)}
+    if response.has_header("Location"):
+        result["headers"] = {"Location": response["Location"]}
+    return result
+
+
+def _run_in_thread(context, request, resolver, item):
+    try:
+        return context.run(run_one, request, resolver, item)
+    finally:
+        connections.close_all()  # this thread's connections, not the batch request's
+
+
+def run_batch(request, items, concurrent=False):
+    """Results for `items` (from parse()) in their order."""
+    resolver = _resolver()
+    scope = BatchScope(request.user)
+    token = _scope.set(scope)
+    try:
+        results = []
+        workers = getattr(settings, "BATCH_MAX_WORKERS", 4)
+        reads = []
+        for item in [*items, None]:
+            if concurrent and item is not None and item[1] in SAFE_METHODS:
+                reads.append(item)
+                continue
+            if len(reads) > 1:
+                contexts = [copy_context() for _ in reads]
+                with ThreadPoolExecutor(max_workers=min(workers, len(reads))) as pool:
+                    results += pool.map(_run_in_thread, contexts, repeat(request), repeat(resolver), reads)
+            elif reads:
+                results.append(copy_context().run(run_one, request, resolver, reads[0]))
+            reads = []
+            if item is None:
+                break
+            results.append(copy_context().run(run_one, request, resolver, item))
+            if item[1] not in SAFE_METHODS:
+                scope.clear()
+        return results
+    finally:
+        _scope.reset(token)
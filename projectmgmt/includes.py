@@ -0,0 +1,132 @@
+"""
+Compound documents: ?include= on the project and task routes.
+
+    GET /api/clients/{id}/projects/{id}/?include=tasks,tasks.comments:3,members
+
+Every requested path is compiled into one Prefetch, with the relations under
+it nested inside. So the whole tree costs one query per path, however many
+tasks or comments it holds. Soft-deleted rows are left out. Each parent gets
+at most INCLUDE_DEFAULT_LIMIT children, or `path:N` (up to
+INCLUDE_MAX_LIMIT), newest first; the task_count/comment_count fields still
+give the totals. The included rows are nested into each serialized object
+under the relation's name.
+"""
+from typing import Callable, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import ClientMembership, Comment, Project, Task
+from .serializers import ClientMembershipSerializer, CommentSerializer, TaskListSerializer
+
+
+class Relation(NamedTuple):
+    lookup: str  # prefetch lookup from the parent
+    attr: str  # to_attr the rows land in
+    model: type
+    queryset: Callable
+    serializer: type
+    order_by: tuple
+    owner: Optional[Callable] = None  # object holding `attr`, when the lookup goes through a foreign key
+
+
+def _tasks():
+    return Task.objects.filter(is_deleted=False).prefetch_related("assignees").annotate(
+        comment_count=Count("comments", filter=Q(comments__deleted_at=None))
+    )
+
+
+def _comments():
+    return Comment.objects.filter(is_deleted=False).select_related("author")
+
+
+def _members():
+    return ClientMembership.objects.filter(is_active=True).select_related("user")
+
+
+RELATIONS = {
+    Project: {
+        "tasks": Relation("tasks", "included_tasks", Task, _tasks, TaskListSerializer, ("-created_at", "-id")),
+        "members": Relation(
+            "client__memberships", "included_members", ClientMembership, _members, ClientMembershipSerializer,
+            ("created_at", "id"), owner=lambda project: project.client,
+        ),
+    },
+    Task: {
+        "comments": Relation("comments", "included_comments", Comment, _comments, CommentSerializer, ("-created_at", "-id")),
+    },
+}
+
+
+def parse(value, model):
+    """'tasks,tasks.comments:3' -> ({'tasks': {'comments': {}}}, {'tasks.comments': 3})."""
+    tree, limits = {}, {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        path, _, limit = item.partition(":")
+        node, current = tree, model
+        for name in path.split("."):
+            relations = RELATIONS.get(current, {})
+            if name not in relations:
+                raise ValidationError({"include": f"Unknown relation '{path}'; choose from {sorted(paths(model))}."})
+            node = node.setdefault(name, {})
+            current = relations[name].model
+        if limit:
+            maximum = getattr(settings, "INCLUDE_MAX_LIMIT", 200)
+            if not limit.isdigit() or not 1 <= int(limit) <= maximum:
+                raise ValidationError({"include": f"Limit for '{path}' must be between 1 and {maximum}."})
+            limits[path] = int(limit)
+    return tree, limits
+
+
+def paths(model, prefix=""):
+    for name, relation in RELATIONS.get(model, {}).items():
+        yield prefix + name
+        yield from paths(relation.model, f"{prefix}{name}.")
+
+
+def prefetches(model, tree, limits, prefix=""):
+    """One Prefetch per top-level path of `tree`, the deeper paths nested in its queryset."""
+    planned = []
+    for name, subtree in tree.items():
+        relation = RELATIONS[model][name]
+        path = prefix + name
+        queryset = relation.queryset().order_by(*relation.order_by)
+        nested = prefetches(relation.model, subtree, limits, f"{path}.")
+        if nested:
+            queryset = queryset.prefetch_related(*nested)
+        # A sliced prefetch is limited per parent (ROW_NUMBER() OVER (PARTITION BY parent)).
+        limit = limits.get(path, getattr(settings, "INCLUDE_DEFAULT_LIMIT", 50))
+        planned.append(Prefetch(relation.lookup, queryset=queryset[:limit], to_attr=relation.attr))
+    return planned
+
+
+def serializer_includes(model, tree):
+    """The `include` serializer context for `tree`: {name: (relation, nested includes)}."""
+    return {
+        name: (RELATIONS[model][name], serializer_includes(RELATIONS[model][name].model, subtree))
+        for name, subtree in tree.items()
+    }
+
+
+class IncludeMixin:
+    """?include= for the list and retrieve actions of a viewset over `include_model`."""
+
+    include_model = None
+
+    def include_tree(self):
+        if not hasattr(self, "_include"):
+            value = self.request.query_params.get("include") if self.action in ("list", "retrieve") else None
+            self._include = parse(value, self.include_model)
+        return self._include
+
+    def with_includes(self, queryset):
+        tree, limits = self.include_tree()
+        return queryset.prefetch_related(*prefetches(self.include_model, tree, limits)) if tree else queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        tree, _ = self.include_tree()
+        if tree:
+            context["include"] = serializer_includes(self.include_model, tree)
+        return context
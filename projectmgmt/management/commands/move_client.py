@@ -0,0 +1,164 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main.replicas import primary_alias
+from projectmgmt.models import (
+    ActivityLog, Client, ClientMembership, ClientShard, Comment, Project, Task,
+    TaskAssigneeStat, TaskDueStat, TaskStat, User,
+)
+from projectmgmt.sharding import forget_shard, lookup_shard, mirror_rows, shard_aliases
+from projectmgmt.stats import rebuild_stats
+
+Assignee = Task.assignees.through
+
+# Copy order is parents first; deletes run in reverse.
+TENANT_TABLES = [
+    (Project, "client_id"),
+    (Task, "project__client_id"),
+    (Assignee, "task__project__client_id"),
+    (Comment, "task__project__client_id"),
+    (ActivityLog, "client_id"),
+]
+USER_COLUMNS = {
+    Project: ("created_by_id", "updated_by_id"),
+    Task: ("created_by_id", "updated_by_id"),
+    Assignee: ("user_id",),
+    Comment: ("created_by_id", "updated_by_id", "author_id"),
+    ActivityLog: (),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Move one client's projects, tasks, comments and activity to another database alias online: "
+        "bulk copy in primary-key batches, freeze writes briefly for a final sync, flip the directory, "
+        "then delete the source rows in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("client_id")
+        parser.add_argument("target", help="Destination alias (one of SHARD_DATABASES, or the primary).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--settle", type=float, default=None,
+            help="Seconds to wait for every worker to see a directory change (default SHARD_DIRECTORY_TTL).",
+        )
+
+    def handle(self, *args, **options):
+        client_id, target = options["client_id"], options["target"]
+        self.batch_size = options["batch_size"]
+        settle = options["settle"] if options["settle"] is not None else getattr(settings, "SHARD_DIRECTORY_TTL", 5)
+        primary = primary_alias()
+
+        if target != primary and target not in shard_aliases():
+            raise CommandError(f"{target!r} is not listed in SHARD_DATABASES.")
+        client = Client._base_manager.using(primary).filter(pk=client_id).first()
+        if client is None:
+            raise CommandError(f"Client {client_id} does not exist.")
+
+        forget_shard(client_id)
+        source = lookup_shard(client_id)[0] or primary
+        if source == target:
+            self.stdout.write(f"Client {client_id} already lives on {target}.")
+            return
+
+        self.copied_users = set()
+        self.set_state(client, source, "copying")
+        started = timezone.now()
+
+        self.copy_reference_rows(client, source, target)
+        for model, lookup in TENANT_TABLES:
+            copied = self.copy_rows(model, lookup, client.pk, source, target)
+            self.stdout.write(f"  copied {copied} {model._meta.model_name} rows")
+
+        # Final sync: refuse writes until the directory points at the target.
+        self.set_state(client, source, "frozen")
+        time.sleep(settle)
+        with transaction.atomic(using=target):
+            for model, lookup in TENANT_TABLES:
+                self.sync_rows(model, lookup, client.pk, source, target, started)
+            rebuild_stats(client.pk, using=target)
+        self.set_state(client, target, "active")
+
+        # Workers holding the old directory entry still read the source until it expires.
+        time.sleep(settle)
+        self.delete_source(client, source, primary)
+        self.stdout.write(self.style.SUCCESS(f"Moved client {client_id} from {source} to {target}."))
+
+    def set_state(self, client, alias, state):
+        ClientShard.objects.using(primary_alias()).update_or_create(
+            client=client, defaults={"alias": alias, "state": state}
+        )
+        forget_shard(client.pk)
+
+    def copy_reference_rows(self, client, source, target):
+        primary = primary_alias()
+        memberships = list(ClientMembership._base_manager.using(primary).filter(client=client))
+        self.ensure_users({m.user_id for m in memberships}, target)
+        mirror_rows(Client, [client], target)
+        mirror_rows(ClientMembership, memberships, target)
+
+    def ensure_users(self, user_ids, target):
+        missing = {pk for pk in user_ids if pk} - self.copied_users
+        if missing:
+            mirror_rows(User, User.objects.using(primary_alias()).filter(pk__in=missing), target)
+            self.copied_users |= missing
+
+    def batches(self, queryset):
+        last = None
+        while True:
+            batch = queryset.order_by("pk")
+            if last is not None:
+                batch = batch.filter(pk__gt=last)
+            rows = list(batch[:self.batch_size])
+            if not rows:
+                return
+            yield rows
+            last = rows[-1].pk
+
+    def copy_rows(self, model, lookup, client_id, source, target):
+        copied = 0
+        for rows in self.batches(model._base_manager.using(source).filter(**{lookup: client_id})):
+            with transaction.atomic(using=target):
+                self.ensure_users({getattr(r, c) for r in rows for c in USER_COLUMNS[model]}, target)
+                mirror_rows(model, rows, target)
+            copied += len(rows)
+        return copied
+
+    def sync_rows(self, model, lookup, client_id, source, target, since):
+        """Re-copy rows changed since the bulk copy began and drop rows that vanished from the source."""
+        source_rows = model._base_manager.using(source).filter(**{lookup: client_id})
+        changed = source_rows
+        if model is ActivityLog:
+            changed = source_rows.filter(created_at__gte=since)
+        elif hasattr(model, "updated_at"):
+            changed = source_rows.filter(updated_at__gte=since)
+        # Assignee rows carry no timestamp, so they are always re-copied in full.
+        for rows in self.batches(changed):
+            self.ensure_users({getattr(r, c) for r in rows for c in USER_COLUMNS[model]}, target)
+            mirror_rows(model, rows, target)
+
+        source_ids = set(source_rows.values_list("pk", flat=True))
+        target_rows = model._base_manager.using(target).filter(**{lookup: client_id})
+        stale = [pk for pk in target_rows.values_list("pk", flat=True) if pk not in source_ids]
+        for start in range(0, len(stale), self.batch_size):
+            model._base_manager.using(target).filter(pk__in=stale[start:start + self.batch_size])._raw_delete(target)
+
+    def delete_source(self, client, source, primary):
+        for model in (TaskStat, TaskAssigneeStat, TaskDueStat):
+            model._base_manager.using(source).filter(client_id=client.pk)._raw_delete(source)
+        for model, lookup in reversed(TENANT_TABLES):
+            rows = model._base_manager.using(source).filter(**{lookup: client.pk})
+            while True:
+                ids = list(rows.order_by("pk").values_list("pk", flat=True)[:self.batch_size])
+                if not ids:
+                    break
+                # Raw delete: no cascades or signals, children are already gone.
+                model._base_manager.using(source).filter(pk__in=ids)._raw_delete(source)
+        if source != primary:
+            ClientMembership._base_manager.using(source).filter(client_id=client.pk)._raw_delete(source)
+            Client._base_manager.using(source).filter(pk=client.pk)._raw_delete(source)
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from projectmgmt.models import ActivityLog
+
+
+class Command(BaseCommand):
+    help = "Delete activity log entries older than the retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90, help="Retention window in days.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        deleted = ActivityLog.objects.prune(cutoff, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} activity entries older than {cutoff:%Y-%m-%d}"))
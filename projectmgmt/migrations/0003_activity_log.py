@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:38
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmgmt', '0002_client_users'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityLog',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('object_type', models.CharField(max_length=30)),
+                ('object_id', models.UUIDField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('restore', 'Restore')], max_length=10)),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('client', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='activity', to='projectmgmt.client')),
+            ],
+            options={
+                'db_table': 'activity_log',
+                'indexes': [models.Index(fields=['client', 'id'], name='activity_lo_client__65549c_idx'), models.Index(fields=['object_type', 'object_id', 'id'], name='activity_lo_object__b387ad_idx'), models.Index(fields=['created_at'], name='activity_lo_created_8906e2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmgmt', '0003_activity_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskAssigneeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('todo', 'To Do'), ('in_progress', 'In Progress'), ('done', 'Done')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_assignee_stats', to='projectmgmt.client')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_assignee_stats', to='projectmgmt.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'task_assignee_stat',
+                'constraints': [models.UniqueConstraint(fields=('client', 'project', 'user', 'status'), name='unique_task_assignee_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskDueStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_date', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_due_stats', to='projectmgmt.client')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_due_stats', to='projectmgmt.project')),
+            ],
+            options={
+                'db_table': 'task_due_stat',
+                'constraints': [models.UniqueConstraint(fields=('client', 'project', 'due_date'), name='unique_task_due_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('todo', 'To Do'), ('in_progress', 'In Progress'), ('done', 'Done')], max_length=20)),
+                ('priority', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('urgent', 'Urgent')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to='projectmgmt.client')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to='projectmgmt.project')),
+            ],
+            options={
+                'db_table': 'task_stat',
+                'constraints': [models.UniqueConstraint(fields=('client', 'project', 'status', 'priority'), name='unique_task_stat')],
+            },
+        ),
+    ]
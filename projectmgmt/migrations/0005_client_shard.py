@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projectmgmt', '0004_task_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientShard',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to='projectmgmt.client')),
+                ('alias', models.CharField(max_length=100)),
+                ('state', models.CharField(choices=[('active', 'Active'), ('copying', 'Copying'), ('frozen', 'Frozen')], default='active', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'client_shard',
+            },
+        ),
+    ]
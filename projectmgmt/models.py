@@ -1,6 +1,7 @@
 from django.db import models
 import uuid
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
@@ -50,9 +51,45 @@ class BaseModel(models.Model):
 
     objects = SoftDeleteManager()
 
+    # Columns that change on every write and carry no history of their own.
+    untracked_fields = ("id", "created_at", "updated_at", "created_by", "updated_by", "deleted_at")
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have seen the old values by now, so roll the snapshot forward.
+        self._loaded_values = {
+            f.attname: self.__dict__[f.attname]
+            for f in self._meta.concrete_fields
+            if f.attname in self.__dict__
+        }
+
+    def tracked_changes(self, update_fields=None):
+        """Return {attname: (old, new)} for tracked fields changed since load or last save."""
+        loaded = getattr(self, "_loaded_values", {})
+        deferred = self.get_deferred_fields()
+        changes = {}
+        for field in self._meta.concrete_fields:
+            if field.name in self.untracked_fields:
+                continue
+            if update_fields is not None and field.name not in update_fields and field.attname not in update_fields:
+                continue
+            if field.attname in deferred:
+                continue
+            old = loaded.get(field.attname)
+            new = getattr(self, field.attname)
+            if old != new:
+                changes[field.attname] = (old, new)
+        return changes
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.deleted_at = timezone.now()
@@ -110,6 +147,8 @@ class ClientMembership(BaseModel):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="member")
     is_active = models.BooleanField(default=True)
 
+    client_path = ("client",)
+
     class Meta:
         db_table = "client_membership"
         unique_together = (("user", "client"),)
@@ -137,6 +176,8 @@ class Project(BaseModel):
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
 
+    client_path = ("client",)
+
     class Meta:
         db_table = "project"
         indexes = [
@@ -172,6 +213,8 @@ class Task(BaseModel):
     due_date = models.DateField(null=True, blank=True)
     assignees = models.ManyToManyField(User, blank=True, related_name="assigned_tasks")
 
+    client_path = ("project", "client")
+
     class Meta:
         db_table = "task"
         indexes = [
@@ -188,6 +231,8 @@ class Comment(BaseModel):
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="comments")
     content = models.TextField()
 
+    client_path = ("task", "project", "client")
+
     class Meta:
         db_table = "comment"
         indexes = [
@@ -195,4 +240,149 @@ class Comment(BaseModel):
         ]
 
     def __str__(self):
-        return f"Comment by {self.author} on {self.task}"
\ No newline at end of file
+        return f"Comment by {self.author} on {self.task}"
+
+
+class ActivityLogQuerySet(models.QuerySet):
+    def for_client(self, client_id):
+        return self.filter(client_id=client_id)
+
+    def for_object(self, instance):
+        return self.filter(object_type=instance._meta.model_name, object_id=instance.pk)
+
+    def page(self, before=None, limit=50):
+        """Keyset page ordered newest first; returns (rows, cursor for the next page)."""
+        qs = self.order_by("-id")
+        if before is not None:
+            qs = qs.filter(id__lt=before)
+        rows = list(qs[:limit + 1])
+        next_before = rows[limit - 1].id if len(rows) > limit else None
+        return rows[:limit], next_before
+
+    def prune(self, older_than, batch_size=5000):
+        """Delete entries created before `older_than` in primary-key batches."""
+        deleted = 0
+        while True:
+            ids = list(self.filter(created_at__lt=older_than).order_by("id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += ActivityLog.objects.using(self.db).filter(id__in=ids).delete()[0]
+
+
+class ActivityLog(models.Model):
+    """Append-only history of field changes, written in one batch per transaction."""
+
+    ACTION_CHOICES = [
+        ("create", "Create"),
+        ("update", "Update"),
+        ("delete", "Delete"),
+        ("restore", "Restore"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    client = models.ForeignKey(
+        Client,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="activity",
+    )
+    object_type = models.CharField(max_length=30)
+    object_id = models.UUIDField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    actor = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = ActivityLogQuerySet.as_manager()
+
+    class Meta:
+        db_table = "activity_log"
+        indexes = [
+            models.Index(fields=["client", "id"]),
+            models.Index(fields=["object_type", "object_id", "id"]),
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.object_type} {self.object_id}"
+
+
+class TaskStat(models.Model):
+    """Live task count per (client, project, status, priority), kept current by projectmgmt.stats."""
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name="task_stats")
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="task_stats")
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    priority = models.CharField(max_length=10, choices=Task.PRIORITY_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "task_stat"
+        constraints = [
+            models.UniqueConstraint(fields=["client", "project", "status", "priority"], name="unique_task_stat")
+        ]
+
+
+class TaskAssigneeStat(models.Model):
+    """Live task count per (client, project, assignee, status)."""
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name="task_assignee_stats")
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="task_assignee_stats")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="task_stats")
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "task_assignee_stat"
+        constraints = [
+            models.UniqueConstraint(fields=["client", "project", "user", "status"], name="unique_task_assignee_stat")
+        ]
+
+
+class TaskDueStat(models.Model):
+    """Open (not done) task count per due date, so overdue is a range sum rather than a task scan."""
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name="task_due_stats")
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="task_due_stats")
+    due_date = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "task_due_stat"
+        constraints = [
+            models.UniqueConstraint(fields=["client", "project", "due_date"], name="unique_task_due_stat")
+        ]
+
+
+class ClientShard(models.Model):
+    """Directory entry mapping a client to the database alias holding its projects, tasks and comments."""
+
+    STATE_CHOICES = [
+        ("active", "Active"),
+        ("copying", "Copying"),
+        ("frozen", "Frozen"),  # final sync of a move; writes are refused
+    ]
+
+    client = models.OneToOneField(
+        Client,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="shard",
+    )
+    alias = models.CharField(max_length=100)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default="active")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "client_shard"
+
+    def __str__(self):
+        return f"{self.client_id} -> {self.alias} ({self.state})"
@@ -1,6 +1,8 @@
 from rest_framework import permissions
 from rest_framework.exceptions import PermissionDenied
 
+from .batch import is_member
+
 class MultiTenantPermission(permissions.BasePermission):
 
     def has_permission(self, request, view):
@@ -28,7 +30,7 @@ class MultiTenantPermission(permissions.BasePermission):
         else:
             raise PermissionDenied("Invalid permission_object_attr specified.")
 
-        if not client.users.filter(id=request.user.id).exists():
+        if not is_member(request.user, client, active=False):
             raise PermissionDenied("You do not have access to this client.")
 
         return True
\ No newline at end of file
@@ -1,10 +1,21 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Client, ClientMembership, Project, Task, Comment
+from .models import Client, ClientMembership, Project, Task, Comment, ActivityLog
 from django.utils import timezone
 
 User = get_user_model()
 
+class IncludedRelationsMixin:
+    """Nests the relations asked for with ?include= (see projectmgmt.includes) into the representation."""
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for name, (relation, nested) in self.context.get('include', {}).items():
+            owner = relation.owner(instance) if relation.owner else instance
+            rows = getattr(owner, relation.attr, [])
+            data[name] = relation.serializer(rows, many=True, context={**self.context, 'include': nested}).data
+        return data
+
 class UserSerializer(serializers.ModelSerializer):
     """Basic user serializer for nested relationships."""
     
@@ -23,6 +34,19 @@ class ClientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'default_timezone', 'is_active', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+class ClientSummarySerializer(ClientSerializer):
+    """Client with the counts and caller role annotated by ClientViewSet."""
+    
+    project_count = serializers.IntegerField(read_only=True)
+    active_project_count = serializers.IntegerField(read_only=True)
+    member_count = serializers.IntegerField(read_only=True)
+    role = serializers.CharField(read_only=True)
+    
+    class Meta(ClientSerializer.Meta):
+        fields = ClientSerializer.Meta.fields + [
+            'project_count', 'active_project_count', 'member_count', 'role'
+        ]
+
 class ClientMembershipSerializer(serializers.ModelSerializer):
     """Membership serializer with user details."""
     
@@ -33,7 +57,7 @@ class ClientMembershipSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'role', 'is_active', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class ProjectListSerializer(serializers.ModelSerializer):
+class ProjectListSerializer(IncludedRelationsMixin, serializers.ModelSerializer):
     """Lightweight serializer for project lists."""
     
     task_count = serializers.SerializerMethodField()
@@ -48,9 +72,11 @@ class ProjectListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_task_count(self, obj):
-        return obj.tasks.count()
+        # ProjectViewSet annotates the count; nested uses fall back to a query.
+        count = getattr(obj, 'task_count', None)
+        return obj.tasks.count() if count is None else count
 
-class ProjectDetailSerializer(serializers.ModelSerializer):
+class ProjectDetailSerializer(IncludedRelationsMixin, serializers.ModelSerializer):
     """Detailed serializer for project CRUD operations."""
     
     client = ClientSerializer(read_only=True)
@@ -68,7 +94,9 @@ class ProjectDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'client', 'created_by', 'updated_by', 'created_at', 'updated_at']
     
     def get_task_count(self, obj):
-        return obj.tasks.count()
+        # ProjectViewSet annotates the count; nested uses fall back to a query.
+        count = getattr(obj, 'task_count', None)
+        return obj.tasks.count() if count is None else count
     
     def validate(self, data):
         """Validate project dates."""
@@ -94,7 +122,7 @@ class ProjectCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Project with this slug already exists for this client.")
         return value
 
-class TaskListSerializer(serializers.ModelSerializer):
+class TaskListSerializer(IncludedRelationsMixin, serializers.ModelSerializer):
     """Lightweight serializer for task lists."""
     
     assignee_names = serializers.SerializerMethodField()
@@ -114,7 +142,9 @@ class TaskListSerializer(serializers.ModelSerializer):
         return [user.get_full_name() or user.username for user in obj.assignees.all()]
     
     def get_comment_count(self, obj):
-        return obj.comments.count()
+        # TaskViewSet annotates the count; nested uses fall back to a query.
+        count = getattr(obj, 'comment_count', None)
+        return obj.comments.count() if count is None else count
     
     def get_is_overdue(self, obj):
         return (
@@ -123,7 +153,7 @@ class TaskListSerializer(serializers.ModelSerializer):
             obj.status != 'done'
         )
 
-class TaskDetailSerializer(serializers.ModelSerializer):
+class TaskDetailSerializer(IncludedRelationsMixin, serializers.ModelSerializer):
     """Detailed serializer for task CRUD operations."""
     
     project = ProjectListSerializer(read_only=True)
@@ -147,7 +177,9 @@ class TaskDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'project', 'created_by', 'updated_by', 'created_at', 'updated_at']
     
     def get_comment_count(self, obj):
-        return obj.comments.count()
+        # TaskViewSet annotates the count; nested uses fall back to a query.
+        count = getattr(obj, 'comment_count', None)
+        return obj.comments.count() if count is None else count
     
     def update(self, instance, validated_data):
         """Handle assignee updates."""
@@ -188,7 +220,8 @@ class TaskCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Create task with assignees."""
         assignee_ids = validated_data.pop('assignee_ids', [])
-        project = self.context['project']
+        # perform_create passes the project to save(); fall back to the context for direct use.
+        project = validated_data.pop('project', None) or self.context['project']
         
         task = Task.objects.create(project=project, **validated_data)
         
@@ -234,8 +267,12 @@ class CommentCreateSerializer(serializers.ModelSerializer):
             author=author,
             **validated_data
         )
-        
-class ClientSerializer(serializers.ModelSerializer):
+
+
+class ActivityLogSerializer(serializers.ModelSerializer):
+    """Read-only activity log entry."""
+
     class Meta:
-        model = Client
-        fields = "__all__"
\ No newline at end of file
+        model = ActivityLog
+        fields = ['id', 'object_type', 'object_id', 'action', 'changes', 'actor', 'created_at']
+        read_only_fields = fields
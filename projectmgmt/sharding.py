@@ -0,0 +1,194 @@
+"""
+Tenant sharding.
+
+A client's projects, tasks, comments, activity and task statistics live in the
+database named by its ClientShard row (clients without one stay on the
+primary). Users, clients and memberships are authoritative on the primary and
+mirrored into every shard that holds one of the user's clients, so joins and
+foreign keys inside a shard keep working.
+
+Nested views resolve the shard from `client_pk` through ShardedViewMixin,
+which also makes ShardRouter send the request's projectmgmt queries there.
+Code running outside a request reaches a shard with `using_shard()` or an
+explicit `.using(alias)`; instances loaded from a shard keep routing there.
+"""
+import copy
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import APIException
+
+from main.replicas import pin_to_primary, primary_alias
+from .models import (
+    ActivityLog, Client, ClientMembership, ClientShard, Comment, Project, Task,
+    TaskAssigneeStat, TaskDueStat, TaskStat, User,
+)
+
+TENANT_MODELS = {
+    Project, Task, Task.assignees.through, Comment, ActivityLog, TaskStat, TaskAssigneeStat, TaskDueStat,
+}
+REFERENCE_MODELS = {User, Client, ClientMembership}
+
+# Alias the current request's tenant lives on; None means "not sharded".
+_current_shard = ContextVar("current_shard", default=None)
+
+# client_id -> (alias, state, valid_until), refreshed every SHARD_DIRECTORY_TTL seconds.
+_directory = {}
+
+
+def shard_aliases():
+    return list(getattr(settings, "SHARD_DATABASES", []))
+
+
+def lookup_shard(client_id):
+    """Return (alias, state) for a client; alias is None for clients on the primary."""
+    key = str(client_id)
+    cached = _directory.get(key)
+    if cached and time.monotonic() < cached[2]:
+        return cached[:2]
+
+    row = ClientShard.objects.using(primary_alias()).filter(client_id=client_id).values_list("alias", "state").first()
+    alias, state = row or (None, "active")
+    if alias == primary_alias():
+        alias = None
+    _directory[key] = (alias, state, time.monotonic() + getattr(settings, "SHARD_DIRECTORY_TTL", 5))
+    return alias, state
+
+
+def forget_shard(client_id=None):
+    if client_id is None:
+        _directory.clear()
+    else:
+        _directory.pop(str(client_id), None)
+
+
+@contextmanager
+def using_shard(alias):
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+class ShardRouter:
+    """Runs before ReplicaRouter; returns None whenever the tenant is on the primary."""
+
+    def _shard(self, model, hints):
+        if model not in TENANT_MODELS and model not in REFERENCE_MODELS:
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in shard_aliases():
+            return instance._state.db
+        return _current_shard.get()
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        # Reference rows are written on the primary and mirrored out by the receivers below.
+        if model in REFERENCE_MODELS:
+            pin_to_primary()
+            return primary_alias()
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        known = {primary_alias(), *shard_aliases(), *getattr(settings, "DATABASE_REPLICAS", [])}
+        if obj1._state.db in known and obj2._state.db in known:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ShardMigrating(APIException):
+    status_code = 503
+    default_detail = "This client is being moved; retry shortly."
+    default_code = "shard_migrating"
+
+
+class ShardedViewMixin:
+    """Resolve the tenant shard from `client_pk` once authentication and permissions have run."""
+
+    shard = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.shard, state = lookup_shard(self.kwargs.get("client_pk"))
+        if state == "frozen" and request.method not in ("GET", "HEAD", "OPTIONS"):
+            raise ShardMigrating()
+        self._shard_token = _current_shard.set(self.shard)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_shard_token", None)
+        if token is not None:
+            _current_shard.reset(token)
+            self._shard_token = None
+        if response.status_code == ShardMigrating.status_code:
+            response["Retry-After"] = str(getattr(settings, "SHARD_DIRECTORY_TTL", 5))
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def on_shard(self, queryset):
+        return queryset.using(self.shard) if self.shard else queryset
+
+
+def mirror_rows(model, instances, alias):
+    """Upsert copies of `instances` into `alias` without touching the originals."""
+    copies = [copy.copy(instance) for instance in instances]
+    if not copies:
+        return
+    fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+    model._base_manager.using(alias).bulk_create(
+        copies, update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=fields
+    )
+
+
+def shards_for_user(user_id):
+    client_ids = ClientMembership._base_manager.using(primary_alias()).filter(user_id=user_id).values("client_id")
+    return set(
+        ClientShard.objects.using(primary_alias()).filter(client_id__in=client_ids)
+        .exclude(alias=primary_alias()).values_list("alias", flat=True)
+    )
+
+
+def shards_for_client(client_id):
+    return set(
+        ClientShard.objects.using(primary_alias()).filter(client_id=client_id)
+        .exclude(alias=primary_alias()).values_list("alias", flat=True)
+    )
+
+
+@receiver(post_save, sender=User, dispatch_uid="shard_mirror_user")
+@receiver(post_save, sender=Client, dispatch_uid="shard_mirror_client")
+@receiver(post_save, sender=ClientMembership, dispatch_uid="shard_mirror_membership")
+def mirror_reference_row(sender, instance, raw=False, using=None, **kwargs):
+    if raw or using != primary_alias() or not shard_aliases():
+        return
+    if sender is User:
+        targets = shards_for_user(instance.pk)
+    elif sender is Client:
+        targets = shards_for_client(instance.pk)
+    else:
+        targets = shards_for_client(instance.client_id)
+
+    for alias in targets:
+        if sender is ClientMembership:
+            # The member must exist on the shard before the membership row can point at them.
+            mirror_rows(User, User.objects.using(primary_alias()).filter(pk=instance.user_id), alias)
+            ClientMembership._base_manager.using(alias).filter(
+                user_id=instance.user_id, client_id=instance.client_id
+            ).exclude(pk=instance.pk).delete()
+        mirror_rows(sender, [instance], alias)
+
+
+@receiver(post_delete, sender=ClientMembership, dispatch_uid="shard_unmirror_membership")
+def unmirror_membership(sender, instance, using=None, **kwargs):
+    if using != primary_alias() or not shard_aliases():
+        return
+    for alias in shards_for_client(instance.client_id):
+        ClientMembership._base_manager.using(alias).filter(pk=instance.pk).delete()
@@ -0,0 +1,289 @@
+"""
+Per-client task statistics maintained by deltas.
+
+Every Task write adjusts the TaskStat / TaskAssigneeStat / TaskDueStat rows it
+affects, so reading a client's stats touches O(projects) rollup rows instead of
+scanning the task table. Queryset-level update()/delete() bypass these
+receivers; `manage.py task_stats` reports drift and `--rebuild`
+recomputes from the task table.
+
+The delta needs the task's state before the write. It comes from the values
+the task was loaded with. When fields were deferred at load, the row is read
+in pre_save instead. A task that was never loaded but is saved as an update
+(force_update on a new instance) has no known old state, so its client's
+rollups are recomputed.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .activity import resolve_client_id
+from .models import Project, Task, TaskAssigneeStat, TaskDueStat, TaskStat
+
+
+def _bump(model, delta, using, **key):
+    if not delta:
+        return
+    rows = model.objects.using(using).filter(**key)
+    if rows.update(count=F("count") + delta):
+        return
+    try:
+        with transaction.atomic(using=using):
+            model.objects.using(using).create(count=delta, **key)
+    except IntegrityError:
+        # Someone else created the row between our update and insert.
+        rows.update(count=F("count") + delta)
+
+
+def _apply(counter, model, using):
+    for key, delta in counter.items():
+        _bump(model, delta, using, **dict(key))
+
+
+# Task attributes the rollups depend on.
+STATE_FIELDS = ("project_id", "status", "priority", "due_date", "is_deleted")
+
+_unknown = object()
+
+
+def _task_state(values):
+    """The part of a task row that the rollups depend on, or None when it counts for nothing."""
+    if values is None or values["is_deleted"]:
+        return None
+    return (values["project_id"], values["status"], values["priority"], values["due_date"])
+
+
+def _current_state(instance):
+    # getattr loads any field deferred at load time.
+    return _task_state({name: getattr(instance, name) for name in STATE_FIELDS})
+
+
+def _previous_state(instance):
+    """State before this save: from the loaded values, the row read in pre_save, or _unknown."""
+    if "_stats_previous" in instance.__dict__:
+        return _task_state(instance.__dict__.pop("_stats_previous"))
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is None or any(name not in loaded for name in STATE_FIELDS):
+        return _unknown
+    return _task_state(loaded)
+
+
+def _contribution(client_id, state, assignee_ids, sign):
+    """Deltas for one task in `state`, as three Counters keyed by rollup lookup kwargs."""
+    stats, assignees, due = Counter(), Counter(), Counter()
+    if state is None:
+        return stats, assignees, due
+    project_id, status, priority, due_date = state
+    base = (("client_id", client_id), ("project_id", project_id))
+    stats[base + (("status", status), ("priority", priority))] += sign
+    for user_id in assignee_ids:
+        assignees[base + (("user_id", user_id), ("status", status))] += sign
+    if due_date and status != "done":
+        due[base + (("due_date", due_date),)] += sign
+    return stats, assignees, due
+
+
+def _apply_contributions(using, *contributions):
+    stats, assignees, due = Counter(), Counter(), Counter()
+    for s, a, d in contributions:
+        stats.update(s)
+        assignees.update(a)
+        due.update(d)
+    _apply(stats, TaskStat, using)
+    _apply(assignees, TaskAssigneeStat, using)
+    _apply(due, TaskDueStat, using)
+
+
+def _client_id_for_project(project_id, using):
+    return Project._base_manager.using(using).values_list("client_id", flat=True).get(pk=project_id)
+
+
+@receiver(pre_save, sender=Task, dispatch_uid="task_stats_pre_save")
+def read_previous_task_state(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    """Read the row about to be overwritten when the loaded values cannot tell its state."""
+    if raw or (instance._state.adding and update_fields is None):
+        return
+    loaded = getattr(instance, "_loaded_values", None)
+    if loaded is not None and all(name in loaded for name in STATE_FIELDS):
+        return
+    instance._stats_previous = Task._base_manager.using(using).filter(pk=instance.pk).values(*STATE_FIELDS).first()
+
+
+@receiver(post_save, sender=Task, dispatch_uid="task_stats_save")
+def update_task_stats(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old = None if created else _previous_state(instance)
+    new = _current_state(instance)
+    if old == new:
+        return
+
+    client_id = resolve_client_id(instance) or _client_id_for_project(instance.project_id, using)
+    if old is _unknown:
+        rebuild_stats(client_id, using)
+        return
+    old_client_id = client_id
+    if old and old[0] != instance.project_id:
+        old_client_id = _client_id_for_project(old[0], using)
+
+    # Assignees only matter if the per-assignee key (project, status) or liveness moved.
+    assignee_ids = []
+    if not created and (old is None or new is None or old[:2] != new[:2]):
+        assignee_ids = list(instance.assignees.values_list("pk", flat=True))
+
+    with transaction.atomic(using=using):
+        _apply_contributions(
+            using,
+            _contribution(old_client_id, old, assignee_ids, -1),
+            _contribution(client_id, new, assignee_ids, +1),
+        )
+
+
+@receiver(pre_delete, sender=Task, dispatch_uid="task_stats_delete")
+def remove_task_stats(sender, instance, using=None, **kwargs):
+    state = _current_state(instance)
+    if state is None:
+        return
+    client_id = resolve_client_id(instance) or _client_id_for_project(instance.project_id, using)
+    assignee_ids = list(instance.assignees.values_list("pk", flat=True))
+    _apply_contributions(using, _contribution(client_id, state, assignee_ids, -1))
+
+
+@receiver(m2m_changed, sender=Task.assignees.through, dispatch_uid="task_stats_assignees")
+def update_assignee_stats(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    sign = 1 if action == "post_add" else -1
+
+    if not reverse:
+        state = _current_state(instance)
+        if state is None:
+            return
+        if action == "pre_clear":
+            pk_set = set(instance.assignees.values_list("pk", flat=True))
+        client_id = resolve_client_id(instance) or _client_id_for_project(instance.project_id, using)
+        counter = Counter()
+        for user_id in pk_set or ():
+            counter[(("client_id", client_id), ("project_id", state[0]), ("user_id", user_id), ("status", state[1]))] += sign
+        _apply(counter, TaskAssigneeStat, using)
+        return
+
+    # user.assigned_tasks.add(...): instance is the user, pk_set holds task ids.
+    tasks = Task.objects.using(using)
+    tasks = tasks.filter(pk__in=pk_set) if action != "pre_clear" else tasks.filter(assignees=instance)
+    counter = Counter()
+    for client_id, project_id, status in tasks.values_list("project__client_id", "project_id", "status"):
+        counter[(("client_id", client_id), ("project_id", project_id), ("user_id", instance.pk), ("status", status))] += sign
+    _apply(counter, TaskAssigneeStat, using)
+
+
+def expected_stats(client_id=None, using="default"):
+    """Recompute all three rollups from the task table with GROUP BY queries."""
+    tasks = Task.objects.using(using).all()
+    if client_id is not None:
+        tasks = tasks.filter(project__client_id=client_id)
+
+    stats = {
+        (("client_id", c), ("project_id", p), ("status", s), ("priority", pr)): n
+        for c, p, s, pr, n in tasks.values("project__client_id", "project_id", "status", "priority")
+        .annotate(n=Count("id")).order_by()
+        .values_list("project__client_id", "project_id", "status", "priority", "n")
+    }
+    assignees = {
+        (("client_id", c), ("project_id", p), ("user_id", u), ("status", s)): n
+        for c, p, u, s, n in tasks.filter(assignees__isnull=False)
+        .values("project__client_id", "project_id", "assignees", "status")
+        .annotate(n=Count("id")).order_by()
+        .values_list("project__client_id", "project_id", "assignees", "status", "n")
+    }
+    due = {
+        (("client_id", c), ("project_id", p), ("due_date", d)): n
+        for c, p, d, n in tasks.filter(~Q(status="done"), due_date__isnull=False)
+        .values("project__client_id", "project_id", "due_date")
+        .annotate(n=Count("id")).order_by()
+        .values_list("project__client_id", "project_id", "due_date", "n")
+    }
+    return {TaskStat: stats, TaskAssigneeStat: assignees, TaskDueStat: due}
+
+
+def stored_stats(model, client_id=None, using="default"):
+    key_fields = [f.attname for f in model._meta.concrete_fields if f.name not in ("id", "count")]
+    rows = model.objects.using(using).exclude(count=0)
+    if client_id is not None:
+        rows = rows.filter(client_id=client_id)
+    return {
+        tuple(zip(key_fields, values[:-1])): values[-1]
+        for values in rows.values_list(*key_fields, "count")
+    }
+
+
+def find_drift(client_id=None, using="default"):
+    """Return {model: {key: (stored, expected)}} for every rollup row that disagrees."""
+    drift = {}
+    for model, expected in expected_stats(client_id, using).items():
+        stored = stored_stats(model, client_id, using)
+        diff = {
+            key: (stored.get(key, 0), expected.get(key, 0))
+            for key in stored.keys() | expected.keys()
+            if stored.get(key, 0) != expected.get(key, 0)
+        }
+        if diff:
+            drift[model] = diff
+    return drift
+
+
+def rebuild_stats(client_id=None, using="default"):
+    with transaction.atomic(using=using):
+        for model, expected in expected_stats(client_id, using).items():
+            rows = model.objects.using(using).all()
+            if client_id is not None:
+                rows = rows.filter(client_id=client_id)
+            rows.delete()
+            model.objects.using(using).bulk_create(
+                [model(count=count, **dict(key)) for key, count in expected.items()],
+                batch_size=1000,
+            )
+
+
+def client_stats(client_id, today, using=None):
+    """Assemble a client's task statistics from rollup rows only."""
+    live = {"client_id": client_id, "project__is_deleted": False}
+    summary = {
+        "total": 0,
+        "overdue": 0,
+        "by_status": Counter(),
+        "by_priority": Counter(),
+        "by_project": {},
+        "by_assignee": {},
+    }
+
+    rows = TaskStat.objects.using(using).filter(**live).exclude(count=0)
+    for project_id, project_name, status, priority, count in rows.values_list(
+        "project_id", "project__name", "status", "priority", "count"
+    ):
+        project = summary["by_project"].setdefault(
+            project_id, {"project_id": project_id, "name": project_name, "total": 0, "by_status": Counter()}
+        )
+        project["total"] += count
+        project["by_status"][status] += count
+        summary["by_status"][status] += count
+        summary["by_priority"][priority] += count
+        summary["total"] += count
+
+    rows = TaskAssigneeStat.objects.using(using).filter(**live).exclude(count=0)
+    for user_id, username, status, count in rows.values_list("user_id", "user__username", "status", "count"):
+        member = summary["by_assignee"].setdefault(
+            user_id, {"user_id": user_id, "username": username, "total": 0, "by_status": Counter()}
+        )
+        member["total"] += count
+        member["by_status"][status] += count
+
+    rows = TaskDueStat.objects.using(using).filter(due_date__lt=today, **live)
+    summary["overdue"] = sum(rows.values_list("count", flat=True))
+
+    summary["by_project"] = list(summary["by_project"].values())
+    summary["by_assignee"] = list(summary["by_assignee"].values())
+    return summary
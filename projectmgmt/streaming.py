@@ -0,0 +1,54 @@
+"""
+Streamed JSON lists.
+
+The nested project, task and comment routes are not paginated, so a big
+project's task list used to be serialized in full, rendered into one bytes
+object and only then sent. StreamedListMixin leaves lists of up to
+STREAMED_LIST_THRESHOLD rows alone. Longer ones are read from a chunked
+cursor and rendered STREAMED_LIST_CHUNK_SIZE rows at a time into a JSON
+array; prefetch_related runs once per chunk. Peak memory then follows the
+chunk size, not the list.
+
+The chunks render after the view has returned, when ShardedViewMixin has
+already reset the tenant's shard, so each one runs under the shard the view
+used. Their queries also happen after the headers are sent: X-Query-Count
+on a streamed list covers only the read of the first chunk's rows.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .sharding import using_shard
+
+
+class StreamedListMixin:
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None or not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+        threshold = getattr(settings, 'STREAMED_LIST_THRESHOLD', 200)
+        chunk_size = getattr(settings, 'STREAMED_LIST_CHUNK_SIZE', 100)
+
+        rows = self.filter_queryset(self.get_queryset()).iterator(chunk_size=chunk_size)
+        head = list(islice(rows, threshold + 1))
+        if len(head) <= threshold:
+            return Response(self.get_serializer(head, many=True).data)
+        return StreamingHttpResponse(
+            self.render_chunks(head, rows, chunk_size, request.accepted_renderer, getattr(self, 'shard', None)),
+            content_type=f"{request.accepted_renderer.media_type}; charset=utf-8",
+        )
+
+    def render_chunks(self, head, rows, chunk_size, renderer, shard):
+        separator = b'['
+        chunk = head
+        while chunk:
+            # Not across the yield: the context would leak into whatever the server runs in between.
+            with using_shard(shard):
+                # Each chunk renders as "[...]"; keep the items and join them into one array.
+                data = renderer.render(self.get_serializer(chunk, many=True).data)[1:-1]
+                chunk = list(islice(rows, chunk_size))
+            yield separator + data
+            separator = b','
+        yield b']'
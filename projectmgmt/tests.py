@@ -1,3 +1,723 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from dbopt.testing import QueryBudgetMixin
+from main import replicas
+from main.compression import choose_encoding
+from .admin import CachedCountPaginator
+from .models import User, Client, ClientMembership, ClientShard, Project, Task, Comment, ActivityLog, TaskStat
+from .sharding import forget_shard
+from .stats import client_stats, find_drift
+from .views import TaskViewSet
+
+
+def replica_down(alias):
+    return False
+
+
+def replica_lagging(alias):
+    return 60
+
+
+class SQLiteFilesTestCase(TransactionTestCase):
+    """Adds `file_aliases` as migrated SQLite files in a temporary directory."""
+
+    file_aliases = ()
+
+    @classmethod
+    def setUpClass(cls):
+        # The aliases only exist once added here, so they can't be declared up front.
+        cls.databases = {"default", *cls.file_aliases}
+        cls.tmpdir = tempfile.mkdtemp()
+        for alias in cls.file_aliases:
+            connections.settings[alias] = {
+                **connections.settings["default"],
+                "NAME": os.path.join(cls.tmpdir, f"{alias}.sqlite3"),
+            }
+            call_command("migrate", database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.file_aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.tmpdir)
+
+
+class ReplicaRoutingTests(SQLiteFilesTestCase):
+    """Primary and replica are two SQLite files seeded with the same rows under different names."""
+
+    file_aliases = ("primary", "replica")
+
+    def setUp(self):
+        self.routing = override_settings(
+            DATABASE_PRIMARY="primary", DATABASE_REPLICAS=["replica"], REPLICA_STICKY_SECONDS=30
+        )
+        self.routing.enable()
+        self.addCleanup(self.routing.disable)
+        replicas._health.clear()
+        cache.clear()
+
+        self.user = None
+        for alias in ("primary", "replica"):
+            user = User(username="alice")
+            if self.user:
+                user.pk = self.user.pk
+            user.save(using=alias)
+            client = Client(name=f"acme on {alias}", slug="acme")
+            if alias == "replica":
+                client.pk = self.client_pk
+            client.save(using=alias)
+            ClientMembership(user=user, client=client, role="owner").save(using=alias)
+            self.user, self.client_pk = self.user or user, client.pk
+
+    def api(self, caller="caller-1"):
+        api = APIClient(HTTP_X_API_KEY=caller)
+        api.force_authenticate(self.user)
+        return api
+
+    def client_names(self, api):
+        response = api.get("/api/clients/")
+        self.assertEqual(response.status_code, 200)
+        return {row["name"] for row in response.json()["results"]}
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.client_names(self.api()), {"acme on replica"})
+
+    def test_caller_sticks_to_primary_after_write(self):
+        api = self.api()
+        response = api.post("/api/clients/", {"name": "new", "slug": "new"}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.client_names(api), {"acme on primary", "new"})
+        # Other callers are unaffected by someone else's write.
+        self.assertEqual(self.client_names(self.api("caller-2")), {"acme on replica"})
+
+    def test_stickiness_expires(self):
+        api = self.api()
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            api.post("/api/clients/", {"name": "new", "slug": "new"}, format="json")
+        self.assertEqual(self.client_names(api), {"acme on replica"})
+
+    @override_settings(REPLICA_HEALTH_CHECK="projectmgmt.tests.replica_down")
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        self.assertEqual(self.client_names(self.api()), {"acme on primary"})
+
+    @override_settings(REPLICA_LAG_CHECK="projectmgmt.tests.replica_lagging", REPLICA_MAX_LAG_SECONDS=5)
+    def test_lagging_replica_falls_back_to_primary(self):
+        self.assertEqual(self.client_names(self.api()), {"acme on primary"})
+
+    def test_marked_down_replica_is_skipped(self):
+        replicas.mark_replica_down("replica", seconds=60)
+        self.assertEqual(self.client_names(self.api()), {"acme on primary"})
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(Client.objects.get(pk=self.client_pk).name, "acme on primary")
+
+
+@override_settings(SHARD_DATABASES=["shard_a"], SHARD_DIRECTORY_TTL=0)
+class TenantShardingTests(SQLiteFilesTestCase):
+    """The test database is the primary; shard_a is a separate SQLite file."""
+
+    file_aliases = ("shard_a",)
+
+    def setUp(self):
+        forget_shard()
+        cache.clear()
+        self.owner = User.objects.create(username="owner")
+        self.tenant = Client.objects.create(name="acme", slug="acme")
+        ClientMembership.objects.create(user=self.owner, client=self.tenant, role="owner")
+        self.api = APIClient()
+        self.api.force_authenticate(self.owner)
+
+        self.base = f"/api/clients/{self.tenant.pk}/projects/"
+        response = self.api.post(self.base, {"name": "web", "slug": "web"}, format="json")
+        self.project_id = Project.objects.get(slug="web").pk
+        self.tasks_url = f"{self.base}{self.project_id}/tasks/"
+        for title in ("one", "two"):
+            self.api.post(self.tasks_url, {"title": title, "assignee_ids": [str(self.owner.pk)]}, format="json")
+        self.task_id = Task.objects.get(title="one").pk
+        self.api.post(f"{self.tasks_url}{self.task_id}/comments/", {"content": "hi"}, format="json")
+
+    def move(self, target):
+        call_command("move_client", str(self.tenant.pk), target, settle=0, batch_size=1, stdout=StringIO())
+
+    def test_move_copies_rows_and_empties_source(self):
+        self.move("shard_a")
+
+        self.assertEqual(ClientShard.objects.get(client=self.tenant).alias, "shard_a")
+        self.assertFalse(Project.objects.using("default").filter(client=self.tenant).exists())
+        self.assertFalse(Task.objects.using("default").filter(project_id=self.project_id).exists())
+        self.assertEqual(Task.objects.using("shard_a").filter(project_id=self.project_id).count(), 2)
+        self.assertEqual(Comment.objects.using("shard_a").filter(task_id=self.task_id).count(), 1)
+        self.assertEqual(Task.objects.using("shard_a").get(pk=self.task_id).assignees.count(), 1)
+        self.assertTrue(ActivityLog.objects.using("shard_a").filter(client_id=self.tenant.pk).exists())
+        self.assertEqual(sum(TaskStat.objects.using("shard_a").values_list("count", flat=True)), 2)
+
+    def test_nested_views_follow_the_shard(self):
+        self.move("shard_a")
+
+        response = self.api.get(self.tasks_url)
+        self.assertEqual({t["title"] for t in response.json()}, {"one", "two"})
+        response = self.api.post(self.tasks_url, {"title": "three"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Task.objects.using("shard_a").filter(title="three").exists())
+        self.assertFalse(Task.objects.using("default").filter(title="three").exists())
+
+        response = self.api.get(f"/api/clients/{self.tenant.pk}/")
+        self.assertEqual(response.json()["project_count"], 1)
+        response = self.api.get(f"/api/clients/{self.tenant.pk}/stats/")
+        self.assertEqual(response.json()["total"], 3)
+
+    @override_settings(STREAMED_LIST_THRESHOLD=1, STREAMED_LIST_CHUNK_SIZE=1)
+    def test_streamed_lists_follow_the_shard(self):
+        self.move("shard_a")
+        routed = []
+        get_serializer = TaskViewSet.get_serializer
+
+        def record_route(view, *args, **kwargs):
+            # Where a read with no instance hint (a reference model, say) would go while a chunk renders.
+            routed.append(router.db_for_read(User))
+            return get_serializer(view, *args, **kwargs)
+
+        with mock.patch.object(TaskViewSet, "get_serializer", record_route):
+            response = self.api.get(self.tasks_url)
+            self.assertTrue(response.streaming)
+            tasks = json.loads(b"".join(response.streaming_content))
+        self.assertEqual({t["title"] for t in tasks}, {"one", "two"})
+        self.assertEqual(set(routed), {"shard_a"})
+
+    def test_new_members_are_mirrored_to_the_shard(self):
+        self.move("shard_a")
+        member = User.objects.create(username="member")
+        ClientMembership.objects.create(user=member, client=self.tenant, role="member")
+
+        self.assertTrue(ClientMembership.objects.using("shard_a").filter(user=member).exists())
+        response = self.api.patch(
+            f"{self.tasks_url}{self.task_id}/", {"assignee_ids": [str(member.pk)]}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_frozen_client_refuses_writes(self):
+        ClientShard.objects.create(client=self.tenant, alias="default", state="frozen")
+        response = self.api.post(self.tasks_url, {"title": "late"}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.api.get(self.tasks_url).status_code, 200)
+
+    def test_move_back_to_primary(self):
+        self.move("shard_a")
+        self.move("default")
+
+        self.assertEqual(Task.objects.using("default").filter(project_id=self.project_id).count(), 2)
+        self.assertFalse(Task.objects.using("shard_a").exists())
+        self.assertFalse(Client.objects.using("shard_a").filter(pk=self.tenant.pk).exists())
+
+
+class QueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    """
+    Every projectmgmt route is measured, the tenant is grown by GROW rows of each kind, and
+    it is measured again: the count must not move and must stay within the route's budget.
+    """
+
+    GROW = 5
+    # (url name, method) -> queries allowed, middleware and authentication included.
+    BUDGETS = {
+        ("clients-list", "get"): 2,
+        ("clients-list", "post"): 5,
+        ("clients-detail", "get"): 1,
+        ("clients-detail", "patch"): 2,
+        ("clients-detail", "delete"): 2,
+        ("clients-stats", "get"): 5,
+        ("clients-activity", "get"): 3,
+        ("client-projects-list", "get"): 3,
+        ("client-projects-list", "post"): 6,
+        ("client-projects-detail", "get"): 4,
+        ("client-projects-detail", "patch"): 5,
+        ("client-projects-detail", "delete"): 7,
+        ("project-tasks-list", "get"): 4,
+        ("project-tasks-list", "post"): 15,
+        ("project-tasks-detail", "get"): 7,
+        ("project-tasks-detail", "patch"): 12,
+        ("project-tasks-detail", "delete"): 11,
+        ("task-comments-list", "get"): 3,
+        ("task-comments-list", "post"): 5,
+        ("task-comments-detail", "get"): 4,
+        ("task-comments-detail", "patch"): 5,
+        ("task-comments-detail", "delete"): 7,
+        ("batch", "post"): 9,
+    }
+
+    def setUp(self):
+        cache.clear()
+        forget_shard()
+        self.owner = User.objects.create(username="owner")
+        self.tenant = Client.objects.create(name="acme", slug="acme")
+        ClientMembership.objects.create(user=self.owner, client=self.tenant, role="owner")
+        self.project = Project.objects.create(client=self.tenant, name="web", slug="web", created_by=self.owner)
+        self.task = Task.objects.create(project=self.project, title="one", created_by=self.owner)
+        self.task.assignees.add(self.owner)
+        self.comment = Comment.objects.create(task=self.task, author=self.owner, content="hi")
+        self.api = APIClient()
+        self.api.force_authenticate(self.owner)
+        self.serial = 0
+
+    def grow(self):
+        """Add GROW rows of every kind the routes read: clients, members, projects, tasks, assignees, comments."""
+        for _ in range(self.GROW):
+            n = self.next_serial()
+            other = Client.objects.create(name=f"other {n}", slug=f"other-{n}")
+            ClientMembership.objects.create(user=self.owner, client=other, role="member")
+            member = User.objects.create(username=f"member-{n}")
+            ClientMembership.objects.create(user=member, client=self.tenant, role="member")
+            project = Project.objects.create(client=self.tenant, name=f"p{n}", slug=f"p{n}", created_by=member)
+            Task.objects.create(project=project, title=f"t{n}")
+            task = Task.objects.create(project=self.project, title=f"t{n}", created_by=member)
+            task.assignees.add(self.owner, member)
+            Comment.objects.create(task=task, author=member, content="x")
+            Comment.objects.create(task=self.task, author=member, content="x")
+
+    def next_serial(self):
+        self.serial += 1
+        return self.serial
+
+    def call(self, method, path, data=None, status=200):
+        response = getattr(self.api, method)(path, data, format="json")
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def check(self, name, method, path, data=None, status=200, prepare=None):
+        """Measure `method path` against BUDGETS[(name, method)]; `path`/`data` may be callables."""
+        def request(target=None):
+            url = path(target) if callable(path) else path
+            return self.call(method, url, data() if callable(data) else data, status)
+
+        self.assertQueryBudget(
+            f"{method.upper()} {name}", request, self.BUDGETS[(name, method)], grow=self.grow, prepare=prepare
+        )
+
+    @property
+    def client_url(self):
+        return f"/api/clients/{self.tenant.pk}/"
+
+    @property
+    def project_url(self):
+        return f"{self.client_url}projects/{self.project.pk}/"
+
+    @property
+    def task_url(self):
+        return f"{self.project_url}tasks/{self.task.pk}/"
+
+    def test_every_route_has_a_budget(self):
+        from .urls import urlpatterns
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names - {name for name, _ in self.BUDGETS}, set())
+
+    def test_clients(self):
+        self.check("clients-list", "get", "/api/clients/")
+        self.check("clients-detail", "get", self.client_url)
+        self.check("clients-detail", "patch", self.client_url, {"name": "acme"})
+        self.check("clients-stats", "get", f"{self.client_url}stats/")
+        self.check("clients-activity", "get", f"{self.client_url}activity/")
+
+    def test_client_writes(self):
+        self.check(
+            "clients-list", "post", "/api/clients/",
+            lambda: {"name": "new", "slug": f"new-{self.next_serial()}"}, status=201,
+        )
+        self.check(
+            "clients-detail", "delete", lambda client: f"/api/clients/{client.pk}/", status=204,
+            prepare=lambda: self.owned_client(),
+        )
+
+    def owned_client(self):
+        n = self.next_serial()
+        client = Client.objects.create(name=f"gone {n}", slug=f"gone-{n}")
+        ClientMembership.objects.create(user=self.owner, client=client, role="owner")
+        return client
+
+    def test_projects(self):
+        base = f"{self.client_url}projects/"
+        self.check("client-projects-list", "get", base)
+        self.check(
+            "client-projects-list", "post", base,
+            lambda: {"name": "new", "slug": f"new-{self.next_serial()}"}, status=201,
+        )
+        self.check("client-projects-detail", "get", self.project_url)
+        self.check("client-projects-detail", "patch", self.project_url, {"status": "active"})
+        self.check(
+            "client-projects-detail", "delete", lambda project: f"{base}{project.pk}/", status=204,
+            prepare=lambda: Project.objects.create(client=self.tenant, name="gone", slug=f"gone-{self.next_serial()}"),
+        )
+
+    def test_tasks(self):
+        base = f"{self.project_url}tasks/"
+        self.check("project-tasks-list", "get", base)
+        self.check(
+            "project-tasks-list", "post", base,
+            {"title": "new", "assignee_ids": [str(self.owner.pk)]}, status=201,
+        )
+        self.check("project-tasks-detail", "get", self.task_url)
+        self.check(
+            "project-tasks-detail", "patch", self.task_url,
+            {"status": "in_progress", "assignee_ids": [str(self.owner.pk)]},
+        )
+        self.check(
+            "project-tasks-detail", "delete", lambda task: f"{base}{task.pk}/", status=204,
+            prepare=lambda: Task.objects.create(project=self.project, title="gone"),
+        )
+
+    def test_comments(self):
+        base = f"{self.task_url}comments/"
+        comment_url = f"{base}{self.comment.pk}/"
+        self.check("task-comments-list", "get", base)
+        self.check("task-comments-list", "post", base, {"content": "new"}, status=201)
+        self.check("task-comments-detail", "get", comment_url)
+        self.check("task-comments-detail", "patch", comment_url, {"content": "edited"})
+        self.check(
+            "task-comments-detail", "delete", lambda comment: f"{base}{comment.pk}/", status=204,
+            prepare=lambda: Comment.objects.create(task=self.task, author=self.owner, content="gone"),
+        )
+
+    def test_includes(self):
+        # The whole tree in a fixed number of queries, whatever grow() adds under it.
+        self.assertQueryBudget(
+            "GET client-projects-detail ?include",
+            lambda: self.call("get", f"{self.project_url}?include=tasks,tasks.comments,members"), 8, grow=self.grow,
+        )
+        self.assertQueryBudget(
+            "GET project-tasks-list ?include",
+            lambda: self.call("get", f"{self.project_url}tasks/?include=comments"), 5, grow=self.grow,
+        )
+
+    def test_batch(self):
+        # The project page: client, project, its tasks and one task's comments in one request.
+        paths = [self.client_url, self.project_url, f"{self.project_url}tasks/", f"{self.task_url}comments/"]
+        self.check("batch", "post", "/api/batch/", {"requests": [{"path": path} for path in paths]})
+
+
+class ActivityLogTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenant = Client.objects.create(name="acme", slug="acme")
+            ClientMembership.objects.create(user=self.owner, client=self.tenant, role="owner")
+            self.project = Project.objects.create(client=self.tenant, name="web", slug="web")
+        ActivityLog.objects.all().delete()
+        self.api = APIClient()
+        self.api.force_authenticate(self.owner)
+        self.url = f"/api/clients/{self.tenant.pk}/activity/"
+
+    def titles(self):
+        return [entry.changes["title"][1] for entry in ActivityLog.objects.filter(action="create").order_by("id")]
+
+    def test_one_insert_per_transaction_with_field_diffs(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                task = Task.objects.create(project=self.project, title="one", created_by=self.owner)
+                task.status = "done"
+                task.save(update_fields=["status"])
+                Comment.objects.create(task=task, author=self.owner, content="hi")
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "activity_log"')]
+        self.assertEqual(len(inserts), 1)
+        entries = list(ActivityLog.objects.order_by("id"))
+        self.assertEqual(
+            [(entry.object_type, entry.action) for entry in entries],
+            [("task", "create"), ("task", "update"), ("comment", "create")],
+        )
+        self.assertEqual(entries[1].changes, {"status": ["todo", "done"]})
+        self.assertEqual({entry.client_id for entry in entries}, {self.tenant.pk})
+        self.assertEqual({entry.actor_id for entry in entries}, {self.owner.pk})
+
+    def test_rolled_back_savepoints_drop_their_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Task.objects.create(project=self.project, title="kept")
+                for title in ("dropped", "kept too", "dropped last"):
+                    try:
+                        with transaction.atomic():
+                            Task.objects.create(project=self.project, title=title)
+                            if title.startswith("dropped"):
+                                raise RuntimeError
+                    except RuntimeError:
+                        pass
+        self.assertEqual(self.titles(), ["kept", "kept too"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Task.objects.create(project=self.project, title="rolled back")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                Task.objects.create(project=self.project, title="next")
+        self.assertEqual(self.titles(), ["kept", "kept too", "next"])
+
+    def test_pages_newest_first(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks = [Task.objects.create(project=self.project, title=f"t{n}") for n in range(5)]
+        first = self.api.get(self.url, {"limit": 3}).json()
+        self.assertEqual([entry["changes"]["title"][1] for entry in first["results"]], ["t4", "t3", "t2"])
+        second = self.api.get(self.url, {"limit": 3, "before": first["next_before"]}).json()
+        self.assertEqual([entry["changes"]["title"][1] for entry in second["results"]], ["t1", "t0"])
+        self.assertIsNone(second["next_before"])
+
+        self.assertEqual(len(self.api.get(self.url, {"limit": -1}).json()["results"]), 1)
+        one = self.api.get(self.url, {"object_type": "task", "object_id": str(tasks[0].pk)}).json()
+        self.assertEqual([entry["object_id"] for entry in one["results"]], [str(tasks[0].pk)])
+        for params in ({"object_type": "task", "object_id": "nope"}, {"limit": "x"}):
+            self.assertEqual(self.api.get(self.url, params).status_code, 400, params)
+
+    def test_prune_activity(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for title in ("old", "new"):
+                Task.objects.create(project=self.project, title=title)
+        ActivityLog.objects.filter(changes__title__1="old").update(created_at=timezone.now() - timedelta(days=91))
+        out = StringIO()
+        call_command("prune_activity", "--days", "90", "--batch-size", "1", stdout=out)
+        self.assertIn("Pruned 1 activity entries", out.getvalue())
+        self.assertEqual(self.titles(), ["new"])
+
+
+class TaskStatsTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = User.objects.create(username="alice"), User.objects.create(username="bob")
+        self.tenant = Client.objects.create(name="acme", slug="acme")
+        self.web = Project.objects.create(client=self.tenant, name="web", slug="web")
+        self.app = Project.objects.create(client=self.tenant, name="app", slug="app")
+        self.today = timezone.now().date()
+
+    def assertNoDrift(self):
+        self.assertEqual(find_drift(self.tenant.pk), {})
+
+    def test_deltas_follow_task_writes(self):
+        task = Task.objects.create(project=self.web, title="one", due_date=self.today - timedelta(days=1))
+        task.assignees.add(self.alice, self.bob)
+        Task.objects.create(project=self.web, title="two", priority="high")
+        self.assertNoDrift()
+        stats = client_stats(self.tenant.pk, self.today)
+        self.assertEqual((stats["total"], stats["overdue"], stats["by_priority"]["high"]), (2, 1, 1))
+
+        task = Task.objects.get(pk=task.pk)
+        task.status = "done"
+        task.project = self.app
+        task.save()
+        self.assertNoDrift()
+        task.assignees.remove(self.bob)
+        self.alice.assigned_tasks.clear()
+        self.assertNoDrift()
+        task.delete()
+        self.assertNoDrift()
+        Task.objects.get(title="two").hard_delete()
+        self.assertNoDrift()
+        self.assertEqual(client_stats(self.tenant.pk, self.today)["total"], 0)
+
+    def test_deferred_and_unloaded_tasks(self):
+        task = Task.objects.create(project=self.web, title="one")
+        task.assignees.add(self.alice)
+
+        partial = Task.objects.only("title").get(pk=task.pk)
+        partial.status = "in_progress"
+        partial.save()
+        self.assertNoDrift()
+
+        # Built, not loaded, but known to exist: the old row is read before it is overwritten.
+        built = Task(pk=task.pk, project=self.app, title="one", status="done", created_at=task.created_at)
+        built._state.adding = False
+        built.save()
+        self.assertNoDrift()
+        # Never loaded and saved as an update: the old state is unknown, not a new task.
+        Task(
+            pk=task.pk, project=self.web, title="one", priority="low", created_at=timezone.now()
+        ).save(force_update=True)
+        self.assertNoDrift()
+        self.assertEqual(client_stats(self.tenant.pk, self.today)["total"], 1)
+
+    def test_task_stats_command_checks_and_rebuilds(self):
+        Task.objects.create(project=self.web, title="one")
+        out = StringIO()
+        call_command("task_stats", stdout=out)
+        self.assertIn("consistent", out.getvalue())
+
+        # Queryset updates bypass the receivers.
+        Task.objects.filter(project=self.web).update(status="done")
+        out = StringIO()
+        with self.assertRaises(SystemExit):
+            call_command("task_stats", "--client", str(self.tenant.pk), stdout=out, stderr=StringIO())
+        self.assertIn("TaskStat: 2 rows drifted", out.getvalue())
+
+        call_command("task_stats", "--rebuild", stdout=StringIO())
+        self.assertNoDrift()
+
+
+class AdminChangelistTests(TestCase):
+    MODELS = ("client", "clientmembership", "project", "task", "comment")
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username="admin", password="secret", email="admin@example.com")
+        self.client.force_login(self.admin)
+        self.serial = 0
+        self.grow()
+
+    def grow(self):
+        for _ in range(3):
+            self.serial += 1
+            tenant = Client.objects.create(name=f"c{self.serial}", slug=f"c{self.serial}")
+            member = User.objects.create(username=f"u{self.serial}")
+            ClientMembership.objects.create(user=member, client=tenant)
+            project = Project.objects.create(client=tenant, name="web", slug="web")
+            task = Task.objects.create(project=project, title="t")
+            Comment.objects.create(task=task, author=member, content="c")
+
+    def assertChangelistQueries(self):
+        for model in self.MODELS:
+            self.client.get(f"/admin/projectmgmt/{model}/")  # counts the rows once
+        for model in self.MODELS:
+            # Session, user and the page itself; the cached count costs nothing.
+            with self.assertNumQueries(3):
+                self.assertEqual(self.client.get(f"/admin/projectmgmt/{model}/").status_code, 200)
+
+    def test_changelists_run_constant_queries(self):
+        self.assertChangelistQueries()
+        self.grow()
+        cache.clear()
+        self.assertChangelistQueries()
+
+    def test_estimate_applies_to_the_soft_delete_filter_only(self):
+        self.assertTrue(CachedCountPaginator.unfiltered(Task.objects.order_by("-created_at")))
+        self.assertFalse(CachedCountPaginator.unfiltered(Task.objects.filter(status="done")))
+        self.assertFalse(CachedCountPaginator.unfiltered(Task.objects.all_with_deleted()))
+
+
+class IncludeTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.tenant = Client.objects.create(name="acme", slug="acme")
+        ClientMembership.objects.create(user=self.owner, client=self.tenant, role="owner")
+        self.project = Project.objects.create(client=self.tenant, name="web", slug="web", created_by=self.owner)
+        self.task = Task.objects.create(project=self.project, title="one", created_by=self.owner)
+        Task.objects.create(project=self.project, title="two", created_by=self.owner)
+        Task.objects.create(project=self.project, title="gone", created_by=self.owner).delete()
+        for n in range(3):
+            Comment.objects.create(task=self.task, author=self.owner, content=f"c{n}")
+        Comment.objects.create(task=self.task, author=self.owner, content="deleted").delete()
+        self.api = APIClient()
+        self.api.force_authenticate(self.owner)
+        self.project_url = f"/api/clients/{self.tenant.pk}/projects/{self.project.pk}/"
+
+    def test_nests_live_rows_with_per_parent_limits(self):
+        data = self.api.get(self.project_url, {"include": "tasks,tasks.comments:2,members"}).json()
+        self.assertEqual({task["title"] for task in data["tasks"]}, {"one", "two"})
+        one = next(task for task in data["tasks"] if task["title"] == "one")
+        self.assertEqual([comment["content"] for comment in one["comments"]], ["c2", "c1"])
+        self.assertEqual(one["comment_count"], 3)
+        self.assertEqual([member["user"]["username"] for member in data["members"]], ["owner"])
+
+        tasks = self.api.get(f"{self.project_url}tasks/", {"include": "comments"}).json()
+        self.assertEqual(sum(len(task["comments"]) for task in tasks), 3)
+        self.assertNotIn("comments", self.api.get(f"{self.project_url}tasks/").json()[0])
+
+    def test_rejects_unknown_paths_and_limits(self):
+        for include in ("tasks.bogus", "comments", "tasks:0", "tasks:999"):
+            self.assertEqual(self.api.get(self.project_url, {"include": include}).status_code, 400, include)
+
+
+class CompressedStreamingTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.tenant = Client.objects.create(name="acme", slug="acme")
+        ClientMembership.objects.create(user=self.owner, client=self.tenant, role="owner")
+        self.project = Project.objects.create(client=self.tenant, name="web", slug="web", created_by=self.owner)
+        for n in range(5):
+            task = Task.objects.create(project=self.project, title=f"task {n}", created_by=self.owner)
+            task.assignees.add(self.owner)
+        self.api = APIClient()
+        self.api.force_authenticate(self.owner)
+        self.tasks_url = f"/api/clients/{self.tenant.pk}/projects/{self.project.pk}/tasks/"
+
+    def test_negotiates_the_encoding(self):
+        self.assertEqual(choose_encoding("gzip;q=0.5, br;q=0"), "gzip")
+        self.assertIsNone(choose_encoding("identity"))
+        self.assertIsNone(choose_encoding("gzip;q=0"))
+        self.assertIn(choose_encoding("*"), ("br", "gzip"))
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.api.get(f"/api/clients/{self.tenant.pk}/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    @override_settings(STREAMED_LIST_THRESHOLD=2, STREAMED_LIST_CHUNK_SIZE=2, COMPRESSION_MIN_SIZE=0)
+    def test_long_lists_stream_as_one_compressed_array(self):
+        with override_settings(STREAMED_LIST_THRESHOLD=10):
+            response = self.api.get(self.tasks_url)
+        self.assertFalse(response.streaming)
+        expected = response.json()
+
+        response = self.api.get(self.tasks_url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(json.loads(gzip.decompress(b"".join(chunks))), expected)
+        self.assertEqual(len(expected), 5)
+
+
+class BatchTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.tenant = Client.objects.create(name="acme", slug="acme")
+        ClientMembership.objects.create(user=self.owner, client=self.tenant, role="owner")
+        self.project = Project.objects.create(client=self.tenant, name="web", slug="web", created_by=self.owner)
+        self.other = Client.objects.create(name="other", slug="other")
+        self.api = APIClient()
+        self.api.force_authenticate(self.owner)
+        self.tasks_url = f"/api/clients/{self.tenant.pk}/projects/{self.project.pk}/tasks/"
+
+    def batch(self, requests, **options):
+        response = self.api.post("/api/batch/", {"requests": requests, **options}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["responses"]
+
+    def test_runs_sub_requests_in_order_as_the_caller(self):
+        responses = self.batch([
+            {"id": "before", "path": self.tasks_url},
+            {"id": "create", "method": "POST", "path": self.tasks_url, "body": {"title": "new"}},
+            {"id": "after", "path": self.tasks_url},
+            {"id": "client", "path": f"/api/clients/{self.tenant.pk}/"},
+            {"id": "foreign", "path": f"/api/clients/{self.other.pk}/projects/"},
+            {"id": "unknown", "path": "/api/nowhere/"},
+        ], concurrent=True)
+
+        self.assertEqual([r["id"] for r in responses], ["before", "create", "after", "client", "foreign", "unknown"])
+        self.assertEqual([r["status"] for r in responses], [200, 201, 200, 200, 403, 404])
+        self.assertEqual(responses[0]["body"], [])
+        self.assertEqual([task["title"] for task in responses[2]["body"]], ["new"])
+        self.assertEqual(responses[3]["body"]["name"], "acme")
+
+    def test_shares_membership_checks(self):
+        requests = [{"path": f"/api/clients/{self.tenant.pk}/projects/"}] * 3
+        # Shard directory, client and memberships once, then the three lists; separately it would be 10.
+        with self.assertNumQueries(6):
+            self.assertEqual({r["status"] for r in self.batch(requests)}, {200})
+        with override_settings(BATCH_MAX_REQUESTS=2):
+            response = self.api.post("/api/batch/", {"requests": requests}, format="json")
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,7 @@
 
+from django.urls import path
 from rest_framework_nested import routers
-from .views import ClientViewSet, ProjectViewSet, TaskViewSet, CommentViewSet
+from .views import BatchView, ClientViewSet, ProjectViewSet, TaskViewSet, CommentViewSet
 
 router = routers.SimpleRouter()
 router.register(r'clients', ClientViewSet, basename='clients')
@@ -17,4 +18,9 @@ projects_router.register(r'tasks', TaskViewSet, basename='project-tasks')
 tasks_router = routers.NestedSimpleRouter(projects_router, r'tasks', lookup='task')
 tasks_router.register(r'comments', CommentViewSet, basename='task-comments')
 
-urlpatterns = router.urls + clients_router.urls + projects_router.urls + tasks_router.urls
+# What /api/batch/ sub-requests may call.
+router_urlpatterns = router.urls + clients_router.urls + projects_router.urls + tasks_router.urls
+
+urlpatterns = router_urlpatterns + [
+    path('batch/', BatchView.as_view(), name='batch'),
+]
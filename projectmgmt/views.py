@@ -1,11 +1,18 @@
+import uuid
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
+from rest_framework.decorators import action
+from rest_framework.views import APIView
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.shortcuts import get_object_or_404
-from django.db.models import Prefetch
-from .serializers import ClientSerializer
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
-from .models import Client, Project, Task, Comment
+from .models import Client, ClientMembership, ClientShard, Project, Task, Comment, ActivityLog
 from .serializers import (
+    ClientSummarySerializer,
     ProjectListSerializer,
     ProjectDetailSerializer,
     ProjectCreateSerializer,
@@ -13,11 +20,19 @@ from .serializers import (
     TaskDetailSerializer,
     TaskCreateSerializer,
     CommentSerializer,
-    CommentCreateSerializer
+    CommentCreateSerializer,
+    ActivityLogSerializer
 )
 from .permissions import MultiTenantPermission
+from .pagination import StandardResultsSetPagination
+from .sharding import ShardedViewMixin, lookup_shard, shard_aliases
+from .streaming import StreamedListMixin
+from .includes import IncludeMixin
+from .batch import cached, is_member, parse, run_batch
+from main.replicas import primary_alias
+from .stats import client_stats
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(ShardedViewMixin, StreamedListMixin, IncludeMixin, viewsets.ModelViewSet):
     """
     Projects ViewSet under a client:
     GET    /api/clients/{client_id}/projects/
@@ -25,26 +40,28 @@ class ProjectViewSet(viewsets.ModelViewSet):
     GET    /api/clients/{client_id}/projects/{id}/
     PUT    /api/clients/{client_id}/projects/{id}/
     DELETE /api/clients/{client_id}/projects/{id}/
+    GETs take ?include=tasks,tasks.comments,members (see projectmgmt.includes).
     """
     permission_classes = [permissions.IsAuthenticated, MultiTenantPermission]
     permission_object_attr = 'client'
+    include_model = Project
 
     def get_client(self):
         client_id = self.kwargs.get("client_pk")  # ✅ nested router key
-        client = get_object_or_404(Client, id=client_id, is_deleted=False)
+        client = cached(("client", client_id), lambda: get_object_or_404(Client, id=client_id, is_deleted=False))
         # Optional: permission check
-        if not client.memberships.filter(user=self.request.user, is_active=True).exists():
+        if not is_member(self.request.user, client):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You do not have access to this client.")
         return client
 
     def get_queryset(self):
         client = self.get_client()
-        return Project.objects.filter(client=client).select_related(
+        return self.with_includes(self.on_shard(Project.objects.filter(client=client)).select_related(
             "created_by", "updated_by", "client"
-        ).prefetch_related(
-            Prefetch("tasks")
-        )
+        ).annotate(
+            task_count=Count("tasks", filter=Q(tasks__deleted_at=None))
+        ))
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -55,9 +72,15 @@ class ProjectViewSet(viewsets.ModelViewSet):
             return ProjectCreateSerializer
         return ProjectDetailSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == "create":
+            # ProjectCreateSerializer.validate_slug needs the client before perform_create runs.
+            context['client'] = self.get_client()
+        return context
+
     def perform_create(self, serializer):
-        client = self.get_client()
-        serializer.context['client'] = client
+        client = serializer.context['client']
         serializer.save(client=client, created_by=self.request.user, updated_by=self.request.user)
 
     def perform_update(self, serializer):
@@ -68,7 +91,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
         project.delete()  # soft delete
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(ShardedViewMixin, StreamedListMixin, IncludeMixin, viewsets.ModelViewSet):
     """
     Tasks ViewSet under a project:
     GET    /api/clients/{client_id}/projects/{project_id}/tasks/
@@ -76,31 +99,35 @@ class TaskViewSet(viewsets.ModelViewSet):
     GET    /api/clients/{client_id}/projects/{project_id}/tasks/{id}/
     PUT    /api/clients/{client_id}/projects/{project_id}/tasks/{id}/
     DELETE /api/clients/{client_id}/projects/{project_id}/tasks/{id}/
+    GETs take ?include=comments (see projectmgmt.includes).
     """
     permission_classes = [permissions.IsAuthenticated, MultiTenantPermission]
     permission_object_attr = 'project'
+    include_model = Task
 
     def get_project(self):
         client_id = self.kwargs.get("client_pk")
         project_id = self.kwargs.get("project_pk")  # nested router key
-        project = get_object_or_404(
-            Project,
+        project = cached(("project", client_id, project_id), lambda: get_object_or_404(
+            Project.objects.select_related("client"),
             id=project_id,
             client_id=client_id,
             is_deleted=False
-        )
-        if not project.client.users.filter(id=self.request.user.id).exists():
+        ))
+        if not is_member(self.request.user, project.client, active=False):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You do not have access to this project.")
         return project
 
     def get_queryset(self):
         project = self.get_project()
-        return Task.objects.filter(project=project).select_related(
-            "project", "created_by", "updated_by"
+        return self.with_includes(self.on_shard(Task.objects.filter(project=project)).select_related(
+            "project__client", "created_by", "updated_by"
         ).prefetch_related(
-            "assignees", "comments"
-        )
+            "assignees"
+        ).annotate(
+            comment_count=Count("comments", filter=Q(comments__deleted_at=None))
+        ))
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -124,7 +151,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         task.delete()  # soft delete
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ShardedViewMixin, StreamedListMixin, viewsets.ModelViewSet):
     """
     Comments ViewSet under a task:
     GET    /api/client/{client_id}/project/{project_id}/tasks/{task_id}/comments/
@@ -140,21 +167,21 @@ class CommentViewSet(viewsets.ModelViewSet):
         client_id = self.kwargs.get("client_pk")
         project_id = self.kwargs.get("project_pk")
         task_id = self.kwargs.get("task_pk")  # <--- nested router key
-        task = get_object_or_404(
-            Task,
+        task = cached(("task", client_id, project_id, task_id), lambda: get_object_or_404(
+            Task.objects.select_related("project__client"),
             id=task_id,
             project_id=project_id,
             project__client_id=client_id,
             is_deleted=False
-        )
-        if not task.project.client.users.filter(id=self.request.user.id).exists():
+        ))
+        if not is_member(self.request.user, task.project.client, active=False):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You do not have access to this task.")
         return task
 
     def get_queryset(self):
         task = self.get_task()
-        return Comment.objects.filter(task=task).select_related("author")
+        return self.on_shard(Comment.objects.filter(task=task)).select_related("author", "task__project__client")
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -176,7 +203,152 @@ class CommentViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
     
 
+def _count_subquery(queryset):
+    """Correlated COUNT(*) per client, so several counts can share one query without join fan-out."""
+    counts = queryset.filter(client=OuterRef("pk")).order_by().values("client").annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
 class ClientViewSet(viewsets.ModelViewSet):
-    queryset = Client.objects.all()
-    serializer_class = ClientSerializer
-    permission_classes = [IsAuthenticated]
\ No newline at end of file
+    """
+    Clients the caller is an active member of:
+    GET    /api/clients/
+    POST   /api/clients/
+    GET    /api/clients/{id}/
+    PUT    /api/clients/{id}/          (owner/admin)
+    DELETE /api/clients/{id}/          (owner)
+    """
+    serializer_class = ClientSummarySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    # Actions that only need the client's id, not its role and counts.
+    bare_actions = ("stats", "activity")
+
+    def get_queryset(self):
+        # One query: the membership join scopes the tenant and yields the caller's role,
+        # the counts are correlated subqueries.
+        clients = Client.objects.filter(
+            memberships__user=self.request.user,
+            memberships__is_active=True,
+            memberships__deleted_at=None,
+        )
+        if self.action in self.bare_actions:
+            return clients
+        return clients.annotate(
+            role=F("memberships__role"),
+            project_count=_count_subquery(Project.objects.all()),
+            active_project_count=_count_subquery(Project.objects.filter(status="active")),
+            member_count=_count_subquery(ClientMembership.objects.filter(is_active=True)),
+        ).order_by("name", "id")
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        self.count_sharded_projects(page or [])
+        return page
+
+    def get_object(self):
+        client = super().get_object()
+        if self.action not in self.bare_actions:
+            self.count_sharded_projects([client])
+        return client
+
+    def count_sharded_projects(self, clients):
+        """The annotated project counts only see the primary; fill them in for clients living on shards."""
+        if not shard_aliases() or not clients:
+            return
+        by_id = {client.id: client for client in clients}
+        placements = ClientShard.objects.using(primary_alias()).filter(
+            client_id__in=by_id
+        ).exclude(alias=primary_alias()).values_list("client_id", "alias")
+        by_alias = {}
+        for client_id, alias in placements:
+            by_alias.setdefault(alias, []).append(client_id)
+        for alias, client_ids in by_alias.items():
+            counts = Project.objects.using(alias).filter(client_id__in=client_ids).order_by().values(
+                "client_id"
+            ).annotate(total=Count("id"), active=Count("id", filter=Q(status="active")))
+            for client_id in client_ids:
+                by_id[client_id].project_count = by_id[client_id].active_project_count = 0
+            for row in counts:
+                by_id[row["client_id"]].project_count = row["total"]
+                by_id[row["client_id"]].active_project_count = row["active"]
+
+    def perform_create(self, serializer):
+        client = serializer.save(created_by=self.request.user, updated_by=self.request.user)
+        ClientMembership.objects.create(
+            user=self.request.user, client=client, role="owner",
+            created_by=self.request.user, updated_by=self.request.user,
+        )
+        client.role, client.member_count = "owner", 1
+        client.project_count = client.active_project_count = 0
+
+    def perform_update(self, serializer):
+        if serializer.instance.role not in ("owner", "admin"):
+            raise PermissionDenied("Only owners and admins can change a client.")
+        serializer.save(updated_by=self.request.user)
+
+    def destroy(self, request, *args, **kwargs):
+        client = self.get_object()
+        if client.role != "owner":
+            raise PermissionDenied("Only owners can delete a client.")
+        client.delete()  # soft delete
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=["get"])
+    def stats(self, request, pk=None):
+        """
+        GET /api/clients/{id}/stats/
+        Task counts by status, priority, project, assignee and overdue, read from rollup tables.
+        """
+        client = self.get_object()
+        shard, _ = lookup_shard(client.id)
+        return Response(client_stats(client.id, timezone.now().date(), using=shard))
+
+    @action(detail=True, methods=["get"])
+    def activity(self, request, pk=None):
+        """
+        GET /api/clients/{id}/activity/?object_type=task&object_id=...&before=...&limit=...
+        Newest first; pass `next_before` back as `before` for the next page.
+        """
+        client = self.get_object()
+
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 50)), 200))
+            before = request.query_params.get("before")
+            before = int(before) if before else None
+        except ValueError:
+            raise ValidationError("limit and before must be integers.")
+
+        shard, _ = lookup_shard(client.id)
+        entries = ActivityLog.objects.db_manager(shard).for_client(client.id).select_related("actor")
+        object_type = request.query_params.get("object_type")
+        object_id = request.query_params.get("object_id")
+        if object_type and object_id:
+            try:
+                object_id = uuid.UUID(object_id)
+            except ValueError:
+                raise ValidationError("object_id must be a UUID.")
+            entries = entries.filter(object_type=object_type, object_id=object_id)
+
+        rows, next_before = entries.page(before=before, limit=limit)
+        return Response({
+            "results": ActivityLogSerializer(rows, many=True).data,
+            "next_before": next_before,
+        })
+
+
+class BatchView(APIView):
+    """
+    POST /api/batch/
+    {"requests": [{"id": ..., "method": "GET", "path": "/api/clients/{id}/", "body": {...}}, ...],
+     "concurrent": false}
+    Runs the sub-requests as the caller, in order, and answers with their
+    {"id", "status", "body"} in the same order; see projectmgmt.batch.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        items = parse(request.data)
+        concurrent = bool(request.data.get("concurrent", False))
+        return Response({"responses": run_batch(request, items, concurrent)})